@@ -1,18 +1,24 @@
 import os
 import json
 import re
-from typing import List, Dict, Optional
-from dotenv import load_dotenv
-from google import genai
-from google.genai import types
-from PIL import Image
-import io
+from typing import Any, Callable, List, Dict, Optional
+from google.genai import types, errors
 import time
+import gemini_client
+from frame import Frame
+from stream_json import IncrementalJSONObject
+import tracing
+import resilience
+import cancellation
+from cancellation import CancelToken, RequestCancelled
+from history import compact_history
 
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise EnvironmentError("GEMINI_API_KEY environment variable not set.")
+# History steps sent verbatim; older ones are condensed into a one-line summary
+PLANNER_HISTORY_STEPS = int(os.getenv("PLANNER_HISTORY_STEPS", "8"))
+# Cache the system instruction and user goal with Gemini context caching across a workflow's steps.
+# Off by default: the prefix is a few hundred tokens, below the API's 1024-token minimum,
+# so caching only helps once the system instruction grows
+PLANNER_CONTEXT_CACHE = os.getenv("PLANNER_CONTEXT_CACHE", "0") == "1"
 
 SYSTEM_INSTRUCTION = (
     "You are a helpful UI assistant that receives a high-level user goal, a screenshot of the user's desktop, and a list of already completed atomic UI actions, each with a status of 'success' or 'failure'. "
@@ -34,14 +40,29 @@ generate_content_config = types.GenerateContentConfig(
     system_instruction=[types.Part.from_text(text=SYSTEM_INSTRUCTION)],
 )
 
-def create_input(user_prompt: str, screenshot_path: str, history: List[Dict]) -> list:
-    image = Image.open(screenshot_path)
-    buffered = io.BytesIO()
-    image.save(buffered, format="PNG")
-    img_bytes = buffered.getvalue()
+# Most actions a plan-mode response may list after the next one
+PLAN_MAX_FOLLOWING_STEPS = 5
+
+def goal_text(user_prompt: str) -> str:
+    return f"User goal: {user_prompt}\n"
+
+def prefix_cache_config(user_prompt: str) -> types.CreateCachedContentConfig:
+    """The stable part of every planner prompt in a workflow: system instruction and goal."""
+    return types.CreateCachedContentConfig(
+        system_instruction=SYSTEM_INSTRUCTION,
+        contents=[types.Content(role="user", parts=[types.Part.from_text(text=goal_text(user_prompt))])],
+    )
+
+def create_input(user_prompt: str, frame: Frame, history: List[Dict], plan: bool = False,
+                 include_goal: bool = True) -> list:
+    """
+    The planner request contents. Without include_goal the goal is left out, because it
+    is already in the cached prefix.
+    """
+    img_bytes, mime_type = frame.for_stage("planner")
 
     if history:
-        history_str = json.dumps(history, indent=2)
+        history_str = compact_history(history, PLANNER_HISTORY_STEPS)
         history_section = f"\nCompleted atomic actions so far (in order):\n{history_str}"
     else:
         history_section = "\nNo atomic actions have been completed yet."
@@ -51,9 +72,21 @@ def create_input(user_prompt: str, screenshot_path: str, history: List[Dict]) ->
         "output ONLY a JSON object. If the task is already complete, output {\"done\": true}. "
         "Otherwise, output the next atomic UI action as {\"step\": <int>, \"action\": <str>}"
     )
+    if plan:
+        next_action_instruction = (
+            "Given the high-level user goal, the current screenshot, and the list of already completed atomic UI actions, "
+            "output ONLY a JSON object. If the task is already complete, output {\"done\": true}. "
+            "Otherwise, output the next atomic UI action and the ones expected to follow it as "
+            "{\"step\": <int>, \"action\": <str>, \"expect\": [<str>], "
+            "\"then\": [{\"step\": <int>, \"action\": <str>, \"expect\": [<str>]}]}. "
+            "'expect' lists up to 3 short texts that will be visible on screen right before that action, "
+            "such as the label of the element it acts on. "
+            f"List in 'then' at most {PLAN_MAX_FOLLOWING_STEPS} actions, and only those you can predict "
+            "without seeing the screen after the actions before them."
+        )
 
     user_full_prompt = (
-        f"User goal: {user_prompt}\n"
+        f"{goal_text(user_prompt) if include_goal else ''}"
         f"{history_section}\n"
         f"{next_action_instruction}"
     )
@@ -62,39 +95,77 @@ def create_input(user_prompt: str, screenshot_path: str, history: List[Dict]) ->
         types.Content(
             role="user",
             parts=[
-                types.Part.from_bytes(mime_type="image/png", data=img_bytes),
+                types.Part.from_bytes(mime_type=mime_type, data=img_bytes),
                 types.Part.from_text(text=user_full_prompt)
             ]
         )
     ]
     return contents
 
-def generate_next_atomic_task(user_prompt: str, screenshot_path: str, history: List[Dict]) -> Optional[Dict[str, str]]:
+def generate_next_atomic_task(user_prompt: str, frame: Frame, history: List[Dict],
+                              on_partial: Optional[Callable[[Dict], None]] = None,
+                              cancel: Optional[CancelToken] = None, plan: bool = False) -> Optional[Dict[str, Any]]:
     """
     Uses Gemini 2.5 Flash to generate the next atomic UI action given the user goal, current screenshot, and history of completed tasks.
     Returns the next atomic task as a dict, or None if the task is complete.
+    The response is streamed; on_partial is called with {"step", "action"} as soon as the
+    action string is complete, before the rest of the response has arrived.
+    If cancel is set while the response is streaming, the stream is dropped and
+    RequestCancelled is raised.
+    With plan, the task also carries 'expect' (texts visible on screen before it) and
+    'then', the list of actions expected to follow it, each with its own 'expect'.
     """
-    if not os.path.isfile(screenshot_path):
-        raise FileNotFoundError(f"Screenshot file not found: {screenshot_path}")
+    content = ""
+    partial_sent = False
+    usage = None
 
-    client = genai.Client(api_key=GEMINI_API_KEY)
-    model = "gemini-2.5-flash"
+    def stream_plan() -> IncrementalJSONObject:
+        nonlocal partial_sent, usage
+        gemini_start = time.perf_counter_ns()
+        parser = IncrementalJSONObject()
+        for chunk in gemini_client.generate_content_stream(
+            "planner",
+            contents=contents,
+            config=config,
+            cancel=cancel,
+        ):
+            cancellation.check(cancel)
+            parser.feed(chunk.text or "")
+            usage = getattr(chunk, 'usage_metadata', None) or usage
+            if on_partial and not partial_sent and isinstance(parser.fields.get("action"), str):
+                partial_sent = True
+                tracing.mark("planner.first_action", gemini_start)
+                on_partial({"step": parser.fields.get("step"), "action": parser.fields["action"]})
+        return parser
 
     try:
-        gemini_start = time.time()
-        print(f"[GEMINI TIMING] Starting Gemini API call at: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-        
-        response = client.models.generate_content(
-            model=model,
-            contents=create_input(user_prompt, screenshot_path, history),
-            config=generate_content_config,
-        )
-        
-        gemini_end = time.time()
-        gemini_time = (gemini_end - gemini_start) * 1000
-        print(f"[GEMINI TIMING] Gemini API call completed in: {gemini_time:.2f}ms")
+        cache_key = ("planner", user_prompt)
+        cache_name = None
+        if PLANNER_CONTEXT_CACHE:
+            cache_name = gemini_client.context_cache.get(cache_key, lambda: prefix_cache_config(user_prompt))
+        if cache_name is not None:
+            contents = create_input(user_prompt, frame, history, plan, include_goal=False)
+            config = generate_content_config.model_copy(update={"system_instruction": None, "cached_content": cache_name})
+        else:
+            contents = create_input(user_prompt, frame, history, plan)
+            config = generate_content_config
+        with tracing.span("planner"):
+            try:
+                parser = resilience.call_with_retries(stream_plan, cancel, "Planner", gemini_client.TRANSIENT_ERRORS)
+            except errors.ClientError as e:
+                if cache_name is None or not gemini_client.is_cache_rejection(e):
+                    raise
+                # The cache expired or was deleted early; send the full prompt instead
+                print(f"[PLANNER] Context cache {cache_name} rejected ({e}), retrying without it")
+                gemini_client.context_cache.invalidate(cache_key)
+                contents = create_input(user_prompt, frame, history, plan)
+                config = generate_content_config
+                parser = resilience.call_with_retries(stream_plan, cancel, "Planner", gemini_client.TRANSIENT_ERRORS)
+        if usage is not None and usage.prompt_token_count:
+            print(f"[PLANNER] Prompt tokens: {usage.prompt_token_count} "
+                  f"({usage.cached_content_token_count or 0} cached) with {len(history)} history steps")
         
-        content = response.text.strip()
+        content = parser.text.strip()
         try:
             task = json.loads(content)
         except Exception:
@@ -108,5 +179,7 @@ def generate_next_atomic_task(user_prompt: str, screenshot_path: str, history: L
         if "step" in task and "action" in task:
             return task
         raise ValueError("Unexpected response format: " + str(task))
+    except RequestCancelled:
+        raise
     except Exception as e:
-        raise RuntimeError(f"Failed to parse Gemini response: {e}\nRaw response: {getattr(response, 'text', str(response))}")
+        raise RuntimeError(f"Failed to parse Gemini response: {e}\nRaw response: {content}")
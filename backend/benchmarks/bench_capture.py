@@ -0,0 +1,139 @@
+"""
+Capture-to-pipeline benchmark: time from grabbed pixels to the pipeline holding a
+decoded Frame with its Omni view and fingerprint, for
+
+- png file: what happens today; the capture is PNG encoded into a temp file
+  (screencapture / nircmd / pyautogui.screenshot().save) and the pipeline decodes it
+- ring: the in-process capture; raw pixels are copied into the shared-memory frame
+  ring and read back (screen_capture.ScreenCapturer)
+- ring, attached: the same frame read through a second handle on the ring, as a
+  server process does for a frame its stdin client captured
+
+Usage (from backend/):
+    python benchmarks/bench_capture.py [--source screen|synthetic] [--runs 20]
+
+--source screen grabs the real screen (mss or PIL.ImageGrab) and also reports the
+grab itself; without a display the synthetic 1920x1080 desktop is used.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image
+from frame import Frame
+from screen_cache import ScreenFingerprint
+from screen_capture import ScreenCapturer, FrameRing, default_grabber
+from bench_frame import synthetic_screenshot
+
+
+def synthetic_grabber():
+    """Returns the synthetic desktop as BGRX pixels, like mss does for the real screen."""
+    path = os.path.join(tempfile.gettempdir(), "bench_frame_screenshot.png")
+    synthetic_screenshot(path)
+    image = Image.open(path).convert("RGB")
+    red, green, blue = image.split()
+    pixels = memoryview(Image.merge("RGBX", (blue, green, red, Image.new("L", image.size, 255))).tobytes())
+    return lambda: (image.width, image.height, "BGRX", pixels)
+
+
+def to_image(width, height, raw_mode, pixels):
+    return Image.frombuffer("RGB", (width, height), pixels, "raw", raw_mode, 0, 1)
+
+
+def pipeline_ready(frame):
+    """The first things the pipeline does with a frame: the Omni view and its fingerprint."""
+    return ScreenFingerprint.from_image(frame.stage_view("omni").image)
+
+
+def png_file_path(raw, path):
+    # The capture tool's side: encode the grabbed pixels into a PNG file
+    to_image(*raw).save(path)
+    # The backend's side: decode it
+    frame = Frame.from_path(path)
+    handoff = time.perf_counter()
+    pipeline_ready(frame)
+    return handoff
+
+
+def ring_path(raw, capturer):
+    frame = capturer.frame(capturer.ring.write(*raw))
+    handoff = time.perf_counter()
+    pipeline_ready(frame)
+    return handoff
+
+
+def attached_ring_path(raw, capturer, attached):
+    number = capturer.ring.write(*raw)
+    frame, _ = attached.read(number)
+    handoff = time.perf_counter()
+    pipeline_ready(frame)
+    return handoff
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return statistics.mean(ordered), ordered[len(ordered) // 2], ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", choices=["screen", "synthetic"], default="synthetic")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    grab = None
+    source = "synthetic"
+    if args.source == "screen":
+        try:
+            grab = default_grabber()
+            grab()
+            source = "screen"
+        except Exception as e:
+            print(f"Cannot grab the screen here ({e}); using the synthetic desktop")
+            grab = None
+    if grab is None:
+        grab = synthetic_grabber()
+
+    capturer = ScreenCapturer(grab)
+    capturer.capture()
+    attached = FrameRing(0, name=capturer.ring.name, create=False)
+    path = os.path.join(tempfile.gettempdir(), "bench_capture.png")
+
+    grab_ms = []
+    results = {"png file": ([], []), "ring": ([], []), "ring, attached": ([], [])}
+    try:
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            raw = grab()
+            grab_ms.append((time.perf_counter() - start) * 1000)
+            for name, run in (("png file", lambda: png_file_path(raw, path)),
+                              ("ring", lambda: ring_path(raw, capturer)),
+                              ("ring, attached", lambda: attached_ring_path(raw, capturer, attached))):
+                start = time.perf_counter()
+                handoff = run()
+                end = time.perf_counter()
+                results[name][0].append((handoff - start) * 1000)
+                results[name][1].append((end - start) * 1000)
+    finally:
+        attached.close()
+        capturer.close()
+        if os.path.exists(path):
+            os.remove(path)
+
+    width, height = raw[0], raw[1]
+    print(f"{source} {width}x{height}, "
+          f"{args.runs} runs; grab itself: mean {statistics.mean(grab_ms):.2f}ms")
+    print(f"{'path':<18}{'handoff mean':>14}{'p50':>9}{'p95':>9}{'to pipeline mean':>18}{'p50':>9}{'p95':>9}")
+    for name, (handoff, total) in results.items():
+        h_mean, h_p50, h_p95 = summarize(handoff)
+        t_mean, t_p50, t_p95 = summarize(total)
+        print(f"{name:<18}{h_mean:>12.2f}ms{h_p50:>7.2f}ms{h_p95:>7.2f}ms{t_mean:>16.2f}ms{t_p50:>7.2f}ms{t_p95:>7.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
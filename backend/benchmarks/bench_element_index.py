@@ -0,0 +1,119 @@
+"""
+Benchmark and sanity checks for the click hit test (element_index.ElementGrid).
+
+Checks ElementGrid.hit against a brute-force scan for the innermost element under
+random points, then times building the grid and hit-testing clicks at 100 to 20000
+elements, next to a numpy scan of all bboxes. ClickVerifier.on_click, the whole
+per-click path on pynput's thread, is timed too.
+
+Usage (from backend/):
+    python benchmarks/bench_element_index.py [--clicks 20000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np
+from element_index import ElementGrid
+from click_verifier import ClickVerifier, ArmedStep
+from element_table import ElementTable
+
+
+def synthetic_bboxes(count, rng):
+    """A few window-sized containers, then elements of log-uniform size from tiny icons to panels."""
+    boxes = [[0.0, 0.0, 1.0, 1.0], [0.0, 0.0, 1.0, 0.04], [0.1, 0.1, 0.9, 0.95]]
+    while len(boxes) < count:
+        width = 10 ** rng.uniform(-2.5, -0.7)
+        height = 10 ** rng.uniform(-2.5, -0.9)
+        x, y = rng.uniform(0, 1 - width), rng.uniform(0, 1 - height)
+        boxes.append([x, y, x + width, y + height])
+    return np.array(boxes[:count])
+
+
+def brute_force_hit(boxes, areas, x, y):
+    inside = (boxes[:, 0] <= x) & (x <= boxes[:, 2]) & (boxes[:, 1] <= y) & (y <= boxes[:, 3])
+    rows = np.flatnonzero(inside)
+    return int(rows[np.argmin(areas[rows])]) if len(rows) else None
+
+
+def check_against_brute_force(rng):
+    boxes = synthetic_bboxes(2000, rng)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    grid = ElementGrid(boxes)
+    points = [(rng.random(), rng.random()) for _ in range(5000)]
+    # Points on bbox edges and corners, where cell boundaries matter
+    points += [(float(boxes[i, 0]), float(boxes[i, 1])) for i in range(0, 2000, 7)]
+    points += [(float(boxes[i, 2]), float(boxes[i, 3])) for i in range(0, 2000, 7)]
+    points += [(1.0, 1.0), (0.0, 0.0), (1.2, 0.5), (-0.1, 0.5)]
+    mismatches = 0
+    for x, y in points:
+        got = grid.hit(x, y)
+        expected = brute_force_hit(boxes, areas, x, y) if 0 <= x <= 1 and 0 <= y <= 1 else None
+        # Ties in area can pick either element
+        if got != expected and (got is None or expected is None or areas[got] != areas[expected]):
+            mismatches += 1
+    print(f"hit() vs brute force on {len(points)} points: {mismatches} mismatches")
+    assert mismatches == 0
+
+
+def timings_us(samples_ns):
+    ordered = sorted(samples_ns)
+    return (statistics.mean(ordered) / 1000, ordered[len(ordered) // 2] / 1000,
+            ordered[int(len(ordered) * 0.99)] / 1000, ordered[-1] / 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clicks", type=int, default=20000)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    check_against_brute_force(rng)
+
+    print(f"\n{'elements':>9}{'grid':>9}{'build':>10}{'hit mean':>11}{'p50':>8}{'p99':>8}{'max':>9}"
+          f"{'numpy scan':>12}{'on_click p99':>14}{'max':>10}")
+    for count in (100, 1000, 5000, 20000):
+        boxes = synthetic_bboxes(count, rng)
+        start = time.perf_counter()
+        grid = ElementGrid(boxes)
+        build_ms = (time.perf_counter() - start) * 1000
+        clicks = [(rng.random(), rng.random()) for _ in range(args.clicks)]
+
+        hit_ns = []
+        for x, y in clicks:
+            start = time.perf_counter_ns()
+            grid.hit(x, y)
+            hit_ns.append(time.perf_counter_ns() - start)
+
+        areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        scan_ns = []
+        for x, y in clicks[:1000]:
+            start = time.perf_counter_ns()
+            brute_force_hit(boxes, areas, x, y)
+            scan_ns.append(time.perf_counter_ns() - start)
+
+        # The listener's path: normalize the click, hit-test the armed step (recording is handed off)
+        verifier = ClickVerifier(lambda message, request_id: None, screen_size=(1920, 1080))
+        verifier._armed[None] = ArmedStep(None, None, {"step": 1}, [2.0, 2.0, 2.0, 2.0], ElementTable.from_dicts([]), grid)
+        verifier._record = lambda *args: None
+        click_ns = []
+        for x, y in clicks:
+            start = time.perf_counter_ns()
+            verifier.on_click(x * 1920, y * 1080)
+            click_ns.append(time.perf_counter_ns() - start)
+        verifier.close()
+
+        mean, p50, p99, worst = timings_us(hit_ns)
+        scan_mean = timings_us(scan_ns)[0]
+        click_p99, click_max = timings_us(click_ns)[2:]
+        print(f"{count:>9}{grid.side:>6}^2 {build_ms:>7.1f}ms{mean:>9.2f}us{p50:>6.2f}us{p99:>6.2f}us{worst:>7.1f}us"
+              f"{scan_mean:>10.1f}us{click_p99:>12.2f}us{click_max:>8.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark for the Omni element string parser.
+
+Times parse_element_table against the previous regex + json.loads parser at
+50/500/5000 elements. Its handling of malformed lines is tested in
+tests/test_element_table.py.
+
+Usage (from backend/):
+    python benchmarks/bench_element_table.py
+"""
+import os
+import re
+import ast
+import sys
+import json
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from element_table import parse_element_table
+
+CONTENTS = ["Save", "Don't save", 'Say "hi"', "C:\\Users\\me", "Ünïcödé ✓", "", None, "File, Edit, View"]
+
+
+def element_line(i, rng):
+    element = {
+        'type': rng.choice(['text', 'icon']),
+        'bbox': [round(rng.random(), 6) for _ in range(4)],
+        'interactivity': rng.random() < 0.5,
+        'content': rng.choice(CONTENTS),
+        'source': rng.choice(['box_ocr_content_ocr', 'box_yolo_content_yolo']),
+    }
+    return f"icon {i}: {element}", element
+
+
+def legacy_parse(element_string):
+    """The previous parser, with its eval fallback replaced by ast.literal_eval."""
+    elements = []
+    for line in element_string.strip().split("\n"):
+        match = re.match(r"icon (\d+): (\{.*\})", line)
+        if match:
+            try:
+                elem_dict = json.loads(match.group(2).replace("'", '"'))
+            except json.JSONDecodeError:
+                elem_dict = ast.literal_eval(match.group(2))
+            elem_dict['icon'] = int(match.group(1))
+            elements.append(elem_dict)
+    return elements
+
+
+def bench(count, repeats=5):
+    rng = random.Random(count)
+    element_string = "\n".join(element_line(i, rng)[0] for i in range(count))
+    timings = {}
+    for label, parse in (("legacy", legacy_parse), ("table", parse_element_table),
+                         ("table+dicts", lambda s: parse_element_table(s).to_dicts())):
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            parse(element_string)
+            best = min(best, time.perf_counter() - start)
+        timings[label] = best * 1000
+    print(f"{count:>5} elements: legacy {timings['legacy']:8.2f}ms  table {timings['table']:8.2f}ms  "
+          f"table+dicts {timings['table+dicts']:8.2f}ms  speedup {timings['legacy'] / timings['table']:.1f}x")
+
+
+if __name__ == "__main__":
+    for count in (50, 500, 5000):
+        bench(count)
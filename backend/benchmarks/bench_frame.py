@@ -0,0 +1,106 @@
+"""
+Micro-benchmark: per-step image handling CPU time and upload bytes,
+before (disk round-trip + re-encode per stage) and after (shared Frame).
+
+Usage (from backend/):
+    python benchmarks/bench_frame.py [--screenshot path.png] [--runs 10]
+"""
+import os
+import io
+import sys
+import time
+import base64
+import random
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image, ImageDraw
+import frame as frame_module
+from frame import Frame
+
+
+def synthetic_screenshot(path):
+    """Writes a desktop-like 1920x1080 PNG with windows, buttons and text."""
+    rng = random.Random(0)
+    image = Image.new("RGB", (1920, 1080), (32, 64, 96))
+    draw = ImageDraw.Draw(image)
+    for _ in range(6):
+        x, y = rng.randint(0, 1400), rng.randint(0, 600)
+        draw.rectangle([x, y, x + 500, y + 400], fill=(240, 240, 240), outline=(0, 0, 0))
+        draw.rectangle([x, y, x + 500, y + 24], fill=(200, 210, 230))
+        for row in range(14):
+            draw.text((x + 10, y + 30 + row * 25), f"Menu item {rng.randint(0, 9999)} - settings", fill=(0, 0, 0))
+        draw.rectangle([x + 400, y + 360, x + 480, y + 390], fill=(0, 120, 215))
+    draw.rectangle([0, 1040, 1920, 1080], fill=(20, 20, 20))
+    image.save(path)
+
+
+def old_path(screenshot_path, annotated_b64):
+    """The pre-Frame per-step image handling from main.py, atomic_generator and element_selector."""
+    img = Image.open(screenshot_path)
+    width, height = img.size
+    img = img.resize((1280, int((1280 / width) * height)))
+    img.save(screenshot_path)
+    with open(screenshot_path, "rb") as image_file:
+        omni_b64 = base64.b64encode(image_file.read()).decode("utf-8")
+    # atomic_generator.create_input
+    buffered = io.BytesIO()
+    Image.open(screenshot_path).save(buffered, format="PNG")
+    planner_bytes = buffered.getvalue()
+    # element_selector.create_input
+    buffered = io.BytesIO()
+    Image.open(io.BytesIO(base64.b64decode(annotated_b64))).save(buffered, format="PNG")
+    selector_bytes = buffered.getvalue()
+    return len(omni_b64) + len(planner_bytes) + len(selector_bytes)
+
+
+def new_path(screenshot_path, annotated_b64):
+    frame = Frame.from_path(screenshot_path)
+    omni_b64 = frame.base64_for_stage("omni")
+    planner_bytes, _ = frame.for_stage("planner")
+    selector_bytes, _ = Frame.from_base64(annotated_b64).for_stage("selector")
+    return len(omni_b64) + len(planner_bytes) + len(selector_bytes)
+
+
+def measure(label, fn, source_path, annotated_b64, runs):
+    cpu_times = []
+    sent = 0
+    for _ in range(runs):
+        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
+            step_path = tmp.name
+        with open(source_path, "rb") as src, open(step_path, "wb") as dst:
+            dst.write(src.read())
+        start = time.process_time()
+        sent = fn(step_path, annotated_b64)
+        cpu_times.append((time.process_time() - start) * 1000)
+        os.remove(step_path)
+    print(f"{label:<34} cpu {statistics.mean(cpu_times):8.2f}ms/step   sent {sent / 1024:8.1f} KiB/step")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--screenshot", help="PNG screenshot to use instead of a synthetic one")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    source_path = args.screenshot
+    if not source_path:
+        source_path = os.path.join(tempfile.gettempdir(), "bench_frame_screenshot.png")
+        synthetic_screenshot(source_path)
+
+    # Stand-in for the Omni-annotated image, which comes back at the size Omni was sent
+    annotated_b64 = Frame.from_path(source_path).stage_view("omni").base64("PNG")
+
+    measure("before (disk round-trip, re-encode)", old_path, source_path, annotated_b64, args.runs)
+    measure("after  (shared Frame, PNG)", new_path, source_path, annotated_b64, args.runs)
+    for planner_encoding in [("JPEG", 85), ("WEBP", 80)]:
+        frame_module.STAGE_ENCODINGS["planner"] = planner_encoding
+        measure(f"after  (planner as {planner_encoding[0]} q{planner_encoding[1]})", new_path,
+                source_path, annotated_b64, args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark: per-call genai.Client construction vs the shared pooled client.
+
+Runs a local stub of the Gemini generateContent endpoint and issues the same
+request N times in both modes, reporting per-call latency and the number of
+TCP connections the stub had to accept.
+
+Usage (from backend/):
+    python benchmarks/bench_gemini_client.py [--calls 50]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+STUB_RESPONSE = json.dumps({
+    "candidates": [{
+        "content": {"role": "model", "parts": [{"text": "{\"step\": 1, \"action\": \"Click the 'Save' button\"}"}]},
+        "finishReason": "STOP",
+    }],
+}).encode("utf-8")
+
+
+class StubGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = set()
+
+    def setup(self):
+        super().setup()
+        StubGeminiHandler.connections.add(self.client_address)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(STUB_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(STUB_RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_calls(label, calls, make_client, config):
+    from google.genai import types
+    StubGeminiHandler.connections.clear()
+    contents = [types.Content(role="user", parts=[types.Part.from_text(text="User goal: save the file")])]
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        client = make_client()
+        client.models.generate_content(model="gemini-2.5-flash", contents=contents, config=config)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(f"{label:<22} mean {statistics.mean(timings):7.2f}ms  p50 {timings[len(timings) // 2]:7.2f}ms  "
+          f"p95 {timings[int(len(timings) * 0.95) - 1]:7.2f}ms  connections {len(StubGeminiHandler.connections)}")
+    return statistics.mean(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=50)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGeminiHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    os.environ["GEMINI_API_KEY"] = os.environ.get("GEMINI_API_KEY") or "stub-key"
+    os.environ["GEMINI_BASE_URL"] = base_url
+    import gemini_client
+    from google import genai
+    from google.genai import types
+
+    config = gemini_client.stage_config(types.GenerateContentConfig(), "planner")
+
+    def per_call_client():
+        return genai.Client(api_key="stub-key", http_options=types.HttpOptions(base_url=base_url))
+
+    per_call = run_calls("per-call client", args.calls, per_call_client, config)
+    shared = run_calls("shared pooled client", args.calls, gemini_client.get_client, config)
+    print(f"Per-call overhead removed: {per_call - shared:.2f}ms per call")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Planner prompt growth benchmark: characters of the text prompt at each step of a
+synthetic workflow, with the history sent as indented JSON (the old prompt) and
+compacted (older steps summarized, the last PLANNER_HISTORY_STEPS verbatim). A column
+without the system instruction and goal is added only if that prefix is large enough
+for Gemini context caching (CONTEXT_CACHE_MIN_TOKENS, estimated at 4 chars per token).
+
+Usage (from backend/):
+    python benchmarks/bench_history_prompt.py [--steps 40] [--failure-every 7]
+"""
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from history import compact_history
+from atomic_generator import PLANNER_HISTORY_STEPS, SYSTEM_INSTRUCTION
+from gemini_client import CONTEXT_CACHE_MIN_TOKENS
+
+# Rough chars per token for English prompt text
+CHARS_PER_TOKEN = 4
+
+GOAL = "Create a new spreadsheet, fill in the quarterly sales figures and email it to the team"
+
+
+def synthetic_history(steps, failure_every):
+    return [{"step": i + 1, "action": f"Click the 'Column {i}' header cell in the sales sheet",
+             "status": "failure" if failure_every and (i + 1) % failure_every == 0 else "success"}
+            for i in range(steps)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=40)
+    parser.add_argument("--failure-every", type=int, default=7, help="tag every Nth step a failure (0 = never)")
+    args = parser.parse_args()
+
+    history = synthetic_history(args.steps, args.failure_every)
+    prefix = len(SYSTEM_INSTRUCTION) + len(GOAL)
+    cacheable = prefix / CHARS_PER_TOKEN >= CONTEXT_CACHE_MIN_TOKENS
+    print(f"System instruction + goal: {prefix} chars, ~{prefix // CHARS_PER_TOKEN} tokens "
+          f"({'cacheable' if cacheable else f'below the {CONTEXT_CACHE_MIN_TOKENS}-token context cache minimum, sent every step'})")
+    print(f"{'step':>5}{'indented':>11}{'compacted':>11}" + (f"{'compacted, prefix cached':>26}" if cacheable else ""))
+    for step in range(0, args.steps + 1, max(args.steps // 10, 1)):
+        old = len(json.dumps(history[:step], indent=2))
+        new = len(compact_history(history[:step], PLANNER_HISTORY_STEPS))
+        print(f"{step:>5}{old + prefix:>11}{new + prefix:>11}" + (f"{new:>26}" if cacheable else ""))
+
+
+if __name__ == "__main__":
+    main()
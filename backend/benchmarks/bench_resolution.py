@@ -0,0 +1,148 @@
+"""
+Per-stage resolution benchmark: bytes uploaded, image tokens and CPU time for each
+stage's image under several resolution policies, plus the estimated upload time and
+a check that highlighted bboxes map back exactly to screenshot pixels.
+
+A setting is planner,omni,selector longest sides in pixels (0 = captured size), with
+",annotated" to send the selector Omni's annotated whole screen instead of a crop.
+"before" reproduces the old policy: everything at 1280 wide, annotated selector image.
+
+Usage (from backend/):
+    python benchmarks/bench_resolution.py [--screenshot path.png | --session sessions/x]
+        [--setting 768,1280,1280 --setting 768,640,1280 ...] [--runs 5] [--uplink-mbps 20]
+
+End-to-end latency at a setting: replay a session with the same policy, e.g.
+    FRAME_RESOLUTION_OMNI=640 python benchmarks/replay_session.py sessions/x
+"""
+import os
+import sys
+import math
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import frame as frame_module
+from frame import Frame
+from element_table import ElementTable, parse_element_table
+from element_ranker import TOP_K
+from element_selector import candidate_crop
+from bench_frame import synthetic_screenshot
+
+DEFAULT_SETTINGS = ["before", "768,1280,1280", "768,640,1280", "512,1280,1280", "768,1280,1280,annotated", "0,0,0"]
+
+# Gemini bills an image as one 258-token tile if both sides are at most 384px,
+# otherwise as 258 tokens per 768x768 tile
+GEMINI_TILE = 768
+GEMINI_TOKENS_PER_TILE = 258
+
+
+def gemini_image_tokens(size):
+    width, height = size
+    if width <= 384 and height <= 384:
+        return GEMINI_TOKENS_PER_TILE
+    return math.ceil(width / GEMINI_TILE) * math.ceil(height / GEMINI_TILE) * GEMINI_TOKENS_PER_TILE
+
+
+def synthetic_elements(count=120, seed=0):
+    """Random elements plus the TOP_K rows nearest one anchor, like a ranked menu's entries."""
+    rng = random.Random(seed)
+    elements = []
+    for icon in range(count):
+        x, y = rng.uniform(0, 0.95), rng.uniform(0, 0.97)
+        elements.append({"icon": icon, "type": "text", "bbox": [x, y, x + rng.uniform(0.02, 0.05), y + 0.02],
+                         "interactivity": True, "content": f"Item {icon}", "source": "box_ocr_content_ocr"})
+    table = ElementTable.from_dicts(elements)
+    anchor = table.bboxes[0]
+    distances = ((table.bboxes[:, 0] - anchor[0]) ** 2 + (table.bboxes[:, 1] - anchor[1]) ** 2).tolist()
+    return table, sorted(range(count), key=distances.__getitem__)[:TOP_K]
+
+
+def parse_setting(setting):
+    if setting == "before":
+        return {"planner": 1280, "omni": 1280, "selector": 1280}, False, True
+    parts = setting.split(",")
+    resolutions = dict(zip(("planner", "omni", "selector"), (int(p) for p in parts[:3])))
+    return resolutions, "annotated" not in parts[3:], False
+
+
+def run_step(source_path, table, rows, crop, before):
+    """One step's image handling under the current policy; returns {stage: (bytes, size, cpu_ms)} and the remap error."""
+    stages = {}
+    start = time.process_time()
+    frame = Frame.from_path(source_path)
+    if before:
+        frame = frame.fit(1280)
+    omni_b64 = frame.base64_for_stage("omni")
+    stages["omni"] = (len(omni_b64), frame.stage_view("omni").size, (time.process_time() - start) * 1000)
+
+    start = time.process_time()
+    planner_bytes, _ = frame.for_stage("planner")
+    stages["planner"] = (len(planner_bytes), frame.stage_view("planner").size, (time.process_time() - start) * 1000)
+
+    start = time.process_time()
+    if crop:
+        view = candidate_crop(frame, table, rows)
+    else:
+        # Stand-in for Omni's annotated image, which comes back at the size Omni was sent
+        view = Frame.from_base64(omni_b64)
+    selector_bytes, _ = view.for_stage("selector")
+    stages["selector"] = (len(selector_bytes), view.stage_view("selector").size, (time.process_time() - start) * 1000)
+
+    # The pixels of the picked element found through a scaled or cropped view must equal the direct mapping
+    mapped = view if crop else frame.stage_view("omni")
+    bbox = table.bboxes[rows[0]].tolist()
+    direct = frame.to_pixels(bbox)
+    via_view = mapped.to_pixels(mapped.from_screen(frame.to_screen(bbox)))
+    return stages, max(abs(a - b) for a, b in zip(direct, via_view))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--screenshot", help="PNG screenshot to use instead of a synthetic one")
+    parser.add_argument("--session", help="use the first step of a recorded session (screenshot and Omni elements)")
+    parser.add_argument("--setting", action="append", help="planner,omni,selector[,annotated] or 'before'")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--uplink-mbps", type=float, default=20.0, help="for the estimated upload time")
+    args = parser.parse_args()
+
+    table, rows = synthetic_elements()
+    source_path = args.screenshot
+    if args.session:
+        from session_recorder import load_session
+        step = load_session(args.session)[0]
+        source_path = step["screenshot_path"]
+        table = parse_element_table(step["omni"]["element_string"])
+        rows = list(range(min(TOP_K, len(table))))
+    if not source_path:
+        source_path = os.path.join(tempfile.gettempdir(), "bench_frame_screenshot.png")
+        synthetic_screenshot(source_path)
+    for stage in frame_module.STAGE_RESOLUTIONS:
+        os.environ.pop(f"FRAME_RESOLUTION_{stage.upper()}", None)
+
+    print(f"Screenshot {Frame.from_path(source_path).size[0]}x{Frame.from_path(source_path).size[1]}, "
+          f"{args.runs} runs per setting, upload estimated at {args.uplink_mbps:g} Mbit/s")
+    print(f"{'setting':<26}{'stage':<10}{'size':>11}{'KiB':>9}{'tokens':>8}{'cpu':>10}{'upload':>10}")
+    for setting in args.setting or DEFAULT_SETTINGS:
+        resolutions, crop, before = parse_setting(setting)
+        frame_module.STAGE_RESOLUTIONS.update(resolutions)
+        samples = [run_step(source_path, table, rows, crop, before) for _ in range(args.runs)]
+        total_bytes = 0
+        for stage in ("planner", "omni", "selector"):
+            size_bytes, size, _ = samples[-1][0][stage]
+            cpu_ms = statistics.mean(s[0][stage][2] for s in samples)
+            upload_ms = size_bytes * 8 / (args.uplink_mbps * 1e6) * 1000
+            tokens = gemini_image_tokens(size) if stage != "omni" else "-"
+            total_bytes += size_bytes
+            print(f"{setting:<26}{stage:<10}{f'{size[0]}x{size[1]}':>11}{size_bytes / 1024:>9.1f}{tokens:>8}"
+                  f"{cpu_ms:>8.1f}ms{upload_ms:>8.1f}ms")
+        print(f"{setting:<26}{'total':<10}{'':>11}{total_bytes / 1024:>9.1f}{'':>8}{'':>10}"
+              f"{total_bytes * 8 / (args.uplink_mbps * 1e6) * 1000:>8.1f}ms"
+              f"   bbox remap error {max(s[1] for s in samples):.2e}px")
+
+
+if __name__ == "__main__":
+    main()
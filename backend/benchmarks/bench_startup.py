@@ -0,0 +1,119 @@
+"""
+Startup benchmark: how long the backend takes to import, to accept its first IPC
+message, and to report ready, with the Gemini and Omni services replaced by the
+local stand-ins from fake_services.py (so no network or API key is needed).
+
+Usage (from backend/):
+    python benchmarks/bench_startup.py [--runs 5] [--gemini-ms 200] [--omni-ms 300]
+        [--real-services] [--top 12]
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, BACKEND_DIR)
+
+from fake_services import FakeGemini, FakeOmni, Latency
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_times(module, env):
+    """Runs `python -X importtime -c "import module"`; returns (total_ms, {direct import: cumulative ms})."""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        sys.exit(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    children = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        depth, name, ms = len(match.group(3)) // 2, match.group(4), int(match.group(2)) / 1000
+        # A module's own imports are listed (one level deeper) right before it
+        if depth == 1:
+            children[name] = ms
+        elif depth == 0:
+            if name == module:
+                return ms, children
+            children = {}
+    return 0.0, children
+
+
+def time_startup(env):
+    """Spawns main.py, asks for its status at once, and times the first reply and the ready message."""
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "main.py"], cwd=BACKEND_DIR, env=env, text=True,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    process.stdin.write(json.dumps({"v": 2, "action": "status", "request_id": "bench"}) + "\n")
+    process.stdin.flush()
+    first_reply_ms = ready_ms = None
+    status = None
+    try:
+        for line in process.stdout:
+            message = json.loads(line)
+            elapsed = (time.perf_counter() - start) * 1000
+            if message.get("request_id") == "bench":
+                first_reply_ms = elapsed
+            elif message.get("status") in ("ready", "degraded"):
+                ready_ms, status = elapsed, message
+            if first_reply_ms is not None and ready_ms is not None:
+                break
+    finally:
+        process.stdin.close()
+        process.kill()
+        process.wait()
+    return first_reply_ms, ready_ms, status
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--gemini-ms", type=float, default=200, help="latency of the fake Gemini warm-up call")
+    parser.add_argument("--omni-ms", type=float, default=300, help="latency of the fake Omni config fetch")
+    parser.add_argument("--real-services", action="store_true",
+                        help="warm up against the configured services instead of the local stand-ins")
+    parser.add_argument("--top", type=int, default=12, help="slowest direct imports to list")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    services = []
+    if not args.real_services:
+        gemini = FakeGemini({}, Latency(args.gemini_ms, use_recorded=False))
+        omni = FakeOmni(Latency(args.omni_ms, use_recorded=False))
+        services = [gemini, omni]
+        env.update({"GEMINI_API_KEY": "bench", "GEMINI_BASE_URL": gemini.url, "OMNI_API_URL": omni.url})
+    env.pop("RECORD_SESSION_DIR", None)
+    env.pop("TRACE_FILE", None)
+
+    try:
+        for module in ("main", "pipeline"):
+            total_ms, direct = import_times(module, env)
+            print(f"\nimport {module}: {total_ms:.1f}ms")
+            for name, ms in sorted(direct.items(), key=lambda item: -item[1])[:args.top]:
+                print(f"  {name:<32}{ms:>9.1f}ms")
+
+        first_replies, readies, statuses = [], [], {}
+        for _ in range(args.runs):
+            first_reply_ms, ready_ms, status = time_startup(env)
+            first_replies.append(first_reply_ms)
+            readies.append(ready_ms)
+            statuses[status["status"]] = statuses.get(status["status"], 0) + 1
+    finally:
+        for service in services:
+            service.close()
+
+    print(f"\nSpawn to first IPC reply over {args.runs} runs: "
+          f"mean {statistics.mean(first_replies):.1f}ms, max {max(first_replies):.1f}ms")
+    print(f"Spawn to ready/degraded message: mean {statistics.mean(readies):.1f}ms, max {max(readies):.1f}ms")
+    print(f"Statuses: {statuses}, last: {status}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Evaluates the rule-based selector fast path against recorded LLM selections.
+
+Record selections by running the backend with SELECTION_LOG_PATH=selections.jsonl;
+each line holds the planner action, the Omni element string, the icon chosen and its
+source. Set FAST_PATH_SHADOW=1 as well, so the LLM still runs when the fast path
+resolves: without it those steps are logged with source "fast_path" and cannot be
+graded, which leaves out exactly the cases the fast path handles.
+
+    FAST_PATH_SHADOW=1 SELECTION_LOG_PATH=selections.jsonl python main.py
+
+Usage (from backend/):
+    python benchmarks/eval_fast_path.py selections.jsonl [more.jsonl ...]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fast_path import evaluate, load_records
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    records = []
+    for path in sys.argv[1:]:
+        records.extend(load_records(path))
+    result = evaluate(records)
+    accuracy = f"{result['accuracy'] * 100:.1f}%" if result['accuracy'] is not None else "n/a"
+    print(f"Recorded selections: {result['records']}")
+    if result['ungraded']:
+        print(f"Fast path only:      {result['ungraded']} (not graded; record with FAST_PATH_SHADOW=1)")
+    print(f"Fast path taken:     {result['taken']} ({result['rate'] * 100:.1f}%)")
+    print(f"Agreement with LLM:  {accuracy}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""
+Local stand-ins for the Gemini API and the OmniParser Gradio app.
+
+FakeGemini serves generateContent / streamGenerateContent (and the models.get
+warm-up call) from recorded responses. FakeOmni speaks enough of the Gradio
+queue protocol (sse_v3) for gradio_client.Client.submit(api_name="/process").
+Both add configurable latency, jitter and injected failures.
+
+Each service picks its responses from the step set with set_step(); see
+replay_session.py.
+"""
+import json
+import time
+import queue
+import random
+import threading
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Optional
+from urllib.parse import urlparse, parse_qs
+
+# Characters per streamed Gemini chunk
+STREAM_CHUNK_CHARS = 24
+
+
+class Latency:
+    """
+    Latency model for a fake service: the recorded duration when one is available
+    and use_recorded is set, else base_ms; scaled by a uniform +/- jitter fraction.
+    """
+
+    def __init__(self, base_ms: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0,
+                 use_recorded: bool = True, seed: Optional[int] = None):
+        self.base_ms = base_ms
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.use_recorded = use_recorded
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay_s(self, recorded_ms: Optional[float] = None) -> float:
+        ms = recorded_ms if self.use_recorded and recorded_ms is not None else self.base_ms
+        with self._lock:
+            factor = 1 + self._random.uniform(-self.jitter, self.jitter)
+        return max(ms * factor, 0.0) / 1000
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+
+class _Service:
+    def __init__(self, handler_class, latency: Latency):
+        self.latency = latency
+        self.step: Optional[Dict] = None
+        self.requests = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        handler = type(handler_class.__name__, (handler_class,), {"service": self})
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/"
+
+    def set_step(self, step: Dict):
+        with self._lock:
+            self.step = step
+            self._reset_step()
+
+    def _reset_step(self):
+        pass
+
+    def _count(self, failed: bool):
+        with self._lock:
+            self.requests += 1
+            self.failures += failed
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service = None
+
+    def _send_json(self, status: int, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _GeminiHandler(_Handler):
+    def do_GET(self):
+        # models.get, used by the warm-up call
+        self._send_json(200, {"name": urlparse(self.path).path.split("/")[-1]})
+
+    def do_POST(self):
+        body = self._read_json()
+        path = urlparse(self.path).path
+        service = self.service
+        if path.endswith("/cachedContents"):
+            self._send_json(200, service.create_cache(body))
+            return
+        stage = service.stage_for(body)
+        recorded = service.next_response(stage)
+        time.sleep(service.latency.delay_s(recorded.get("ms")))
+        if service.latency.should_fail():
+            service._count(True)
+            self._send_json(503, {"error": {"code": 503, "message": "Injected failure", "status": "UNAVAILABLE"}})
+            return
+        service._count(False)
+        text = recorded.get("text", "")
+        usage = service.usage_for(body)
+        if path.endswith(":streamGenerateContent"):
+            self._stream(text, usage)
+        else:
+            self._send_json(200, _gemini_response(text, usage, final=True))
+
+    def _stream(self, text: str, usage: Dict):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        pieces = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)] or [""]
+        for i, piece in enumerate(pieces):
+            final = i == len(pieces) - 1
+            event = json.dumps(_gemini_response(piece, usage, final))
+            try:
+                self.wfile.write(f"data: {event}\r\n\r\n".encode("utf-8"))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                return
+        self.close_connection = True
+
+
+def _gemini_response(text: str, usage: Dict, final: bool) -> Dict:
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}}
+    if final:
+        candidate["finishReason"] = "STOP"
+    return {"candidates": [candidate], "usageMetadata": usage}
+
+
+class FakeGemini(_Service):
+    """
+    Serves the current step's recorded Gemini responses. Requests are assigned to a
+    stage by matching their system instruction against stage_markers; each stage's
+    responses are served in recorded order, repeating the last one if the pipeline
+    makes more calls than were recorded.
+    """
+
+    def __init__(self, stage_markers: Dict[str, str], latency: Latency):
+        self.stage_markers = stage_markers
+        self._served: Dict[str, int] = {}
+        self.calls: Dict[Optional[str], int] = {}
+        self._caches: Dict[str, Dict] = {}  # context cache name -> its create body
+        super().__init__(_GeminiHandler, latency)
+
+    def _reset_step(self):
+        self._served = {}
+
+    def create_cache(self, body: Dict) -> Dict:
+        """caches.create: remembers the cached prefix so later requests that use it are staged and billed as if sent."""
+        with self._lock:
+            name = f"cachedContents/fake-{len(self._caches)}"
+            self._caches[name] = body
+        return {"name": name, "model": body.get("model"), "expireTime": "2100-01-01T00:00:00Z"}
+
+    def _cached(self, body: Dict) -> Dict:
+        return self._caches.get(body.get("cachedContent") or body.get("cached_content") or "", {})
+
+    def usage_for(self, body: Dict) -> Dict:
+        cached_tokens = len(json.dumps(self._cached(body))) // 4
+        usage = {"promptTokenCount": len(json.dumps(body)) // 4 + cached_tokens}
+        if cached_tokens:
+            usage["cachedContentTokenCount"] = cached_tokens
+        return usage
+
+    def stage_for(self, body: Dict) -> Optional[str]:
+        instruction = json.dumps(body.get("systemInstruction") or body.get("system_instruction")
+                                 or self._cached(body).get("systemInstruction") or "")
+        for stage, marker in self.stage_markers.items():
+            if marker and json.dumps(marker.strip()[:80])[1:-1] in instruction:
+                return stage
+        return None
+
+    def next_response(self, stage: Optional[str]) -> Dict:
+        with self._lock:
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+            responses: List[Dict] = [r for r in (self.step or {}).get("gemini", []) if r["stage"] == stage]
+            if not responses:
+                return {"text": "{}"}
+            index = self._served.get(stage, 0)
+            self._served[stage] = index + 1
+            return responses[min(index, len(responses) - 1)]
+
+
+class _OmniHandler(_Handler):
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        path = parsed.path
+        service = self.service
+        if path == "/config":
+            self._send_json(200, service.config())
+        elif path == "/gradio_api/info":
+            self._send_json(200, service.api_info())
+        elif path.startswith("/gradio_api/heartbeat/"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+        elif path == "/gradio_api/queue/data":
+            self._stream_events(parse_qs(parsed.query).get("session_hash", [""])[0])
+        else:
+            self._send_json(404, {"detail": "Not Found"})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._read_json()
+        if path == "/gradio_api/queue/join":
+            event_id = uuid.uuid4().hex
+            self.service.submit(body.get("session_hash", ""), event_id)
+            self._send_json(200, {"event_id": event_id})
+        elif path == "/gradio_api/cancel":
+            self._send_json(200, {"success": True})
+        else:
+            self._send_json(404, {"detail": "Not Found"})
+
+    def _stream_events(self, session_hash: str):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        events = self.service.session_queue(session_hash)
+        while True:
+            try:
+                message = events.get(timeout=1.0)
+            except queue.Empty:
+                message = {"msg": "heartbeat"}
+            try:
+                self.wfile.write(f"data: {json.dumps(message)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            if message["msg"] == "close_stream":
+                self.close_connection = True
+                return
+
+
+class FakeOmni(_Service):
+    """
+    Minimal OmniParser Gradio app: a single /process endpoint that returns the current
+    step's recorded (annotated image, element string) after the configured latency.
+    """
+
+    PARAMETERS = ["image_base64_input", "box_threshold", "iou_threshold", "use_paddleocr", "imgsz"]
+
+    def __init__(self, latency: Latency):
+        self._sessions: Dict[str, queue.Queue] = {}
+        super().__init__(_OmniHandler, latency)
+
+    def session_queue(self, session_hash: str) -> queue.Queue:
+        with self._lock:
+            return self._sessions.setdefault(session_hash, queue.Queue())
+
+    def config(self) -> Dict:
+        inputs = list(range(1, len(self.PARAMETERS) + 1))
+        outputs = [len(inputs) + 1, len(inputs) + 2]
+        return {
+            "version": "5.0.0",
+            "protocol": "sse_v3",
+            "api_prefix": "/gradio_api",
+            "connect_heartbeat": False,
+            "components": [{"id": i, "type": "textbox", "props": {}} for i in inputs + outputs],
+            "dependencies": [{
+                "id": 0,
+                "api_name": "process",
+                "inputs": inputs,
+                "outputs": outputs,
+                "backend_fn": True,
+                "queue": True,
+                "types": {"generator": False, "cancel": False},
+            }],
+        }
+
+    def api_info(self) -> Dict:
+        return {
+            "named_endpoints": {"/process": {
+                "parameters": [{
+                    "parameter_name": name,
+                    "parameter_has_default": False,
+                    "parameter_default": None,
+                    "label": name,
+                    "type": {"type": "string"},
+                    "python_type": {"type": "str", "description": ""},
+                    "component": "Textbox",
+                } for name in self.PARAMETERS],
+                "returns": [{"label": "output", "type": {"type": "string"},
+                             "python_type": {"type": "str", "description": ""}, "component": "Textbox"}] * 2,
+            }},
+            "unnamed_endpoints": {},
+        }
+
+    def submit(self, session_hash: str, event_id: str):
+        step = self.step or {}
+        events = self.session_queue(session_hash)
+
+        def process():
+            omni = step.get("omni") or {}
+            time.sleep(self.latency.delay_s(omni.get("ms")))
+            if not omni or self.latency.should_fail():
+                self._count(True)
+                events.put({"msg": "process_completed", "event_id": event_id, "success": False,
+                            "output": {"error": "Injected failure"}})
+                return
+            self._count(False)
+            events.put({"msg": "process_completed", "event_id": event_id, "success": True,
+                        "output": {"data": [omni.get("annotated"), omni["element_string"]]}})
+
+        events.put({"msg": "process_starts", "event_id": event_id})
+        threading.Thread(target=process, daemon=True).start()
+
+    def close(self):
+        # End the clients' event streams, otherwise their reader threads block interpreter exit
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for events in sessions:
+            events.put({"msg": "close_stream"})
+        time.sleep(0.1)
+        super().close()
@@ -0,0 +1,188 @@
+"""
+Load test for the multi-session server (server.py): many concurrent sessions replay
+a recorded session against local stand-ins for Gemini and the Omni Gradio app, and
+the report shows throughput, latency, "busy" rejections, Omni calls saved by
+batching and how deep each pool's queue got. No network or API key is needed.
+
+All sessions run the same step at the same time (the stand-ins serve one recorded
+step at a time). By default every session sees the same screen, so their Omni
+requests are batched; --distinct-screens gives each session its own screen.
+
+Usage (from backend/):
+    python benchmarks/load_test.py sessions/export-pdf [--sessions 16] [--repeat 2]
+        [--gemini-ms 800] [--omni-ms 1500] [--jitter 0.2] [--distinct-screens]
+        [--omni-workers 4] [--planner-workers 8] [--selector-workers 8]
+        [--queue-depth 16] [--max-requests 16] [--json report.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fake_services import FakeGemini, FakeOmni, Latency
+from replay_session import percentile
+
+
+def distinct_screenshot(source_path, session_index, directory):
+    """A copy of the screenshot with a block in one corner shaded per session, so its fingerprint differs."""
+    from PIL import Image, ImageDraw
+    image = Image.open(source_path).convert("RGB")
+    width, height = image.size
+    # Grey levels 10 apart, well beyond the fingerprint's tile tolerance; a second block past 25 sessions
+    shade = (session_index % 25) * 10
+    ImageDraw.Draw(image).rectangle((0, 0, width // 16, height // 9), fill=(shade,) * 3)
+    if session_index >= 25:
+        block = (session_index // 25) * 10 % 250
+        ImageDraw.Draw(image).rectangle((width - width // 16, 0, width, height // 9), fill=(block,) * 3)
+    path = os.path.join(directory, f"session-{session_index}-{os.path.basename(source_path)}")
+    image.save(path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("session", help="directory written with RECORD_SESSION_DIR")
+    parser.add_argument("--sessions", type=int, default=16, help="concurrent sessions")
+    parser.add_argument("--repeat", type=int, default=2, help="times each session replays the recorded steps")
+    parser.add_argument("--gemini-ms", type=float, default=800)
+    parser.add_argument("--omni-ms", type=float, default=1500)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--distinct-screens", action="store_true", help="give each session its own screenshot")
+    parser.add_argument("--omni-workers", type=int)
+    parser.add_argument("--planner-workers", type=int)
+    parser.add_argument("--selector-workers", type=int)
+    parser.add_argument("--queue-depth", type=int, help="calls allowed to wait per stage pool")
+    parser.add_argument("--max-requests", type=int, help="requests the server admits at once")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    from session_recorder import load_session
+    steps = load_session(args.session)
+    if not steps:
+        sys.exit(f"No recorded steps found in {args.session}")
+
+    omni = FakeOmni(Latency(args.omni_ms, args.jitter, 0.0, False, args.seed))
+
+    # Point the backend at the stand-ins and size its pools before its modules read their configuration
+    os.environ["GEMINI_API_KEY"] = "load-test"
+    os.environ["OMNI_API_URL"] = omni.url
+    for name in ("RECORD_SESSION_DIR", "OMNI_INCREMENTAL_PARSE", "SPECULATIVE_PREFETCH", "PLANNER_PLAN_MODE",
+                 "BACKEND_SERVER_URL"):
+        os.environ.pop(name, None)
+    # Every session replays the same steps; served from the result cache they would not load the server
+    os.environ["RESULT_CACHE"] = "0"
+    for name, value in (("POOL_OMNI_WORKERS", args.omni_workers), ("POOL_PLANNER_WORKERS", args.planner_workers),
+                        ("POOL_SELECTOR_WORKERS", args.selector_workers), ("POOL_QUEUE_DEPTH", args.queue_depth),
+                        ("SERVER_MAX_REQUESTS", args.max_requests)):
+        if value is not None:
+            os.environ[name] = str(value)
+
+    import atomic_generator
+    import element_selector
+    gemini = FakeGemini(
+        {"planner": atomic_generator.SYSTEM_INSTRUCTION, "selector": element_selector.SYSTEM_INSTRUCTION},
+        Latency(args.gemini_ms, args.jitter, 0.0, False, args.seed + 1),
+    )
+    import gemini_client
+    gemini_client.GEMINI_BASE_URL = gemini.url
+    import server
+    from server_client import ServerClient
+
+    http_server = server.make_server("127.0.0.1", 0)
+    threading.Thread(target=http_server.serve_forever, name="server", daemon=True).start()
+    base_url = f"http://127.0.0.1:{http_server.server_address[1]}"
+    client = ServerClient(base_url)
+    http_server.RequestHandlerClass.backend.startup.wait_for_pipeline()
+
+    screenshots = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for step in steps:
+            screenshots[step["name"]] = [
+                distinct_screenshot(step["screenshot_path"], i, directory) if args.distinct_screens
+                else step["screenshot_path"]
+                for i in range(args.sessions)
+            ]
+
+        latencies = []
+        statuses = {}
+        lock = threading.Lock()
+
+        def run_session_step(index, step, run, first):
+            data = {"prompt": step["prompt"], "screenshot_path": screenshots[step["name"]][index],
+                    "request_id": f"load-{run}-{step['name']}-{index}"}
+            if not first:
+                data["confirm"] = "success"
+            start = time.perf_counter()
+            result = client.step(f"load-{run}-{index}", data)
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+
+        wall_start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=args.sessions, thread_name_prefix="load") as sessions:
+                for run in range(args.repeat):
+                    for number, step in enumerate(steps):
+                        gemini.set_step(step)
+                        omni.set_step(step)
+                        list(sessions.map(lambda i: run_session_step(i, step, run, number == 0), range(args.sessions)))
+            wall_s = time.perf_counter() - wall_start
+            server_status = client.status()
+        finally:
+            http_server.shutdown()
+            omni.close()
+            gemini.close()
+
+    requests = len(latencies)
+    report = {
+        "session": args.session,
+        "sessions": args.sessions,
+        "steps": len(steps),
+        "runs": args.repeat,
+        "distinct_screens": args.distinct_screens,
+        "requests": requests,
+        "wall_s": round(wall_s, 2),
+        "throughput_steps_per_s": round(requests / wall_s, 2),
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies), 1),
+            "p50": round(percentile(latencies, 50), 1),
+            "p95": round(percentile(latencies, 95), 1),
+            "max": round(max(latencies), 1),
+        },
+        "statuses": statuses,
+        "omni_calls": omni.requests,
+        "omni_batch": server_status.get("omni_batch"),
+        "gemini_calls": {str(stage): calls for stage, calls in gemini.calls.items()},
+        "pools": server_status.get("pools"),
+    }
+
+    print(f"\n{args.sessions} sessions x {len(steps)} steps x {args.repeat} runs from {args.session} "
+          f"({'distinct' if args.distinct_screens else 'shared'} screens, "
+          f"gemini {args.gemini_ms:g}ms, omni {args.omni_ms:g}ms, jitter {args.jitter})")
+    print(f"{requests} steps in {wall_s:.2f}s: {report['throughput_steps_per_s']:.2f} steps/s")
+    latency = report["latency_ms"]
+    print(f"latency per step: mean {latency['mean']:.1f}ms, p50 {latency['p50']:.1f}ms, "
+          f"p95 {latency['p95']:.1f}ms, max {latency['max']:.1f}ms")
+    print(f"statuses: {statuses}")
+    print(f"Omni calls: {omni.requests} for {requests} steps (batching: {report['omni_batch']})")
+    print(f"{'pool':<10}{'workers':>9}{'peak queue':>12}{'max queue':>11}{'completed':>11}{'rejected':>10}{'mean call':>11}")
+    for name, pool in (report["pools"] or {}).items():
+        print(f"{name:<10}{pool['workers']:>9}{pool['peak_waiting']:>12}{pool['max_queue']:>11}"
+              f"{pool['completed']:>11}{pool['rejected']:>10}{pool['mean_call_ms']:>9.1f}ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
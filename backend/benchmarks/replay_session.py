@@ -0,0 +1,165 @@
+"""
+Replays a recorded session through process_screenshot_request end to end, with
+local stand-ins for Gemini and the Omni Gradio app, and reports per-stage and
+total latency. No network or API key is needed.
+
+Record a session by running the app with RECORD_SESSION_DIR set, e.g.
+    RECORD_SESSION_DIR=sessions/export-pdf npm start
+
+Usage (from backend/):
+    python benchmarks/replay_session.py sessions/export-pdf [--repeat 5]
+        [--latency recorded|fixed] [--gemini-ms 800] [--omni-ms 1500]
+        [--jitter 0.2] [--failure-rate 0.05] [--seed 0] [--json report.json]
+        [--result-cache [--keep-cache]]
+
+--result-cache turns on the on-disk result cache (in a temporary file); with
+--keep-cache it stays warm across repeats, so later runs show the warm-cache hit rate
+and latency.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fake_services import FakeGemini, FakeOmni, Latency
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(int(p / 100 * len(ordered)), len(ordered) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("session", help="directory written with RECORD_SESSION_DIR")
+    parser.add_argument("--repeat", type=int, default=3, help="times to replay the whole session")
+    parser.add_argument("--latency", choices=["recorded", "fixed"], default="recorded",
+                        help="serve each call after its recorded duration, or after the fixed --gemini-ms/--omni-ms")
+    parser.add_argument("--gemini-ms", type=float, default=800)
+    parser.add_argument("--omni-ms", type=float, default=1500)
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform +/- fraction applied to every delay")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of calls that fail")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep-cache", action="store_true",
+                        help="keep the Omni screen cache (and the result cache) between repeats")
+    parser.add_argument("--result-cache", action="store_true", help="use the on-disk result cache")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    from session_recorder import load_session
+    steps = load_session(args.session)
+    if not steps:
+        sys.exit(f"No recorded steps found in {args.session}")
+
+    use_recorded = args.latency == "recorded"
+    omni = FakeOmni(Latency(args.omni_ms, args.jitter, args.failure_rate, use_recorded, args.seed))
+
+    # Point the backend at the stand-ins before its modules read their configuration
+    os.environ["GEMINI_API_KEY"] = "replay"
+    os.environ["OMNI_API_URL"] = omni.url
+    os.environ.pop("RECORD_SESSION_DIR", None)
+    os.environ.pop("OMNI_INCREMENTAL_PARSE", None)
+    os.environ.pop("SPECULATIVE_PREFETCH", None)
+    os.environ.pop("PLANNER_PLAN_MODE", None)
+    # Never the user's own result cache
+    cache_dir = tempfile.TemporaryDirectory()
+    os.environ["RESULT_CACHE"] = "1" if args.result_cache else "0"
+    os.environ["RESULT_CACHE_PATH"] = os.path.join(cache_dir.name, "result_cache.sqlite3")
+
+    import atomic_generator
+    import element_selector
+    gemini = FakeGemini(
+        {"planner": atomic_generator.SYSTEM_INSTRUCTION, "selector": element_selector.SYSTEM_INSTRUCTION},
+        Latency(args.gemini_ms, args.jitter, args.failure_rate, use_recorded, args.seed + 1),
+    )
+    import gemini_client
+    gemini_client.GEMINI_BASE_URL = gemini.url
+    import pipeline as backend
+    import tracing
+    from screen_cache import ScreenCache
+
+    stage_samples = {}
+    totals = []
+    run_totals = []
+    mismatches = 0
+    statuses = {}
+    try:
+        for run in range(args.repeat):
+            if not args.keep_cache:
+                backend.omni_cache = ScreenCache()
+                if backend.result_cache is not None:
+                    backend.result_cache.clear()
+            run_totals.append([])
+            for step in steps:
+                gemini.set_step(step)
+                omni.set_step(step)
+                with tracing.trace(f"replay-{run}-{step['name']}") as step_trace:
+                    result = backend.process_screenshot_request(step["screenshot_path"], step["prompt"], step["history"])
+                statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+                recorded = step.get("result") or {}
+                if result["status"] == recorded.get("status") == "success" and result["icon"] != recorded.get("icon"):
+                    mismatches += 1
+                for stage, ms in step_trace.stage_ms.items():
+                    stage_samples.setdefault(stage, []).append(ms)
+                totals.append(step_trace.stage_ms["request"])
+                run_totals[-1].append(step_trace.stage_ms["request"])
+        result_cache_stats = backend.result_cache.stats.to_dict() if backend.result_cache is not None else None
+    finally:
+        omni.close()
+        gemini.close()
+        if backend.result_cache is not None:
+            backend.result_cache.close()
+        cache_dir.cleanup()
+
+    report = {
+        "session": args.session,
+        "steps": len(steps),
+        "runs": args.repeat,
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "failure_rate": args.failure_rate,
+        "statuses": statuses,
+        "icon_mismatches": mismatches,
+        "stages": {
+            stage: {
+                "n": len(samples),
+                "mean_ms": round(statistics.mean(samples), 2),
+                "p50_ms": round(percentile(samples, 50), 2),
+                "p95_ms": round(percentile(samples, 95), 2),
+            }
+            for stage, samples in sorted(stage_samples.items())
+        },
+        "injected_failures": {"gemini": gemini.failures, "omni": omni.failures},
+        "gemini_calls": {str(stage): calls for stage, calls in gemini.calls.items()},
+        "run_mean_ms": [round(statistics.mean(samples), 2) for samples in run_totals],
+        "result_cache": result_cache_stats,
+    }
+
+    print(f"\nReplayed {len(steps)} steps x {args.repeat} runs from {args.session} "
+          f"(latency {args.latency}, jitter {args.jitter}, failure rate {args.failure_rate})")
+    print(f"{'stage':<22}{'n':>6}{'mean':>11}{'p50':>11}{'p95':>11}")
+    for stage, summary in report["stages"].items():
+        print(f"{stage:<22}{summary['n']:>6}{summary['mean_ms']:>9.1f}ms{summary['p50_ms']:>9.1f}ms{summary['p95_ms']:>9.1f}ms")
+    print(f"total per step: mean {statistics.mean(totals):.1f}ms, p95 {percentile(totals, 95):.1f}ms")
+    print(f"statuses: {statuses}, icon mismatches vs recording: {mismatches}, "
+          f"injected failures: gemini {gemini.failures}, omni {omni.failures}")
+    planner_calls = gemini.calls.get("planner", 0)
+    print(f"planner calls: {planner_calls} for {len(totals)} steps ({planner_calls / len(totals):.2f} per step), "
+          f"selector calls: {gemini.calls.get('selector', 0)}")
+    print(f"mean per step by run: {', '.join(f'{ms:.1f}ms' for ms in report['run_mean_ms'])}")
+    if result_cache_stats is not None:
+        print(f"result cache: {result_cache_stats['hits']} hits ({result_cache_stats['rejected']} rejected) "
+              f"in {result_cache_stats['lookups']} lookups, hit rate {result_cache_stats['hit_rate']:.1f}%, "
+              f"mean lookup {result_cache_stats['lookup_mean_ms']:.2f}ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import threading
+import time
+from typing import Optional
+
+
+class RequestCancelled(Exception):
+    """Raised inside a pipeline stage when its request has been cancelled or superseded."""
+
+
+class DeadlineExceeded(RequestCancelled):
+    """Raised inside a pipeline stage when its request has used up its time budget."""
+
+
+class CancelToken:
+    """
+    Shared flag that a request's pipeline stages poll between (and, where the
+    client allows it, during) their external calls.
+    A token can carry a deadline (see start_deadline), after which it behaves as
+    cancelled and raises DeadlineExceeded. A child token is cancelled with its parent
+    and shares its deadline, but can also be cancelled on its own.
+    """
+
+    # How often a child token's sleep() looks at its parent
+    PARENT_POLL_S = 0.05
+
+    def __init__(self, parent: Optional["CancelToken"] = None):
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+        self.parent = parent
+        self._deadline: Optional[float] = None  # time.monotonic() value
+        self._budget_s: Optional[float] = None
+
+    def child(self) -> "CancelToken":
+        return CancelToken(parent=self)
+
+    def start_deadline(self, seconds: float, budget_s: Optional[float] = None):
+        """
+        Gives the token a deadline `seconds` from now, unless it already has one. budget_s
+        is the whole budget that stage shares are taken of (seconds by default), for a
+        deadline carried over from another token part way through.
+        """
+        root = self._root()
+        if root._deadline is None:
+            root._budget_s = seconds if budget_s is None else budget_s
+            root._deadline = time.monotonic() + seconds
+
+    def _root(self) -> "CancelToken":
+        token = self
+        while token.parent is not None:
+            token = token.parent
+        return token
+
+    @property
+    def budget_s(self) -> Optional[float]:
+        """The whole time budget the deadline was started with, or None if there is no deadline."""
+        return self._root()._budget_s
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline, or None if there is no deadline."""
+        deadline = self._root()._deadline
+        if deadline is None:
+            return None
+        return max(deadline - time.monotonic(), 0.0)
+
+    def cancel(self, reason: str = "cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return (self._event.is_set() or self.remaining() == 0.0
+                or (self.parent is not None and self.parent.cancelled))
+
+    def check(self):
+        """Raises RequestCancelled if the request has been cancelled, DeadlineExceeded if it ran out of time."""
+        if self.parent is not None:
+            self.parent.check()
+        if self._event.is_set():
+            raise RequestCancelled(self.reason)
+        if self.remaining() == 0.0:
+            raise DeadlineExceeded(f"exceeded its {self.budget_s:.0f}s deadline")
+
+    def sleep(self, seconds: float):
+        """Sleeps like time.sleep, but wakes up and raises as soon as the request is cancelled."""
+        end = time.monotonic() + seconds
+        while True:
+            self.check()
+            left = end - time.monotonic()
+            if left <= 0:
+                return
+            remaining = self.remaining()
+            if remaining is not None:
+                left = min(left, remaining)
+            if self.parent is not None:
+                left = min(left, self.PARENT_POLL_S)
+            if self._event.wait(left):
+                self.check()
+
+
+def check(cancel: Optional[CancelToken]):
+    """check() for an optional token."""
+    if cancel is not None:
+        cancel.check()
+
+
+def sleep(seconds: float, cancel: Optional[CancelToken] = None):
+    """sleep() for an optional token."""
+    if cancel is None:
+        time.sleep(seconds)
+    else:
+        cancel.sleep(seconds)
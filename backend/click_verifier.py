@@ -0,0 +1,206 @@
+"""
+Automatic step verification from mouse clicks.
+
+Once a step is highlighted, a pynput mouse listener hit-tests every click against an
+ElementGrid of the Omni elements on that screen. A click inside the highlighted element
+tags the step a success, as the Ctrl+Shift+1 shortcut does, and every click is recorded
+with the element it landed on. pynput is optional: without it (or without a display)
+clicks are not watched and steps are confirmed by hand as before.
+"""
+import os
+import json
+import time
+import queue
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+import numpy as np
+import session_recorder
+from element_index import ElementGrid, screen_bboxes
+from element_table import ElementTable, parse_element_table
+from frame import Frame
+
+# Clicks kept in memory for stats(); recorded sessions also get every click in CLICK_LOG_FILE
+CLICK_LOG_SIZE = 200
+CLICK_LOG_FILE = "clicks.jsonl"
+
+
+class ArmedStep:
+    """A highlighted step waiting for the user's click, with the index of the screen it was found on."""
+
+    def __init__(self, request_id: Optional[str], session_id: Optional[str], task: Dict,
+                 target: List[float], table: ElementTable, grid: ElementGrid):
+        self.request_id = request_id
+        self.session_id = session_id
+        self.task = task
+        self.target = target  # highlighted bbox, normalized to the screen
+        self.table = table
+        self.grid = grid
+        self.armed_at = time.time()
+
+
+class ClickVerifier:
+    """
+    Watches mouse clicks for the armed step of each session. on_verified(message,
+    request_id) is called with a {"status": "step_verified", ...} message for the
+    request whose highlight the user clicked.
+
+    The hit test runs on pynput's listener thread, which must return quickly (Windows
+    drops slow low-level hooks); recording and notifying happen on a worker thread.
+    """
+
+    def __init__(self, on_verified: Callable[[Dict, Optional[str]], None],
+                 screen_size: Optional[Tuple[int, int]] = None):
+        self.on_verified = on_verified
+        # Size of the screen in the units pynput reports clicks in (logical points on
+        # macOS, so not necessarily the screenshot's pixels)
+        self._screen_size = screen_size
+        self._armed: Dict[Optional[str], ArmedStep] = {}
+        self._lock = threading.Lock()
+        self._listener = None
+        self._listen_failed = False
+        self._outcomes = queue.SimpleQueue()
+        threading.Thread(target=self._record_outcomes, name="click-verify", daemon=True).start()
+        self.clicks: Deque[Dict] = deque(maxlen=CLICK_LOG_SIZE)
+        self.hit_tests = 0
+        self.verified = 0
+        self._hit_ns_total = 0
+        self._hit_ns_max = 0
+
+    def arm(self, request_id: Optional[str], session_id: Optional[str], result: Dict,
+            element_string: Optional[str] = None, frame: Optional[Frame] = None):
+        """
+        Waits for a click on a successful step's highlighted element. element_string and
+        frame are the Omni elements and the frame they are normalized to; without them
+        (a prefetched step) clicks are still matched against the highlight itself.
+        """
+        if result.get("status") != "success" or not result.get("bbox"):
+            return
+        table = parse_element_table(element_string) if element_string else ElementTable.from_dicts([])
+        bboxes = screen_bboxes(table, frame) if frame is not None and len(table) else np.empty((0, 4))
+        start = time.perf_counter()
+        grid = ElementGrid(bboxes)
+        build_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._armed[session_id] = ArmedStep(request_id, session_id, result.get("task") or {},
+                                                list(result["bbox"]), table, grid)
+        print(f"[CLICK VERIFY] Watching clicks for step {(result.get('task') or {}).get('step')} "
+              f"({len(grid)} elements, {grid.side}x{grid.side} grid built in {build_ms:.2f}ms)")
+        self._start_listener(frame)
+
+    def disarm(self, session_id: Optional[str]):
+        """Stops waiting for the session's step, e.g. when a new step replaces it."""
+        with self._lock:
+            self._armed.pop(session_id, None)
+
+    def _start_listener(self, frame: Optional[Frame]):
+        if self._listener is not None or self._listen_failed:
+            return
+        if self._screen_size is None:
+            try:
+                import pyautogui
+                self._screen_size = tuple(pyautogui.size())
+            except Exception:
+                self._screen_size = frame.source_size if frame is not None else None
+        try:
+            from pynput import mouse
+            self._listener = mouse.Listener(on_click=self.on_click)
+            self._listener.daemon = True
+            self._listener.start()
+            print(f"[CLICK VERIFY] Listening for clicks on a {self._screen_size} screen")
+        except Exception as e:
+            self._listen_failed = True
+            print(f"[CLICK VERIFY] Cannot listen for clicks ({e}); confirm steps with the shortcuts")
+
+    def on_click(self, x: float, y: float, button=None, pressed: bool = True):
+        """pynput's on_click callback: hit-tests a left button press against every armed step."""
+        if not pressed or self._screen_size is None:
+            return
+        if button is not None and getattr(button, "name", "left") != "left":
+            return
+        start = time.perf_counter_ns()
+        width, height = self._screen_size
+        sx, sy = x / width, y / height
+        with self._lock:
+            armed_steps = list(self._armed.values())
+        outcomes = []
+        for armed in armed_steps:
+            target = armed.target
+            outcomes.append((armed, armed.grid.hit(sx, sy),
+                             target[0] <= sx <= target[2] and target[1] <= sy <= target[3]))
+        elapsed_ns = time.perf_counter_ns() - start
+        with self._lock:
+            self.hit_tests += 1
+            self._hit_ns_total += elapsed_ns
+            self._hit_ns_max = max(self._hit_ns_max, elapsed_ns)
+        if outcomes:
+            self._outcomes.put((outcomes, x, y, sx, sy, elapsed_ns))
+
+    def _record_outcomes(self):
+        while True:
+            item = self._outcomes.get()
+            if item is None:
+                return
+            try:
+                self._record(*item)
+            except Exception as e:
+                print(f"[CLICK VERIFY] Could not handle click: {e}")
+
+    def _record(self, outcomes, x: float, y: float, sx: float, sy: float, elapsed_ns: int):
+        for armed, row, in_target in outcomes:
+            element = armed.table.row(row) if row is not None else None
+            click = {
+                "x": x, "y": y,
+                "screen": [round(sx, 5), round(sy, 5)],
+                "step": armed.task.get("step"),
+                "icon": element["icon"] if element else None,
+                "type": element["type"] if element else None,
+                "content": element["content"] if element else None,
+                "in_target": in_target,
+                "hit_us": round(elapsed_ns / 1000, 1),
+                "at": round(time.time(), 3),
+            }
+            self.clicks.append(click)
+            self._log(click)
+            print(f"[CLICK VERIFY] Click at ({x:.0f}, {y:.0f}) on "
+                  f"{'icon ' + str(click['icon']) if element else 'no element'}"
+                  f"{', inside the highlight' if in_target else ''} ({click['hit_us']}us)")
+            if not in_target:
+                continue
+            with self._lock:
+                # Only once, and not for a step a newer one replaced meanwhile
+                if self._armed.get(armed.session_id) is not armed:
+                    continue
+                del self._armed[armed.session_id]
+                self.verified += 1
+            self.on_verified({
+                "status": "step_verified",
+                "step": armed.task.get("step"),
+                "action": armed.task.get("action"),
+                "click": click,
+            }, armed.request_id)
+
+    def _log(self, click: Dict):
+        if session_recorder.recorder is None:
+            return
+        try:
+            with open(os.path.join(session_recorder.recorder.directory, CLICK_LOG_FILE), "a", encoding="utf-8") as f:
+                f.write(json.dumps(click) + "\n")
+        except OSError as e:
+            print(f"[CLICK VERIFY] Could not record click: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "armed": len(self._armed),
+                "hit_tests": self.hit_tests,
+                "verified": self.verified,
+                "mean_hit_us": round(self._hit_ns_total / self.hit_tests / 1000, 1) if self.hit_tests else None,
+                "max_hit_us": round(self._hit_ns_max / 1000, 1),
+            }
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+        self._outcomes.put(None)
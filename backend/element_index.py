@@ -0,0 +1,72 @@
+import math
+from typing import List, Optional, Sequence
+import numpy as np
+from element_table import ElementTable
+from frame import Frame
+
+# Elements per grid cell the index is sized for; a hit test scans one cell
+ELEMENTS_PER_CELL = 2
+# Upper bound on cells per side, so a huge element list cannot blow up the build
+MAX_GRID_SIDE = 128
+
+
+def screen_bboxes(table: ElementTable, frame: Frame) -> np.ndarray:
+    """The table's bboxes (normalized to the frame Omni parsed) mapped onto the screen, as an (N, 4) array."""
+    x1, y1, x2, y2 = frame.region
+    scale = np.array([x2 - x1, y2 - y1, x2 - x1, y2 - y1])
+    return table.bboxes * scale + np.array([x1, y1, x1, y1])
+
+
+class ElementGrid:
+    """
+    Uniform grid over element bboxes (normalized to the screen) for point hit tests.
+    Each cell lists the elements overlapping it, smallest first, so hit() returns the
+    innermost element under a point after scanning a single cell.
+    """
+
+    def __init__(self, bboxes, per_cell: int = ELEMENTS_PER_CELL):
+        boxes = np.clip(np.asarray(bboxes, dtype=np.float64).reshape(-1, 4), 0.0, 1.0)
+        self.side = int(min(max(math.ceil(math.sqrt(len(boxes) / max(per_cell, 1))), 1), MAX_GRID_SIDE))
+        side = self.side
+        areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        order = np.argsort(areas, kind="stable")
+        first = np.minimum((boxes[:, :2] * side).astype(np.intp), side - 1)
+        last = np.minimum((boxes[:, 2:] * side).astype(np.intp), side - 1)
+
+        cells: List[List[int]] = [[] for _ in range(side * side)]
+        for i in order.tolist():
+            c1, r1 = first[i]
+            c2, r2 = last[i]
+            for row in range(r1, r2 + 1):
+                base = row * side
+                for col in range(c1, c2 + 1):
+                    cells[base + col].append(i)
+        self._cells = [tuple(cell) for cell in cells]
+        # Plain floats: comparing them is much cheaper than indexing numpy scalars per test
+        self._boxes = boxes.tolist()
+
+    def __len__(self) -> int:
+        return len(self._boxes)
+
+    def _cell(self, x: float, y: float) -> Sequence[int]:
+        side = self.side
+        return self._cells[min(int(y * side), side - 1) * side + min(int(x * side), side - 1)]
+
+    def hit(self, x: float, y: float) -> Optional[int]:
+        """The row of the smallest element containing the point (normalized to the screen), or None."""
+        if not (0.0 <= x <= 1.0 and 0.0 <= y <= 1.0):
+            return None
+        boxes = self._boxes
+        for i in self._cell(x, y):
+            box = boxes[i]
+            if box[0] <= x <= box[2] and box[1] <= y <= box[3]:
+                return i
+        return None
+
+    def hits(self, x: float, y: float) -> List[int]:
+        """All elements containing the point, innermost first."""
+        if not (0.0 <= x <= 1.0 and 0.0 <= y <= 1.0):
+            return []
+        boxes = self._boxes
+        return [i for i in self._cell(x, y)
+                if boxes[i][0] <= x <= boxes[i][2] and boxes[i][1] <= y <= boxes[i][3]]
@@ -0,0 +1,78 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List
+from element_table import ElementTable
+
+# Number of candidates sent to the selector LLM
+TOP_K = 15
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Words in planner actions that say nothing about which element is meant
+STOPWORDS = {
+    "a", "an", "the", "on", "in", "at", "to", "of", "for", "and", "or", "with", "from", "into",
+    "click", "double", "right", "select", "press", "open", "tap", "choose", "button", "icon",
+    "menu", "field", "option", "item", "tab", "link", "then", "this", "that", "it",
+}
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_QUOTED = re.compile(r"['\"‘’“”]([^'\"‘’“”]{1,80})['\"‘’“”]")
+
+
+def _terms(text: str) -> List[str]:
+    """Lowercased words plus their character trigrams, so partial and fuzzy matches still score."""
+    terms = []
+    for word in _WORD.findall(text.lower()):
+        if word in STOPWORDS:
+            continue
+        terms.append(word)
+        padded = f"#{word}#"
+        terms.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return terms
+
+
+def quoted_phrases(task: str) -> List[str]:
+    """Returns the quoted targets in a planner action, e.g. ["Save"] for "Click the 'Save' button"."""
+    return [p.strip().lower() for p in _QUOTED.findall(task) if p.strip()]
+
+
+def rank_elements(table: ElementTable, task: str, k: int = TOP_K) -> List[int]:
+    """
+    Scores every element against the task with BM25 over word and trigram terms of
+    its content and type, and returns the row indices of the best k, best first.
+    Elements whose content contains a quoted phrase from the task are boosted.
+    """
+    documents = [_terms(f"{content or ''} {etype or ''}") for content, etype in zip(table.contents, table.types)]
+    query = Counter(_terms(task))
+    phrases = quoted_phrases(task)
+    count = len(documents)
+    if count == 0:
+        return []
+    average_length = sum(len(d) for d in documents) / count or 1.0
+
+    document_frequency: Dict[str, int] = Counter()
+    for document in documents:
+        document_frequency.update(set(document))
+
+    scores = []
+    for row, document in enumerate(documents):
+        frequencies = Counter(document)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * len(document) / average_length)
+        score = 0.0
+        for term, query_count in query.items():
+            tf = frequencies.get(term)
+            if not tf:
+                continue
+            idf = math.log(1 + (count - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            score += query_count * idf * tf * (BM25_K1 + 1) / (tf + norm)
+        content = (table.contents[row] or "").lower()
+        if phrases and content and any(p in content for p in phrases):
+            score *= 2.0
+        if table.interactivity[row]:
+            score += 1e-3
+        scores.append(score)
+
+    order = sorted(range(count), key=lambda row: (-scores[row], int(table.icons[row])))
+    return order[:k]
@@ -2,17 +2,32 @@ import os
 import re
 import json
 from typing import Tuple, Dict, Any, List, Optional
-from dotenv import load_dotenv
-from google import genai
 from google.genai import types
-from omni_api_hf_spaces import omni_api
-from PIL import Image
-import io
-import base64
-import time
+from PIL import ImageDraw
+import gemini_client
+from gemini_client import GEMINI_API_KEY
+from frame import Frame, FULL_SCREEN
+from element_table import parse_element_table
+from stream_json import IncrementalJSONObject
+import tracing
+import resilience
+import cancellation
+from cancellation import CancelToken
+from element_ranker import rank_elements, TOP_K
+import fast_path
+from fast_path import resolve_fast_path
 
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Still call the LLM when the fast path resolves, and count how often both agree
+FAST_PATH_SHADOW = os.getenv("FAST_PATH_SHADOW", "0") == "1"
+# Optional JSONL file that selections are appended to, each tagged with the source that
+# made it (see benchmarks/eval_fast_path.py)
+SELECTION_LOG_PATH = os.getenv("SELECTION_LOG_PATH")
+
+# Send the top-K call a crop of the full-resolution screenshot around the candidates,
+# labelled with their icon numbers, instead of Omni's annotated whole screen
+SELECTOR_CROP = os.getenv("SELECTOR_CROP", "1") == "1"
+# Margin kept around the candidates in the crop, as a fraction of the screen
+SELECTOR_CROP_MARGIN = 0.03
 
 SYSTEM_INSTRUCTION = """
 You are an expert UI agent. You are given:
@@ -63,33 +78,28 @@ def parse_element_string(element_string: str) -> List[Dict[str, Any]]:
     Parses the newline-separated icon string from omni_api into a list of dicts.
     Each line is of the form: icon N: { ... }
     """
-    elements = []
-    for line in element_string.strip().split("\n"):
-        match = re.match(r"icon (\d+): (\{.*\})", line)
-        if match:
-            icon_num = int(match.group(1))
-            try:
-                elem_dict = json.loads(match.group(2).replace("'", '"'))
-            except json.JSONDecodeError:
-                # fallback: try eval (less safe, but omni_api output is trusted)
-                elem_dict = eval(match.group(2))
-            elem_dict['icon'] = icon_num
-            elements.append(elem_dict)
-    return elements
-
-def create_input(prompt: str, screenshot_base64: str):
-    image = Image.open(io.BytesIO(base64.b64decode(screenshot_base64)))
-    # image.show()
-    buffered = io.BytesIO()
-    image.save(buffered, format="PNG")
-    img_bytes = buffered.getvalue()
+    return parse_element_table(element_string).to_dicts()
+
+def compact_elements_json(elements: List[Dict[str, Any]]) -> str:
+    """Minified JSON of the fields the selector needs, with bboxes rounded to 4 decimals."""
+    rows = [{
+        'icon': e['icon'],
+        'type': e.get('type'),
+        'content': e.get('content'),
+        'interactivity': e.get('interactivity'),
+        'bbox': [round(v, 4) for v in e['bbox']],
+    } for e in elements]
+    return json.dumps(rows, separators=(',', ':'), ensure_ascii=False)
+
+def create_input(prompt: str, frame: Frame):
+    img_bytes, mime_type = frame.for_stage("selector")
 
     contents = [
         types.Content(
             role="user",
             parts=[
                 types.Part.from_bytes(
-                    mime_type="image/png",
+                    mime_type=mime_type,
                     data=img_bytes,
                 ),
                 types.Part.from_text(text=prompt)
@@ -98,45 +108,70 @@ def create_input(prompt: str, screenshot_base64: str):
     ]
     return contents
 
-def select_element_with_llm(task: str, screenshot_base64: str, elements: List[Dict[str, Any]], max_retries: int = 2) -> Optional[Dict[str, Any]]:
+def select_element_with_llm(task: str, frame: Frame, elements: List[Dict[str, Any]], max_retries: int = 2,
+                            candidates_only: bool = False, cancel: Optional[CancelToken] = None) -> Optional[Dict[str, Any]]:
     """
     Uses Gemini 2.5 Flash to select the icon and bbox for the given task from the element list.
     Now also returns a 'reason' for the choice.
     Retries if a valid selection is not made.
+    With candidates_only, the list is a pre-ranked subset and the model may reject all of it,
+    in which case None is returned without retrying.
+    Transient API errors are retried within the request's time budget, and a slow call
+    is hedged with a second one if HEDGE_SELECTOR_AFTER_S is set.
     """
     if not GEMINI_API_KEY:
         raise EnvironmentError("GEMINI_API_KEY environment variable not set.")
-    client = genai.Client(
-        api_key=GEMINI_API_KEY,
-    )
-    model = "gemini-2.5-flash"
-
-    elements_json = json.dumps(elements, indent=2)
+    elements_json = compact_elements_json(elements)
     user_prompt = (
         f"User task: {task}\n"
         f"UI elements:\n{elements_json}"
     )
+    if candidates_only:
+        user_prompt += (
+            "\nOnly the most relevant candidate elements are listed. "
+            "If none of them fits the task, output {\"icon\": null}."
+        )
+    if frame.region != FULL_SCREEN:
+        user_prompt += "\nThe screenshot shows only the part of the screen around the listed elements."
+
+    def stream_selection(token: Optional[CancelToken]):
+        # Stream the response and stop reading once the JSON object is closed
+        parser = IncrementalJSONObject()
+        usage = None
+        for chunk in gemini_client.generate_content_stream(
+            "selector",
+            contents=contents,
+            config=generate_content_config,
+            cancel=token,
+        ):
+            cancellation.check(token)
+            parser.feed(chunk.text or "")
+            usage = getattr(chunk, 'usage_metadata', None) or usage
+            if parser.complete:
+                break
+        return parser, usage
 
     for attempt in range(max_retries):
-        element_select_start = time.time()
-        print(f"[ELEMENT SELECT TIMING] Starting element selection attempt {attempt + 1} at: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+        cancellation.check(cancel)
+        contents = create_input(user_prompt, frame)
         
-        response = client.models.generate_content(
-            model=model,
-            contents=create_input(user_prompt, screenshot_base64),
-            config=generate_content_config,
-        )
+        with tracing.span("selector.attempt", attempt=attempt + 1, elements=len(elements)):
+            parser, usage = resilience.call_with_retries(
+                lambda: resilience.hedged(stream_selection, resilience.HEDGE_SELECTOR_AFTER_S, cancel, "Selector"),
+                cancel, "Selector", gemini_client.TRANSIENT_ERRORS)
         
-        element_select_end = time.time()
-        element_select_time = (element_select_end - element_select_start) * 1000
-        print(f"[ELEMENT SELECT TIMING] Element selection attempt {attempt + 1} completed in: {element_select_time:.2f}ms")
+        if usage is not None and usage.prompt_token_count:
+            print(f"[ELEMENT SELECT] Prompt tokens: {usage.prompt_token_count}")
         
-        content = response.text.strip()
+        content = parser.text.strip()
         # Try to extract the JSON object
         match = re.search(r'\{.*\}', content, re.DOTALL)
         if match:
             try:
                 result = json.loads(match.group(0))
+                if candidates_only and 'icon' in result and result['icon'] is None:
+                    print("[ELEMENT SELECT] Model rejected all candidates")
+                    return None
                 if (
                     'icon' in result and
                     'bbox' in result and isinstance(result['bbox'], list) and len(result['bbox']) == 4 and
@@ -149,24 +184,125 @@ def select_element_with_llm(task: str, screenshot_base64: str, elements: List[Di
     return None
 
 
-def llm2_action_selector(screenshot_path: str, element_string: str, task: str) -> Tuple[int, List[float], str]:
+def _row_for_icon(table, icon) -> Optional[int]:
+    try:
+        return table.index_of(int(icon))
+    except (TypeError, ValueError):
+        return None
+
+
+def candidate_crop(screen: Frame, table, rows: List[int]) -> Frame:
+    """
+    Cuts the part of the screenshot holding the given elements (plus a margin), at up to
+    the selector's resolution, and draws their boxes and icon numbers on it.
+    """
+    boxes = [screen.to_screen(bbox) for bbox in table.bboxes[rows]]
+    crop = screen.crop(screen.from_screen([
+        max(min(b[0] for b in boxes) - SELECTOR_CROP_MARGIN, 0.0),
+        max(min(b[1] for b in boxes) - SELECTOR_CROP_MARGIN, 0.0),
+        min(max(b[2] for b in boxes) + SELECTOR_CROP_MARGIN, 1.0),
+        min(max(b[3] for b in boxes) + SELECTOR_CROP_MARGIN, 1.0),
+    ])).stage_view("selector")
+    image = crop.image.convert("RGB")
+    draw = ImageDraw.Draw(image)
+    width, height = image.size
+    for icon, box in zip(table.icons[rows], boxes):
+        x1, y1, x2, y2 = crop.from_screen(box)
+        rect = (x1 * width, y1 * height, x2 * width, y2 * height)
+        draw.rectangle(rect, outline=(255, 0, 0), width=2)
+        label_box = draw.textbbox((rect[0], rect[1]), str(icon))
+        draw.rectangle(label_box, fill=(255, 0, 0))
+        draw.text((rect[0], rect[1]), str(icon), fill=(255, 255, 255))
+    return Frame(image, region=crop.region, source_size=crop.source_size)
+
+
+def _select_from_table(table, frame: Frame, task: str, cancel: Optional[CancelToken] = None,
+                       screen: Optional[Frame] = None) -> Optional[Dict[str, Any]]:
+    """Runs the top-K LLM selection with a full-list fallback and returns the LLM result."""
+    result = None
+    candidates = rank_elements(table, task, TOP_K)
+    if len(candidates) < len(table):
+        candidate_elements = table.take(candidates).to_dicts()
+        full_chars = len(json.dumps(table.to_dicts(), indent=2))
+        candidate_chars = len(compact_elements_json(candidate_elements))
+        print(f"[ELEMENT SELECT] Sending top {len(candidates)}/{len(table)} candidates: "
+              f"{candidate_chars} prompt chars vs {full_chars} for the full list "
+              f"({(1 - candidate_chars / full_chars) * 100:.1f}% smaller)")
+        view = frame
+        if screen is not None and SELECTOR_CROP:
+            view = candidate_crop(screen, table, candidates)
+            region = view.region
+            print(f"[ELEMENT SELECT] Candidates cropped to {(region[2] - region[0]) * 100:.0f}% x "
+                  f"{(region[3] - region[1]) * 100:.0f}% of the screen at {view.size[0]}x{view.size[1]}")
+        with tracing.span("selector.top_k"):
+            result = select_element_with_llm(task, view, candidate_elements, candidates_only=True, cancel=cancel)
+        if result is not None and _row_for_icon(table, result['icon']) is None:
+            result = None
+        if result is None:
+            print("[ELEMENT SELECT] No valid pick among the candidates, falling back to the full element list")
+
+    if result is None:
+        result = select_element_with_llm(task, frame, table.to_dicts(), cancel=cancel)
+    return result
+
+
+def _log_selection(task: str, element_string: str, icon, source: str):
+    """
+    Appends a selection to SELECTION_LOG_PATH for offline fast-path evaluation. source is
+    "llm" or "fast_path"; only LLM selections can grade the fast path.
+    """
+    try:
+        with open(SELECTION_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"task": task, "element_string": element_string, "icon": icon, "source": source}) + "\n")
+    except OSError as e:
+        print(f"[ELEMENT SELECT] Could not record selection: {e}")
+
+
+def llm2_action_selector(frame: Frame, element_string: str, task: str,
+                         cancel: Optional[CancelToken] = None, screen: Optional[Frame] = None) -> Tuple[int, List[float], str]:
     """
     Main entry point for LLM #2. Given a screenshot and a task, returns the icon number, bbox, and reason to interact with.
 
     Args:
-        screenshot_path (str): Path to the screenshot image.
+        frame (Frame): The Omni-annotated screenshot.
         element_string (str): Extracted element list.
         task (str): The atomic task to perform (from planner LLM).
+        cancel (CancelToken, optional): Stops the LLM calls if the request is cancelled.
+        screen (Frame, optional): The full-resolution screenshot Omni parsed; the top-K
+            call then gets a labelled crop of it around the candidates.
 
     Returns:
         Tuple[int, List[float], str]: (icon number, bbox as list of 4 floats, reason)
     """
     # Call omni_api to get element string
     # _, element_string = omni_api(screenshot_path)
-    elements = parse_element_string(element_string)
-    if not elements:
+    with tracing.span("parse"):
+        table = parse_element_table(element_string)
+    if not len(table):
         raise ValueError("No UI elements found in omni_api output.")
-    result = select_element_with_llm(task, screenshot_path, elements)
+
+    fast = resolve_fast_path(table, task)
+    fast_taken = fast is not None
+    fast_path.stats.record(fast_taken)
+    if fast_taken and not FAST_PATH_SHADOW:
+        print(f"[FAST PATH] Resolved icon {fast[0]} without LLM ({fast_path.stats.summary()})")
+        if SELECTION_LOG_PATH:
+            _log_selection(task, element_string, fast[0], "fast_path")
+        return fast[0], fast[1], fast[2]
+    if not fast_taken:
+        print(f"[FAST PATH] Deferred to LLM ({fast_path.stats.summary()})")
+
+    result = _select_from_table(table, frame, task, cancel, screen)
     if not result:
         raise RuntimeError("LLM could not select a valid element after retries.")
-    return result['icon'], result['bbox'], result['reason']
\ No newline at end of file
+
+    if fast_taken:
+        fast_path.stats.record_shadow(_row_for_icon(table, fast[0]) == _row_for_icon(table, result['icon']))
+        print(f"[FAST PATH] Shadow check: rule picked {fast[0]}, LLM picked {result['icon']} ({fast_path.stats.summary()})")
+    if SELECTION_LOG_PATH:
+        _log_selection(task, element_string, result['icon'], "llm")
+
+    # Take the bbox from the parsed list rather than the model's (rounded) echo of it
+    row = _row_for_icon(table, result['icon'])
+    bbox = table.bboxes[row].tolist() if row is not None else result['bbox']
+    return result['icon'], bbox, result['reason']
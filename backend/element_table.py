@@ -0,0 +1,144 @@
+import ast
+import re
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+
+# The layout the Omni server produces for each element, in its key order.
+# Lines that do not match are parsed with ast.literal_eval instead.
+_FAST_LINE = re.compile(
+    r"icon (\d+): \{'type': '([^'\\]*)', 'bbox': \[([^\]]*)\], 'interactivity': (True|False), "
+    r"'content': ('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|None)(?:, 'source': '([^'\\]*)')?\}\s*$"
+)
+_ICON_LINE = re.compile(r"icon (\d+): (\{.*\})\s*$")
+_KNOWN_KEYS = ('type', 'bbox', 'interactivity', 'content', 'source')
+
+
+def _content_literal(literal: str) -> Optional[str]:
+    if literal == "None":
+        return None
+    if "\\" not in literal:
+        return literal[1:-1]
+    return ast.literal_eval(literal)
+
+
+class ElementTable:
+    """
+    Columnar view of the Omni element list: bboxes in an (N, 4) float array
+    and parallel icon/type/content/interactivity/source columns.
+    Use to_dicts() where the list-of-dicts form is needed.
+    """
+
+    def __init__(self, icons: Sequence[int], bboxes, types: List[str], contents: List[Optional[str]],
+                 interactivity: Sequence[bool], sources: List[Optional[str]],
+                 extras: Optional[List[Optional[Dict[str, Any]]]] = None):
+        self.icons = np.asarray(icons, dtype=np.int32)
+        self.bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        self.types = types
+        self.contents = contents
+        self.interactivity = np.asarray(interactivity, dtype=bool)
+        self.sources = sources
+        # Keys other than the standard ones, per row (None when there are none)
+        self.extras = extras if extras is not None else [None] * len(types)
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def row(self, i: int) -> Dict[str, Any]:
+        element = {
+            'type': self.types[i],
+            'bbox': self.bboxes[i].tolist(),
+            'interactivity': bool(self.interactivity[i]),
+            'content': self.contents[i],
+        }
+        if self.sources[i] is not None:
+            element['source'] = self.sources[i]
+        if self.extras[i]:
+            element.update(self.extras[i])
+        element['icon'] = int(self.icons[i])
+        return element
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return [self.row(i) for i in range(len(self))]
+
+    def index_of(self, icon: int) -> Optional[int]:
+        """Returns the row holding the given icon number, or None."""
+        matches = np.flatnonzero(self.icons == icon)
+        return int(matches[0]) if len(matches) else None
+
+    def take(self, rows: Sequence[int]) -> "ElementTable":
+        """Returns a new table with only the given rows, in that order."""
+        rows = np.asarray(rows, dtype=np.intp)
+        return ElementTable(
+            self.icons[rows],
+            self.bboxes[rows],
+            [self.types[i] for i in rows],
+            [self.contents[i] for i in rows],
+            self.interactivity[rows],
+            [self.sources[i] for i in rows],
+            [self.extras[i] for i in rows],
+        )
+
+    @classmethod
+    def from_dicts(cls, elements: List[Dict[str, Any]]) -> "ElementTable":
+        return cls(
+            [e['icon'] for e in elements],
+            [e['bbox'] for e in elements] or np.empty((0, 4)),
+            [e.get('type') for e in elements],
+            [e.get('content') for e in elements],
+            [bool(e.get('interactivity')) for e in elements],
+            [e.get('source') for e in elements],
+            [{k: v for k, v in e.items() if k not in _KNOWN_KEYS and k != 'icon'} or None for e in elements],
+        )
+
+
+def parse_element_table(element_string: str) -> ElementTable:
+    """
+    Parses the newline-separated 'icon N: {...}' string from omni_api into an ElementTable.
+    Lines in the standard layout are split with a single regex; anything else is read with
+    ast.literal_eval. Lines that are not a valid element are skipped.
+    """
+    icons, bboxes, types, contents, interactivity, sources, extras = [], [], [], [], [], [], []
+    skipped = 0
+    for line in element_string.strip().split("\n"):
+        if not line.startswith("icon "):
+            continue
+        match = _FAST_LINE.match(line)
+        if match:
+            coords = match.group(3).split(",")
+            if len(coords) == 4:
+                try:
+                    bbox = [float(c) for c in coords]
+                    content = _content_literal(match.group(5))
+                except (ValueError, SyntaxError):
+                    bbox = None
+                if bbox is not None:
+                    icons.append(int(match.group(1)))
+                    bboxes.append(bbox)
+                    types.append(match.group(2))
+                    contents.append(content)
+                    interactivity.append(match.group(4) == "True")
+                    sources.append(match.group(6))
+                    extras.append(None)
+                    continue
+
+        match = _ICON_LINE.match(line)
+        try:
+            element = ast.literal_eval(match.group(2)) if match else None
+            bbox = [float(c) for c in element['bbox']]
+            if len(bbox) != 4:
+                raise ValueError("bbox must have 4 values")
+        except (ValueError, SyntaxError, TypeError, KeyError, MemoryError, RecursionError):
+            skipped += 1
+            continue
+        icons.append(int(match.group(1)))
+        bboxes.append(bbox)
+        types.append(element.get('type'))
+        content = element.get('content')
+        contents.append(content if content is None else str(content))
+        interactivity.append(bool(element.get('interactivity')))
+        sources.append(element.get('source'))
+        extras.append({k: v for k, v in element.items() if k not in _KNOWN_KEYS and k != 'icon'} or None)
+
+    if skipped:
+        print(f"[ELEMENT PARSE] Skipped {skipped} malformed element lines")
+    return ElementTable(icons, bboxes or np.empty((0, 4)), types, contents, interactivity, sources, extras)
@@ -0,0 +1,103 @@
+import re
+import json
+import threading
+from typing import List, Optional, Tuple
+from element_table import ElementTable
+from element_ranker import quoted_phrases
+
+# Actions that target a single element by its label; anything else goes to the LLM
+_POINTING_VERBS = re.compile(r"^\s*(click|double[- ]click|press|select|tap|open|choose|toggle|check|uncheck)\b", re.IGNORECASE)
+_NORMALIZE = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def _normalize(text: Optional[str]) -> str:
+    return _NORMALIZE.sub(" ", (text or "").lower()).strip()
+
+
+class FastPathStats:
+    """Counts how often the fast path is taken and, in shadow mode, how often it agreed with the LLM."""
+
+    def __init__(self):
+        self.taken = 0
+        self.deferred = 0
+        self.shadow_checked = 0
+        self.shadow_agreed = 0
+        self._lock = threading.Lock()
+
+    def record(self, taken: bool):
+        with self._lock:
+            if taken:
+                self.taken += 1
+            else:
+                self.deferred += 1
+
+    def record_shadow(self, agreed: bool):
+        with self._lock:
+            self.shadow_checked += 1
+            self.shadow_agreed += int(agreed)
+
+    def summary(self) -> str:
+        total = self.taken + self.deferred
+        rate = (self.taken / total * 100) if total else 0.0
+        text = f"taken={self.taken} deferred={self.deferred} rate={rate:.1f}%"
+        if self.shadow_checked:
+            text += f" accuracy={self.shadow_agreed / self.shadow_checked * 100:.1f}% ({self.shadow_agreed}/{self.shadow_checked})"
+        return text
+
+
+stats = FastPathStats()
+
+
+def resolve_fast_path(table: ElementTable, task: str) -> Optional[Tuple[int, List[float], str]]:
+    """
+    Resolves "Click the 'Save' button"-style actions without the LLM when exactly one
+    element's content is the quoted label and that element is interactive.
+    Returns (icon, bbox, reason), or None when the action or the match is not clear-cut.
+    """
+    if not _POINTING_VERBS.match(task):
+        return None
+    phrases = {_normalize(p) for p in quoted_phrases(task)}
+    phrases.discard("")
+    if len(phrases) != 1:
+        return None
+    (target,) = phrases
+
+    # Another element with the same label (e.g. an OCR'd heading) or only a partial match
+    # (e.g. "Save" in "Save As") is left to the LLM
+    exact = [row for row, content in enumerate(table.contents) if _normalize(content) == target]
+    if len(exact) != 1 or not table.interactivity[exact[0]]:
+        return None
+    row = exact[0]
+
+    reason = f"Only interactive element labelled '{table.contents[row]}' (rule-based match)"
+    return int(table.icons[row]), table.bboxes[row].tolist(), reason
+
+
+def evaluate(records: List[dict]) -> dict:
+    """
+    Replays recorded selections ({"task", "element_string", "icon", "source"}) through the
+    fast path and reports how often it would have been taken and how often it agreed with
+    the LLM. Selections the fast path made on its own (source "fast_path") have no LLM
+    answer to compare with; they are counted but not graded.
+    """
+    from element_table import parse_element_table
+    graded = [record for record in records if record.get("source", "llm") == "llm"]
+    taken = agreed = 0
+    for record in graded:
+        resolved = resolve_fast_path(parse_element_table(record["element_string"]), record["task"])
+        if resolved is None:
+            continue
+        taken += 1
+        agreed += int(resolved[0] == record["icon"])
+    return {
+        "records": len(graded),
+        "ungraded": len(records) - len(graded),
+        "taken": taken,
+        "rate": taken / len(graded) if graded else 0.0,
+        "accuracy": agreed / taken if taken else None,
+    }
+
+
+def load_records(path: str) -> List[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
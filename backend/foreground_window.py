@@ -0,0 +1,90 @@
+"""
+The foreground application window of the machine this process runs on, for cropping
+Omni's input to it (see roi). Kept apart from roi so clients can read it without
+loading Pillow and numpy.
+"""
+import os
+import sys
+from typing import Optional, Tuple
+
+Rect = Tuple[float, float, float, float]
+
+# Window classes that are desktop or shell chrome rather than application windows
+_WINDOWS_SHELL_CLASSES = {"Shell_TrayWnd", "Shell_SecondaryTrayWnd", "Progman", "WorkerW", "NotifyIconOverflowWindow"}
+
+def _set_dpi_aware():
+    # Window rects in physical pixels, the same units as the screenshot; once per process
+    if sys.platform == "win32":
+        try:
+            import ctypes
+            ctypes.windll.user32.SetProcessDPIAware()
+        except Exception as e:
+            print(f"[ROI] Could not make the process DPI aware: {e}")
+
+
+_set_dpi_aware()
+
+
+def _windows_foreground_rect() -> Optional[Rect]:
+    """The topmost visible application window not owned by the Electron app, via user32."""
+    import ctypes
+    from ctypes import wintypes
+
+    user32 = ctypes.windll.user32
+    screen_width, screen_height = user32.GetSystemMetrics(0), user32.GetSystemMetrics(1)
+    own_pid = os.getppid()
+    GW_HWNDNEXT = 2
+
+    hwnd = user32.GetForegroundWindow()
+    while hwnd:
+        pid = wintypes.DWORD()
+        user32.GetWindowThreadProcessId(hwnd, ctypes.byref(pid))
+        class_name = ctypes.create_unicode_buffer(256)
+        user32.GetClassNameW(hwnd, class_name, 256)
+        rect = wintypes.RECT()
+        if (user32.IsWindowVisible(hwnd) and not user32.IsIconic(hwnd) and pid.value != own_pid
+                and class_name.value not in _WINDOWS_SHELL_CLASSES and user32.GetWindowRect(hwnd, ctypes.byref(rect))
+                and rect.right - rect.left > 1 and rect.bottom - rect.top > 1):
+            return (rect.left / screen_width, rect.top / screen_height,
+                    rect.right / screen_width, rect.bottom / screen_height)
+        hwnd = user32.GetWindow(hwnd, GW_HWNDNEXT)
+    return None
+
+
+def _mac_foreground_rect() -> Optional[Rect]:
+    """The frontmost normal window not owned by the Electron app, via Quartz (pyobjc)."""
+    try:
+        import Quartz
+    except ImportError:
+        return None
+    display = Quartz.CGDisplayBounds(Quartz.CGMainDisplayID())
+    screen_width, screen_height = display.size.width, display.size.height
+    own_pid = os.getppid()
+    windows = Quartz.CGWindowListCopyWindowInfo(
+        Quartz.kCGWindowListOptionOnScreenOnly | Quartz.kCGWindowListExcludeDesktopElements, Quartz.kCGNullWindowID)
+    # Front to back; layer 0 holds normal application windows (the menu bar and Dock sit above it)
+    for window in windows:
+        if window.get("kCGWindowLayer") != 0 or window.get("kCGWindowOwnerPID") == own_pid:
+            continue
+        bounds = window.get("kCGWindowBounds") or {}
+        width, height = bounds.get("Width", 0), bounds.get("Height", 0)
+        if width > 1 and height > 1:
+            x, y = bounds.get("X", 0), bounds.get("Y", 0)
+            return (x / screen_width, y / screen_height, (x + width) / screen_width, (y + height) / screen_height)
+    return None
+
+
+def foreground_window_rect() -> Optional[Rect]:
+    """
+    Normalized screen rect of the foreground application window on this machine, or
+    None if unknown. Only meaningful in a process that runs on the user's screen and
+    whose parent is the Electron app (the stdin backend or its server relay).
+    """
+    try:
+        if sys.platform == "win32":
+            return _windows_foreground_rect()
+        if sys.platform == "darwin":
+            return _mac_foreground_rect()
+    except Exception as e:
+        print(f"[ROI] Could not read the foreground window: {e}")
+    return None
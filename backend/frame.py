@@ -0,0 +1,209 @@
+import io
+import os
+import math
+import base64
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+from PIL import Image
+import tracing
+
+# Encoding used for each stage's upload as (format, quality). Quality is ignored for PNG.
+# Override with e.g. FRAME_ENCODING_PLANNER=JPEG:85
+STAGE_ENCODINGS = {
+    "planner": ("PNG", None),
+    "omni": ("PNG", None),
+    "selector": ("PNG", None),
+}
+
+# Longest side, in pixels, of the image each stage receives. Screenshots are only ever
+# scaled down; 0 sends the captured resolution. Override with e.g. FRAME_RESOLUTION_PLANNER=1024
+# - planner: a coarse view is enough to plan the step, and Gemini bills images in 768px tiles
+# - omni: the detector runs at imgsz=640, but the server's OCR reads the image as sent,
+#   so it gets twice that to keep small labels legible
+# - selector: caps the candidate crop cut from the full-resolution screenshot
+STAGE_RESOLUTIONS = {
+    "planner": 768,
+    "omni": 1280,
+    "selector": 1280,
+}
+
+Rect = Tuple[float, float, float, float]  # normalized (x1, y1, x2, y2)
+FULL_SCREEN: Rect = (0.0, 0.0, 1.0, 1.0)
+
+MIME_TYPES = {
+    "PNG": "image/png",
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+}
+
+
+def stage_encoding(stage: str) -> Tuple[str, Optional[int]]:
+    """Returns the (format, quality) configured for a pipeline stage."""
+    override = os.getenv(f"FRAME_ENCODING_{stage.upper()}")
+    if override:
+        fmt, _, quality = override.partition(":")
+        return fmt.upper(), int(quality) if quality else None
+    return STAGE_ENCODINGS[stage]
+
+
+def stage_resolution(stage: str) -> int:
+    """Returns the longest side configured for a pipeline stage (0 for the captured size)."""
+    override = os.getenv(f"FRAME_RESOLUTION_{stage.upper()}")
+    if override:
+        return int(override)
+    return STAGE_RESOLUTIONS[stage]
+
+
+class Frame:
+    """
+    One decoded screenshot shared by every pipeline stage of a request.
+    Encoded forms (PNG/JPEG/WebP bytes and their base64) and scaled-down copies are
+    produced lazily and cached, so each is computed at most once per request.
+
+    A frame knows which part of the captured screen it shows (region, normalized to the
+    screen) and the screen's size in pixels, so bboxes found on a scaled or cropped frame
+    map back exactly to the screenshot with to_screen() and to_pixels().
+    """
+
+    def __init__(self, image: Optional[Image.Image] = None, encoded: Optional[bytes] = None, fmt: Optional[str] = None,
+                 region: Rect = FULL_SCREEN, source_size: Optional[Tuple[int, int]] = None):
+        self._image = image
+        self.region = region
+        self._source_size = source_size
+        self._scaled: Dict[int, "Frame"] = {}
+        self._encoded: Dict[Tuple[str, Optional[int]], bytes] = {}
+        self._base64: Dict[Tuple[str, Optional[int]], str] = {}
+        self._lock = threading.RLock()
+        self._source = encoded
+        if encoded is not None:
+            self._encoded[(fmt, None)] = encoded
+
+    @classmethod
+    def from_path(cls, path: str) -> "Frame":
+        with Image.open(path) as image:
+            image.load()
+            return cls(image)
+
+    @classmethod
+    def from_base64(cls, b64: str, region: Rect = FULL_SCREEN, source_size: Optional[Tuple[int, int]] = None) -> "Frame":
+        """Wraps an already encoded image; it is only decoded if a stage needs pixels."""
+        data = base64.b64decode(b64)
+        with Image.open(io.BytesIO(data)) as probe:
+            fmt = probe.format
+        frame = cls(encoded=data, fmt=fmt, region=region, source_size=source_size)
+        frame._base64[(fmt, None)] = b64
+        return frame
+
+    @property
+    def image(self) -> Image.Image:
+        if self._image is None:
+            with self._lock:
+                if self._image is None:
+                    image = Image.open(io.BytesIO(self._source))
+                    image.load()
+                    self._image = image
+        return self._image
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.image.size
+
+    @property
+    def source_size(self) -> Tuple[int, int]:
+        """Size in pixels of the captured screen this frame was taken from."""
+        return self._source_size or self.size
+
+    def fit(self, max_side: int) -> "Frame":
+        """
+        Returns the frame scaled down so its longest side is at most max_side, or the frame
+        itself if it already fits (or max_side is 0). The copy shows the same region.
+        """
+        width, height = self.size
+        if not max_side or max(width, height) <= max_side:
+            return self
+        scaled = self._scaled.get(max_side)
+        if scaled is None:
+            with self._lock:
+                scaled = self._scaled.get(max_side)
+                if scaled is None:
+                    scale = max_side / max(width, height)
+                    image = self.image.resize((max(round(width * scale), 1), max(round(height * scale), 1)))
+                    scaled = Frame(image, region=self.region, source_size=self.source_size)
+                    self._scaled[max_side] = scaled
+        return scaled
+
+    def stage_view(self, stage: str) -> "Frame":
+        """The frame at the resolution configured for a stage."""
+        return self.fit(stage_resolution(stage))
+
+    def crop(self, rect: Rect) -> "Frame":
+        """
+        Returns the part of the frame inside rect (normalized to this frame), cut on whole
+        pixels. The crop's region is taken from the pixels actually cut, not from rect.
+        """
+        width, height = self.size
+        box = (
+            max(math.floor(rect[0] * width), 0),
+            max(math.floor(rect[1] * height), 0),
+            min(math.ceil(rect[2] * width), width),
+            min(math.ceil(rect[3] * height), height),
+        )
+        cut = (box[0] / width, box[1] / height, box[2] / width, box[3] / height)
+        return Frame(self.image.crop(box), region=tuple(self.to_screen(cut)), source_size=self.source_size)
+
+    def to_screen(self, bbox: Sequence[float]) -> List[float]:
+        """Maps a bbox normalized to this frame onto the captured screen (still normalized)."""
+        x1, y1, x2, y2 = self.region
+        width, height = x2 - x1, y2 - y1
+        return [x1 + bbox[0] * width, y1 + bbox[1] * height, x1 + bbox[2] * width, y1 + bbox[3] * height]
+
+    def from_screen(self, bbox: Sequence[float]) -> List[float]:
+        """Inverse of to_screen: maps a screen-normalized bbox onto this frame."""
+        x1, y1, x2, y2 = self.region
+        width, height = x2 - x1, y2 - y1
+        return [(bbox[0] - x1) / width, (bbox[1] - y1) / height, (bbox[2] - x1) / width, (bbox[3] - y1) / height]
+
+    def to_pixels(self, bbox: Sequence[float]) -> List[float]:
+        """Maps a bbox normalized to this frame onto pixels of the captured screenshot."""
+        screen_width, screen_height = self.source_size
+        x1, y1, x2, y2 = self.to_screen(bbox)
+        return [x1 * screen_width, y1 * screen_height, x2 * screen_width, y2 * screen_height]
+
+    def encode(self, fmt: str = "PNG", quality: Optional[int] = None) -> bytes:
+        """Returns the frame encoded as fmt, encoding it on first use."""
+        key = (fmt, None if fmt == "PNG" else quality)
+        data = self._encoded.get(key)
+        if data is None:
+            with self._lock:
+                data = self._encoded.get(key)
+                if data is None:
+                    with tracing.span("encode", fmt=fmt):
+                        image = self.image
+                        if fmt == "JPEG" and image.mode != "RGB":
+                            image = image.convert("RGB")
+                        buffered = io.BytesIO()
+                        if key[1] is None:
+                            image.save(buffered, format=fmt)
+                        else:
+                            image.save(buffered, format=fmt, quality=key[1])
+                        data = buffered.getvalue()
+                    self._encoded[key] = data
+        return data
+
+    def base64(self, fmt: str = "PNG", quality: Optional[int] = None) -> str:
+        """Returns the base64 text of the frame encoded as fmt."""
+        key = (fmt, None if fmt == "PNG" else quality)
+        b64 = self._base64.get(key)
+        if b64 is None:
+            b64 = base64.b64encode(self.encode(fmt, quality)).decode("utf-8")
+            self._base64[key] = b64
+        return b64
+
+    def for_stage(self, stage: str) -> Tuple[bytes, str]:
+        """Returns (encoded bytes, mime type) for a stage's configured resolution and encoding."""
+        fmt, quality = stage_encoding(stage)
+        return self.stage_view(stage).encode(fmt, quality), MIME_TYPES[fmt]
+
+    def base64_for_stage(self, stage: str) -> str:
+        fmt, quality = stage_encoding(stage)
+        return self.stage_view(stage).base64(fmt, quality)
@@ -0,0 +1,202 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional
+import httpx
+from dotenv import load_dotenv
+from google import genai
+from google.genai import types, errors
+import session_recorder
+import resilience
+from cancellation import CancelToken
+
+load_dotenv()
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Optional override, used to point the backend at a local stub server
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
+
+MODEL = "gemini-2.5-flash"
+
+# Per-stage request timeouts in milliseconds
+STAGE_TIMEOUTS_MS = {
+    "planner": 30000,
+    "selector": 20000,
+    "warmup": 10000,
+}
+
+# Steps are several seconds apart while the user acts on the highlight, so keep
+# idle connections around much longer than httpx's 5s default
+CONNECTION_LIMITS = httpx.Limits(
+    max_connections=10,
+    max_keepalive_connections=10,
+    keepalive_expiry=300,
+)
+
+# Errors worth retrying: 5xx responses and connection problems or timeouts
+TRANSIENT_ERRORS = (errors.ServerError, httpx.TransportError)
+
+# Lifetime of an explicit context cache; a new one is created shortly before it expires
+CONTEXT_CACHE_TTL_S = 900
+# Smallest prefix gemini-2.5-flash accepts for explicit caching
+CONTEXT_CACHE_MIN_TOKENS = 1024
+# Cache entries kept per process; the least recently used is dropped beyond this
+CONTEXT_CACHE_MAX_ENTRIES = 32
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> genai.Client:
+    """
+    Returns the shared Gemini client, creating it on first use.
+    The client keeps a pooled HTTP connection that is reused across steps and stages.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if not GEMINI_API_KEY:
+                    raise EnvironmentError("GEMINI_API_KEY environment variable not set.")
+                _client = genai.Client(
+                    api_key=GEMINI_API_KEY,
+                    http_options=types.HttpOptions(
+                        base_url=GEMINI_BASE_URL,
+                        client_args={"limits": CONNECTION_LIMITS},
+                    ),
+                )
+    return _client
+
+
+def stage_config(config: types.GenerateContentConfig, stage: str,
+                 cancel: Optional[CancelToken] = None) -> types.GenerateContentConfig:
+    """
+    Returns a copy of config with the request timeout for the given stage, shortened
+    to the stage's share of the request's remaining time budget if cancel has a deadline.
+    """
+    timeout_s = resilience.stage_timeout(cancel, stage, STAGE_TIMEOUTS_MS[stage] / 1000)
+    return config.model_copy(update={
+        "http_options": types.HttpOptions(timeout=int(timeout_s * 1000)),
+    })
+
+
+def generate_content(stage: str, contents, config: types.GenerateContentConfig, model: Optional[str] = None,
+                     cancel: Optional[CancelToken] = None):
+    """Runs generate_content on the shared client with the stage's timeout."""
+    start = time.time()
+    response = get_client().models.generate_content(
+        model=model or MODEL,
+        contents=contents,
+        config=stage_config(config, stage, cancel),
+    )
+    session_recorder.record_response(stage, response, (time.time() - start) * 1000)
+    return response
+
+
+def generate_content_stream(stage: str, contents, config: types.GenerateContentConfig, model: Optional[str] = None,
+                            cancel: Optional[CancelToken] = None):
+    """Streaming variant of generate_content; yields response chunks as they arrive."""
+    return session_recorder.record_stream(stage, get_client().models.generate_content_stream(
+        model=model or MODEL,
+        contents=contents,
+        config=stage_config(config, stage, cancel),
+    ))
+
+
+class ContextCache:
+    """
+    Gemini cached contents for stable prompt prefixes (system instruction and user goal),
+    keyed by the caller. The first request for a key starts creating the cache in the
+    background and goes out uncached; later ones get the cache name once it exists.
+    A prefix below CONTEXT_CACHE_MIN_TOKENS, or one the API refuses to cache, is not
+    retried until the TTL has passed. At most max_entries keys are kept.
+    """
+
+    def __init__(self, ttl_s: float = CONTEXT_CACHE_TTL_S, max_entries: int = CONTEXT_CACHE_MAX_ENTRIES):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, make_config: Callable[[], types.CreateCachedContentConfig]) -> Optional[str]:
+        """Returns the cache name for key, or None (starting its creation) if there is none yet."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["state"] != "creating" and entry["expires"] <= now:
+                entry = None
+            if entry is None:
+                self._entries[key] = {"state": "creating"}
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                threading.Thread(target=self._create, args=(key, make_config), daemon=True).start()
+                return None
+            self._entries.move_to_end(key)
+            if entry["state"] != "ready":
+                return None
+            return entry["name"]
+
+    def _create(self, key: Hashable, make_config: Callable[[], types.CreateCachedContentConfig]):
+        start = time.time()
+        try:
+            config = make_config().model_copy(update={"ttl": f"{int(self.ttl_s)}s"})
+            tokens = self._prefix_tokens(config)
+            if tokens < CONTEXT_CACHE_MIN_TOKENS:
+                raise ValueError(f"prefix is {tokens} tokens, below the {CONTEXT_CACHE_MIN_TOKENS}-token minimum")
+            cache = get_client().caches.create(model=MODEL, config=config)
+        except Exception as e:
+            print(f"[GEMINI CACHE] Not caching this prefix: {e}")
+            self._set(key, {"state": "failed", "expires": time.monotonic() + self.ttl_s})
+            return
+        print(f"[GEMINI CACHE] Created {cache.name} ({tokens} tokens) in {(time.time() - start) * 1000:.2f}ms")
+        # Stop handing out the name a little before the server drops the cache
+        self._set(key, {"state": "ready", "name": cache.name, "expires": time.monotonic() + self.ttl_s * 0.9})
+
+    @staticmethod
+    def _prefix_tokens(config: types.CreateCachedContentConfig) -> int:
+        """Tokens in the prefix; count_tokens takes no system instruction, so it is counted as a text part."""
+        contents = list(config.contents or [])
+        if config.system_instruction:
+            contents.insert(0, types.Content(role="user", parts=[types.Part.from_text(text=str(config.system_instruction))]))
+        return get_client().models.count_tokens(model=MODEL, contents=contents).total_tokens or 0
+
+    def _set(self, key: Hashable, entry: Dict):
+        with self._lock:
+            # Evicted or invalidated while it was being created
+            if key in self._entries:
+                self._entries[key] = entry
+
+    def invalidate(self, key: Hashable):
+        """Forgets a cache the API no longer accepts; the next get() creates a new one."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+def is_cache_rejection(error: errors.ClientError) -> bool:
+    """Whether a request failed because its cached content is gone or invalid, not e.g. a 429."""
+    return error.code == 404 or (error.code == 400 and "cache" in str(error).lower())
+
+
+context_cache = ContextCache()
+
+
+def warm_up() -> bool:
+    """
+    Creates the shared client and opens its connection with a cheap metadata call,
+    so the first real step does not pay for client setup and the TLS handshake.
+    Returns True if the warm-up call succeeded.
+    """
+    warmup_start = time.time()
+    try:
+        get_client().models.get(
+            model=MODEL,
+            config=types.GetModelConfig(
+                http_options=types.HttpOptions(timeout=STAGE_TIMEOUTS_MS["warmup"]),
+            ),
+        )
+    except Exception as e:
+        print(f"[GEMINI WARMUP] Warm-up failed after {(time.time() - warmup_start) * 1000:.2f}ms: {e}")
+        return False
+    print(f"[GEMINI WARMUP] Client warmed up in: {(time.time() - warmup_start) * 1000:.2f}ms")
+    return True
@@ -0,0 +1,47 @@
+import json
+from typing import Dict, List
+
+# Longest summary of the steps that are not sent verbatim; the oldest actions are dropped first
+HISTORY_SUMMARY_MAX_CHARS = 600
+# Longest action text quoted in the summary
+SUMMARY_ACTION_CHARS = 60
+
+
+def tag_history(history, success):
+    """Tag the last step in history with success or failure."""
+    if history:
+        history[-1]['status'] = 'success' if success else 'failure'
+    return history
+
+
+def _short(action) -> str:
+    action = str(action or "")
+    return action if len(action) <= SUMMARY_ACTION_CHARS else action[:SUMMARY_ACTION_CHARS - 3] + "..."
+
+
+def summarize_history(history: List[Dict]) -> str:
+    """One line for a run of older steps: counts, then the actions that succeeded and failed."""
+    failed = [entry for entry in history if entry.get('status') == 'failure']
+    header = (f"Earlier steps {history[0].get('step')}-{history[-1].get('step')}: "
+              f"{len(history) - len(failed)} succeeded, {len(failed)} failed.")
+    failed_part = f" Failed: {'; '.join(_short(e.get('action')) for e in failed)}." if failed else ""
+    done = [_short(e.get('action')) for e in history if e.get('status') != 'failure']
+    budget = HISTORY_SUMMARY_MAX_CHARS - len(header) - len(failed_part)
+    while done and len("; ".join(done)) + 12 > budget:
+        done.pop(0)
+    dropped = len(history) - len(failed) - len(done)
+    done_part = f" Done: {'... ' if dropped else ''}{'; '.join(done)}." if done else ""
+    return (header + done_part + failed_part)[:HISTORY_SUMMARY_MAX_CHARS]
+
+
+def compact_history(history: List[Dict], keep_last: int) -> str:
+    """
+    The history for a prompt: a summary of all but the last keep_last steps, then those
+    steps verbatim as minified JSON. Its length stays bounded however long the workflow.
+    """
+    recent = history[-keep_last:] if keep_last > 0 else []
+    older = history[:len(history) - len(recent)]
+    recent_json = json.dumps(recent, separators=(',', ':'), ensure_ascii=False)
+    if not older:
+        return recent_json
+    return f"{summarize_history(older)}\n{recent_json}"
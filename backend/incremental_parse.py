@@ -0,0 +1,191 @@
+import io
+import base64
+import time
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from PIL import Image, ImageDraw
+from screen_cache import ScreenFingerprint, TILE_TOLERANCE
+from frame import Frame
+from element_selector import parse_element_string
+
+# Fall back to a full-frame parse when more than this fraction of the screen changed
+MAX_DIRTY_AREA = 0.5
+# Fall back to a full-frame parse when the changes are spread over more regions than this
+MAX_DIRTY_REGIONS = 3
+# Changed tiles are grown by this many tiles so elements on the edge are not cut
+REGION_PADDING_TILES = 1
+
+Rect = Tuple[float, float, float, float]  # normalized (x1, y1, x2, y2)
+
+
+def _intersects(a: Rect, b: Rect) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def _union(a: Rect, b: Rect) -> Rect:
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def _merge_overlapping(rects: List[Rect]) -> List[Rect]:
+    merged = list(rects)
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(i + 1, len(merged)):
+                if _intersects(merged[i], merged[j]):
+                    merged[i] = _union(merged[i], merged.pop(j))
+                    changed = True
+                    break
+            if changed:
+                break
+    return merged
+
+
+def grow_to_elements(regions: List[Rect], bboxes: List[Rect]) -> List[Rect]:
+    """
+    Grows regions to cover every element they cut through, merging regions that come to
+    overlap, until nothing changes: a grown or merged region can cut further elements.
+    """
+    regions = _merge_overlapping(regions)
+    while True:
+        grown = list(regions)
+        for bbox in bboxes:
+            for i, region in enumerate(grown):
+                if _intersects(region, bbox):
+                    grown[i] = _union(region, bbox)
+        grown = _merge_overlapping(grown)
+        if grown == regions:
+            return regions
+        regions = grown
+
+
+def dirty_regions(changed_tiles: List[int], grid: Tuple[int, int], padding: int = REGION_PADDING_TILES) -> List[Rect]:
+    """
+    Groups changed tiles into padded, non-overlapping rectangles in normalized coordinates.
+    """
+    cols, rows = grid
+    rects = []
+    for index in changed_tiles:
+        col, row = index % cols, index // cols
+        rects.append((
+            max(col - padding, 0) / cols,
+            max(row - padding, 0) / rows,
+            min(col + 1 + padding, cols) / cols,
+            min(row + 1 + padding, rows) / rows,
+        ))
+    return _merge_overlapping(rects)
+
+
+def format_element_string(elements: List[Dict[str, Any]]) -> str:
+    """Formats elements in the same 'icon N: {...}' layout that the Omni server returns."""
+    lines = []
+    for number, element in enumerate(elements):
+        fields = {k: v for k, v in element.items() if k != 'icon'}
+        lines.append(f"icon {number}: {fields}")
+    return "\n".join(lines)
+
+
+def annotate(image: Image.Image, elements: List[Dict[str, Any]]) -> str:
+    """Draws numbered boxes for the elements on a copy of image and returns it as base64 PNG."""
+    annotated = image.convert("RGB")
+    draw = ImageDraw.Draw(annotated)
+    width, height = annotated.size
+    for number, element in enumerate(elements):
+        x1, y1, x2, y2 = element['bbox']
+        box = (x1 * width, y1 * height, x2 * width, y2 * height)
+        draw.rectangle(box, outline=(255, 0, 0), width=2)
+        label_box = draw.textbbox((box[0], box[1]), str(number))
+        draw.rectangle(label_box, fill=(255, 0, 0))
+        draw.text((box[0], box[1]), str(number), fill=(255, 255, 255))
+    buffered = io.BytesIO()
+    annotated.save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+
+class IncrementalParser:
+    """
+    Parses a screen by sending only the regions that changed since the previous
+    parse to the Omni server, keeping the elements found in unchanged areas.
+    The previous parse is remembered per session.
+    """
+
+    def __init__(self, omni_call: Callable[..., Any], tolerance: int = TILE_TOLERANCE):
+        self.omni_call = omni_call  # called as omni_call(b64, cancel=...)
+        self.tolerance = tolerance
+        self._lock = threading.Lock()
+        # session -> (lock, [fingerprint, elements] of its previous parse)
+        self._sessions: Dict[Optional[str], Tuple[threading.Lock, list]] = {}
+
+    def _session(self, session_id: Optional[str]) -> Tuple[threading.Lock, list]:
+        with self._lock:
+            return self._sessions.setdefault(session_id, (threading.Lock(), [None, []]))
+
+    def forget(self, session_id: Optional[str]):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _full_parse(self, frame: Frame, fingerprint: ScreenFingerprint, state: list, cancel=None):
+        result = self.omni_call(frame.base64_for_stage("omni"), cancel=cancel)
+        if result is not None:
+            element_string = result[1] if isinstance(result, tuple) else result
+            state[:] = [fingerprint, parse_element_string(element_string)]
+        return result
+
+    def _parse_region(self, frame: Frame, region: Rect, cancel=None) -> Optional[List[Dict[str, Any]]]:
+        crop = frame.crop(region)
+        result = self.omni_call(crop.base64_for_stage("omni"), cancel=cancel)
+        if result is None:
+            return None
+        element_string = result[1] if isinstance(result, tuple) else result
+        elements = []
+        for element in parse_element_string(element_string):
+            # Crop-relative ratios back to full-frame ratios
+            element['bbox'] = frame.from_screen(crop.to_screen(element['bbox']))
+            elements.append(element)
+        return elements
+
+    def parse(self, frame: Frame, fingerprint: ScreenFingerprint, cancel=None, session_id: Optional[str] = None):
+        """
+        Returns (annotated_b64, element_string) for the frame, like omni_api does.
+        """
+        # A session's previous-frame state is shared by its requests, so they parse one at a time
+        lock, state = self._session(session_id)
+        with lock:
+            return self._parse(frame, fingerprint, state, cancel)
+
+    def _parse(self, frame: Frame, fingerprint: ScreenFingerprint, state: list, cancel=None):
+        previous, previous_elements = state
+        if previous is None:
+            print("[OMNI INCREMENTAL] No previous frame, running full parse")
+            return self._full_parse(frame, fingerprint, state, cancel)
+
+        changed = fingerprint.changed_tiles(previous, self.tolerance)
+        regions = dirty_regions(changed, fingerprint.grid)
+        # Grow regions to cover previous elements they cut through, so those are re-parsed whole
+        regions = grow_to_elements(regions, [tuple(element['bbox']) for element in previous_elements])
+        dirty_area = sum((r[2] - r[0]) * (r[3] - r[1]) for r in regions)
+
+        if len(regions) > MAX_DIRTY_REGIONS or dirty_area > MAX_DIRTY_AREA:
+            print(f"[OMNI INCREMENTAL] {len(regions)} regions covering {dirty_area * 100:.1f}% changed, running full parse")
+            return self._full_parse(frame, fingerprint, state, cancel)
+
+        incremental_start = time.time()
+        kept = [e for e in previous_elements if not any(_intersects(r, tuple(e['bbox'])) for r in regions)]
+        # Crop from the frame Omni sees on a full parse, so element sizes stay comparable
+        view = frame.stage_view("omni")
+        fresh = []
+        for region in regions:
+            region_elements = self._parse_region(view, region, cancel)
+            if region_elements is None:
+                return None
+            fresh.extend(region_elements)
+
+        # Reading order, then renumber so icon N is the N-th line and the N-th label on the image
+        elements = sorted(kept + fresh, key=lambda e: (round(e['bbox'][1], 3), e['bbox'][0]))
+        for number, element in enumerate(elements):
+            element['icon'] = number
+        state[:] = [fingerprint, elements]
+        print(f"[OMNI INCREMENTAL] Parsed {len(regions)} regions covering {dirty_area * 100:.1f}% of the screen "
+              f"({len(kept)} elements kept, {len(fresh)} new) in {(time.time() - incremental_start) * 1000:.2f}ms")
+        return annotate(view.image, elements), format_element_string(elements)
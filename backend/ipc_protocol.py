@@ -0,0 +1,71 @@
+import json
+import threading
+from typing import Dict, Optional
+from cancellation import CancelToken
+
+PROTOCOL_VERSION = 2
+
+# Requests handled at the same time by the IPC loop
+MAX_CONCURRENT_REQUESTS = 4
+
+
+class ProtocolWriter:
+    """
+    Writes protocol messages as JSON lines to the protocol stream (the process's real stdout).
+    Version 2 messages are tagged with the request they answer.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def send(self, message: dict, request_id: Optional[str] = None):
+        if request_id is not None:
+            message = {"v": PROTOCOL_VERSION, "request_id": request_id, **message}
+        line = json.dumps(message)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+class RequestRegistry:
+    """
+    Tracks in-flight requests so they can be cancelled by id, and so a newer
+    screenshot for the same session supersedes the one still being processed.
+    """
+
+    def __init__(self):
+        self._tokens: Dict[str, CancelToken] = {}
+        self._session_requests: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def start(self, request_id: str, session_id: Optional[str] = None) -> CancelToken:
+        token = CancelToken()
+        with self._lock:
+            if session_id is not None:
+                previous = self._session_requests.get(session_id)
+                if previous is not None and previous in self._tokens:
+                    print(f"[IPC] Request {previous} superseded by {request_id} for session {session_id}")
+                    self._tokens[previous].cancel(f"superseded by {request_id}")
+                self._session_requests[session_id] = request_id
+            self._tokens[request_id] = token
+        return token
+
+    def cancel(self, request_id: str) -> bool:
+        with self._lock:
+            token = self._tokens.get(request_id)
+        if token is None:
+            return False
+        token.cancel("cancelled by client")
+        return True
+
+    def finish(self, request_id: str):
+        with self._lock:
+            self._tokens.pop(request_id, None)
+            for session_id, current in list(self._session_requests.items()):
+                if current == request_id:
+                    del self._session_requests[session_id]
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._tokens)
@@ -1,138 +1,34 @@
+from startup import BackendStartup, _startup_begin
+
 import sys
 import json
-import traceback
-from capture_screenshot import capture
-from element_selector import llm2_action_selector
-from atomic_generator import generate_next_atomic_task
-from omni_api_hf_spaces import omni_api
-from PIL import Image
 import os
-import time
+import itertools
+import traceback
+import tracing
+import cancellation
+from cancellation import RequestCancelled
+from history import tag_history
+from foreground_window import foreground_window_rect
+from ipc_protocol import ProtocolWriter, RequestRegistry, MAX_CONCURRENT_REQUESTS
+from concurrent.futures import ThreadPoolExecutor
 
 sys.stdout.reconfigure(encoding='utf-8')
 
-def process_screenshot_request(screenshot_path, prompt, history=None):
-    """
-    Process a screenshot with the given prompt and return results
-    """
-    if history is None:
-        history = []
-    
-    # Start timing for backend processing
-    backend_start_time = time.time()
-    print(f"[BACKEND TIMING] Backend processing started at: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"[BACKEND TIMING] History: {history}")
-    
-    try:
-        # Resize image if needed
-        img_resize_start = time.time()
-        img = Image.open(screenshot_path)
-        width, height = img.size
-        img = img.resize((1280, int((1280 / width) * height)))
-        img.save(screenshot_path)
-        img_resize_end = time.time()
-        print(f"[BACKEND TIMING] Image resize completed in: {(img_resize_end - img_resize_start) * 1000:.2f}ms")
-        
-        # Generate atomic task
-        task_gen_start = time.time()
-        print(f"[BACKEND TIMING] Starting atomic task generation at: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-        task = generate_next_atomic_task(prompt, screenshot_path, history)
-        task_gen_end = time.time()
-        print(f"[BACKEND TIMING] Atomic task generation completed in: {(task_gen_end - task_gen_start) * 1000:.2f}ms")
-        
-        if task is None:
-            backend_end_time = time.time()
-            print(f"[BACKEND TIMING] Task completed, total backend time: {(backend_end_time - backend_start_time) * 1000:.2f}ms")
-            return {
-                "status": "completed",
-                "message": "Task completed",
-                "highlighting_boxes": []
-            }
-        
-        # Get screenshot data and element string
-        screenshot_b64_start = time.time()
-        import base64
-        with open(screenshot_path, "rb") as image_file:
-            screenshot_b64 = base64.b64encode(image_file.read()).decode("utf-8")
-        screenshot_b64_end = time.time()
-        print(f"[BACKEND TIMING] Base64 encoding completed in: {(screenshot_b64_end - screenshot_b64_start) * 1000:.2f}ms")
-        
-        # Call Omni API
-        omni_start = time.time()
-        print(f"[BACKEND TIMING] Starting Omni API call at: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-        omni_result = omni_api(screenshot_b64)
-        omni_end = time.time()
-        print(f"[BACKEND TIMING] Omni API processing completed in: {(omni_end - omni_start) * 1000:.2f}ms")
-        
-        # Check if Omni API call was successful
-        if omni_result is None:
-            error_msg = "Omni API failed completely"
-            backend_end_time = time.time()
-            total_backend_time = (backend_end_time - backend_start_time) * 1000
-            print(f"[BACKEND TIMING] Backend processing failed after: {total_backend_time:.2f}ms")
-            return {
-                "status": "error",
-                "message": f"Omni API error: {error_msg}",
-                "highlighting_boxes": []
-            }
-        # print('omni_result------\n',omni_result)
-        # Extract screenshot_b64 and element_string from result
-        if isinstance(omni_result, tuple) and len(omni_result) == 2:
-            screenshot_b64, element_string = omni_result
-        else:
-            # Handle case where result might be in different format
-            element_string = omni_result
-        
-        # Select element
-        element_select_start = time.time()
-        print(f"[BACKEND TIMING] Starting element selection at: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-        icon, bbox, reason = llm2_action_selector(screenshot_b64, element_string, task['action'])
-        element_select_end = time.time()
-        print(f"[BACKEND TIMING] Element selection completed in: {(element_select_end - element_select_start) * 1000:.2f}ms")
-        
-        # Format bounding box for frontend
-        highlighting_boxes = [{
-            "x": bbox[0],
-            "y": bbox[1], 
-            "width": bbox[2] - bbox[0],
-            "height": bbox[3] - bbox[1],
-            "icon": icon,
-            "reason": reason,
-            "action": task['action']
-        }]
-        
-        backend_end_time = time.time()
-        total_backend_time = (backend_end_time - backend_start_time) * 1000
-        print(f"[BACKEND TIMING] Backend processing completed at: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"[BACKEND TIMING] TOTAL BACKEND TIME: {total_backend_time:.2f}ms")
-        
-        return {
-            "status": "success",
-            "highlighting_boxes": highlighting_boxes,
-            "task": task,
-            "icon": icon,
-            "bbox": bbox,
-            "reason": reason
-        }
-        
-    except Exception as e:
-        backend_end_time = time.time()
-        total_backend_time = (backend_end_time - backend_start_time) * 1000
-        print(f"[BACKEND TIMING] Backend processing failed after: {total_backend_time:.2f}ms")
-        error_msg = f"Error processing screenshot: {str(e)}"
-        print(error_msg, file=sys.stderr)
-        traceback.print_exc(file=sys.stderr)
-        return {
-            "status": "error",
-            "message": error_msg,
-            "highlighting_boxes": []
-        }
+# When set, requests are relayed to the backend server at this URL (see server.py)
+# instead of running the pipeline in this process
+BACKEND_SERVER_URL = os.getenv("BACKEND_SERVER_URL", "")
 
-def tag_history(history, success):
-    """Tag the last step in history with success or failure."""
-    if history:
-        history[-1]['status'] = 'success' if success else 'failure'
-    return history
+# Opt-in: a click inside the highlighted element tags the step a success (see click_verifier)
+AUTO_VERIFY_CLICKS = os.getenv("AUTO_VERIFY_CLICKS", "0") == "1"
+
+_request_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS, thread_name_prefix="request")
+
+# Trace ids for version 1 requests, which carry no request_id
+_v1_request_ids = itertools.count(1)
+
+
+startup = BackendStartup()
 
 def update_history_with_key_combination(data, history):
     """Update history based on key combination in the received data."""
@@ -143,66 +39,204 @@ def update_history_with_key_combination(data, history):
         history = tag_history(history, success=True)
     return history
 
+def capture_frame(writer, request_id):
+    """
+    Grabs the screen in this process for a {"capture": true} request and returns the
+    frame, or None if it was overwritten before it could be read (raises if the screen
+    cannot be grabbed). {"status": "captured"} tells a version 2 client it can show its
+    prompt again.
+    """
+    from screen_capture import capturer
+    with tracing.span("capture"):
+        frame = capturer.frame(capturer.capture())
+    if request_id is not None:
+        writer.send({"status": "captured"}, request_id)
+    return frame
+
+def handle_process_screenshot(data, writer, cancel=None, verifier=None):
+    """
+    Run one process_screenshot request and send its partial and final results.
+    Version 2 requests carry a request_id (and optionally a session_id); version 1
+    requests have neither and get a single untagged reply as before, with no partials.
+    With "capture": true the backend grabs the screen itself instead of reading
+    screenshot_path (see screen_capture).
+    With a verifier, the step's highlighted element is watched for the user's click.
+    cancel is a version 2 request's token, registered when the request was read, so a
+    request cancelled or superseded while it waited stops before capturing the screen.
+    """
+    request_id = data.get('request_id')
+    screenshot_path = data.get('screenshot_path')
+    prompt = data.get('prompt', '')
+    history = data.get('history', [])  # Get history with status
+
+    # Update history based on key combination
+    history = update_history_with_key_combination(data, history)
+
+    elements = {}
+    on_elements = None
+    if verifier is not None:
+        # A new step replaces the one waiting for its click
+        verifier.disarm(data.get('session_id'))
+        on_elements = lambda element_string, frame: elements.update(element_string=element_string, frame=frame)
+
+    trace_id = request_id or f"v1-{next(_v1_request_ids)}"
+    with tracing.trace(trace_id) as request_trace:
+        try:
+            cancellation.check(cancel)
+            # Capture first: the screen is in the state the user wants help with right now
+            frame = capture_frame(writer, request_id) if data.get('capture') else None
+            # This process runs on the user's screen, so it can tell which window is in front
+            window_rect = foreground_window_rect()
+            pipeline = startup.wait_for_pipeline()
+            cancellation.check(cancel)
+            if data.get('capture') and frame is None:
+                result = {
+                    "status": "error",
+                    "message": "Screen capture failed: the captured frame was gone before it could be read",
+                    "highlighting_boxes": []
+                }
+            elif frame is None and (not screenshot_path or not os.path.exists(screenshot_path)):
+                result = {
+                    "status": "error",
+                    "message": f"Screenshot file not found: {screenshot_path}",
+                    "highlighting_boxes": []
+                }
+            elif request_id is None:
+                result = pipeline.process_screenshot_request(screenshot_path, prompt, history, frame=frame,
+                                                             on_elements=on_elements, window_rect=window_rect)
+            else:
+                result = pipeline.process_screenshot_request(
+                    screenshot_path, prompt, history,
+                    on_partial=lambda task: writer.send({"status": "partial", "task": task}, request_id),
+                    cancel=cancel, session_id=data.get('session_id'), frame=frame, on_elements=on_elements,
+                    window_rect=window_rect)
+        except RequestCancelled as e:
+            print(f"[BACKEND] Processing cancelled before it started ({e})")
+            result = {
+                "status": "cancelled",
+                "message": f"Request {e}",
+                "highlighting_boxes": []
+            }
+    print(f"[TRACE] Request {trace_id} {result['status']}: {request_trace.summary()}")
+
+    # Send result back to Electron
+    writer.send(result, request_id)
+    if verifier is not None:
+        verifier.arm(request_id, data.get('session_id'), result, elements.get('element_string'), elements.get('frame'))
+
+def _run_request(data, writer, registry, relay=None, verifier=None, cancel=None):
+    try:
+        if relay is not None:
+            relay.process(data, writer)
+        else:
+            handle_process_screenshot(data, writer, cancel, verifier)
+    except Exception as e:
+        traceback.print_exc()
+        writer.send({
+            "status": "error",
+            "message": f"Backend error: {str(e)}",
+            "highlighting_boxes": []
+        }, data.get('request_id'))
+    finally:
+        if cancel is not None:
+            registry.finish(data['request_id'])
+
 def main():
     """
-    Main function to handle IPC communication
+    Main function to handle IPC communication.
+
+    stdin and stdout carry one JSON message per line. stdout is reserved for protocol
+    messages; all diagnostics (the trace summaries etc.) go to stderr.
+    Version 2 messages ({"v": 2, "request_id": ..., "session_id": ...}) are processed
+    concurrently, can be stopped with {"action": "cancel", "request_id": ...}, and a
+    newer screenshot for the same session supersedes the one still in flight.
+    Every reply to a version 2 request carries its request_id.
+    The loop accepts messages before the pipeline has loaded; {"action": "status"}
+    answers with the current startup state at any time. The untagged ready/degraded
+    message is only sent once the client has shown it speaks version 2 (any message with
+    "v": 2, e.g. {"v": 2, "action": "hello"}), so a version 1 client never sees it.
+    With BACKEND_SERVER_URL set the loop is a thin client: the server runs the steps
+    and keeps the session state, and this process only relays messages.
+    With AUTO_VERIFY_CLICKS set, a click inside a step's highlighted element sends
+    {"status": "step_verified", ...} tagged with that step's request_id.
     """
+    writer = ProtocolWriter(sys.stdout)
+    sys.stdout = sys.stderr
+    registry = RequestRegistry()
+
+    relay = None
+    if BACKEND_SERVER_URL:
+        from server_client import ServerRelay
+        relay = ServerRelay(BACKEND_SERVER_URL, _startup_begin)
+        relay.start()
+    else:
+        # Load the pipeline and warm up its clients in the background; the loop below
+        # starts reading requests right away
+        startup.start()
+    backend = relay or startup
+
+    verifier = None
+    if AUTO_VERIFY_CLICKS and relay is None:
+        from click_verifier import ClickVerifier
+        verifier = ClickVerifier(writer.send)
+
     try:
         for line in sys.stdin:
             try:
                 # Parse JSON input from Electron
                 data = json.loads(line.strip())
+                action = data.get('action')
+                if data.get('v') == 2:
+                    backend.announce(writer)
                 
-                if data.get('action') == 'process_screenshot':
-                    screenshot_path = data.get('screenshot_path')
-                    prompt = data.get('prompt', '')
-                    history = data.get('history', [])  # Get history with status
-
-                    # Update history based on key combination
-                    history = update_history_with_key_combination(data, history)
-
-                    if not screenshot_path or not os.path.exists(screenshot_path):
-                        result = {
-                            "status": "error",
-                            "message": f"Screenshot file not found: {screenshot_path}",
-                            "highlighting_boxes": []
-                        }
+                if action == 'process_screenshot':
+                    if data.get('request_id') is None:
+                        # Version 1: one request at a time, in order, and no click verification
+                        # (its untagged step_verified would look like a reply)
+                        _run_request(data, writer, registry, relay)
                     else:
-                        result = process_screenshot_request(screenshot_path, prompt, history)
+                        # Registered before it is queued, so a cancel, or a newer request for the
+                        # same session, reaches it while it waits for a worker, the capture or
+                        # the pipeline; requests supersede each other in the order they were read
+                        cancel = registry.start(data['request_id'], data.get('session_id')) if relay is None else None
+                        _request_executor.submit(_run_request, data, writer, registry, relay, verifier, cancel)
                     
-                    # Send result back to Electron
-                    print(json.dumps(result))
-                    sys.stdout.flush()
+                elif action == 'status':
+                    writer.send(backend.status_message(), data.get('request_id'))
+
+                elif action == 'hello':
+                    # Only announces a version 2 client (see above)
+                    pass
+
+                elif action == 'cancel':
+                    request_id = data.get('request_id')
+                    if (relay.cancel(request_id) if relay is not None else registry.cancel(request_id)):
+                        print(f"[IPC] Cancelling request {request_id}")
+                    else:
+                        print(f"[IPC] Cancel for unknown or finished request {request_id}")
                     
                 else:
-                    result = {
+                    writer.send({
                         "status": "error", 
-                        "message": f"Unknown action: {data.get('action')}",
+                        "message": f"Unknown action: {action}",
                         "highlighting_boxes": []
-                    }
-                    print(json.dumps(result))
-                    sys.stdout.flush()
+                    }, data.get('request_id'))
                     
             except json.JSONDecodeError as e:
-                error_result = {
+                writer.send({
                     "status": "error",
                     "message": f"Invalid JSON: {str(e)}",
                     "highlighting_boxes": []
-                }
-                print(json.dumps(error_result))
-                sys.stdout.flush()
+                })
                 
     except KeyboardInterrupt:
-        print(json.dumps({"status": "shutdown", "message": "Backend shutting down"}))
-        sys.stdout.flush()
+        writer.send({"status": "shutdown", "message": "Backend shutting down"})
     except Exception as e:
-        error_result = {
+        writer.send({
             "status": "error",
             "message": f"Backend error: {str(e)}",
             "highlighting_boxes": []
-        }
-        print(json.dumps(error_result))
-        sys.stdout.flush()
+        })
 
 if __name__ == "__main__":
     main()
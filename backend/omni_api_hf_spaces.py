@@ -4,74 +4,116 @@ import time
 import httpx
 from httpx import TimeoutException, ConnectError, ReadTimeout, WriteTimeout
 import sys
+import threading
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+import cancellation
+from cancellation import RequestCancelled
+import tracing
+import resilience
 
 sys.stdout.reconfigure(encoding='utf-8')
 
-# Create client once at module level with timeout settings
-print('[OMNI INIT] Initializing Omni API client...')
-try:
-    client = Client("http://127.0.0.1:7860/")
-    # Set longer timeout for the client
-    client.timeout = 180  # 3 minutes timeout
-    print('[OMNI INIT] Omni API client initialized successfully')
-except Exception as e:
-    print(f'[OMNI INIT] Error initializing client: {e}')
-    client = None
+# Local OmniParser Gradio app; override to point the backend at a stand-in server
+OMNI_API_URL = os.getenv("OMNI_API_URL", "http://127.0.0.1:7860/")
 
-def omni_api(img_base64_str, max_retries=3):
-    if client is None:
-        raise RuntimeError("Omni API client not initialized")
-    
+# Longest a single Omni call may take; the request's time budget usually cuts it shorter
+OMNI_TIMEOUT_S = 180
+# Stop calling the Omni server for a while after this many consecutive failed calls
+omni_breaker = resilience.CircuitBreaker("Omni server", failure_threshold=3, reset_timeout_s=30)
+
+# Created on first use: building the client fetches the app config from the server
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Returns the shared Omni client, connecting first if needed. Raises if the server cannot be reached."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                print('[OMNI INIT] Initializing Omni API client...')
+                init_start = time.time()
+                client = Client(OMNI_API_URL)
+                # Set longer timeout for the client
+                client.timeout = OMNI_TIMEOUT_S
+                _client = client
+                print(f'[OMNI INIT] Omni API client initialized in {(time.time() - init_start) * 1000:.2f}ms')
+    return _client
+
+def warm_up() -> bool:
+    """Connects the shared client ahead of the first step. Returns True if the server answered."""
+    try:
+        get_client()
+    except Exception as e:
+        print(f'[OMNI INIT] Error initializing client: {e}')
+        return False
+    return True
+
+def _wait_for_job(job, cancel, timeout_s):
+    """
+    Waits up to timeout_s for a submitted Gradio job, cancelling it if the request is
+    cancelled meanwhile or the timeout passes.
+    """
+    deadline = time.monotonic() + timeout_s
+    while True:
+        try:
+            return job.result(timeout=min(0.25, max(deadline - time.monotonic(), 0.001)))
+        except FuturesTimeoutError:
+            if cancel is not None and cancel.cancelled:
+                job.cancel()
+                print("[OMNI] Request cancelled, abandoning Omni job")
+                cancel.check()
+            if time.monotonic() >= deadline:
+                job.cancel()
+                raise TimeoutError(f"no result after {timeout_s:.1f}s")
+
+def omni_api(img_base64_str, max_retries=3, cancel=None):
+    """
+    Parses a screenshot with the Omni server. Attempts are bounded by the request's time
+    budget and retried with jittered backoff while budget remains; a client that could
+    not connect at startup is created again on the next attempt. Raises
+    resilience.CircuitOpen without calling the server while it is considered down.
+    """
     for attempt in range(max_retries):
+        cancellation.check(cancel)
+        trial = omni_breaker.allow()
         try:
-            print(f'[OMNI TIMING] Starting Omni API processing (attempt {attempt + 1}/{max_retries})')
-            processing_start = time.time()
-            print('[OMNI TIMING] Starting image processing')
-            
-            result = client.predict(
-                image_base64_input=img_base64_str,
-                box_threshold=0.05,
-                iou_threshold=0.1,
-                use_paddleocr=True,
-                imgsz=640,
-                api_name="/process"
-            )
-            
-            processing_end = time.time()
-            print(f"[OMNI TIMING] Image processing time: {(processing_end - processing_start) * 1000:.2f}ms")
-            
-            total_omni_time = (processing_end - processing_start) * 1000
-            print(f"[OMNI TIMING] Total Omni API time: {total_omni_time:.2f}ms")
+            with tracing.span("omni.attempt", attempt=attempt + 1):
+                job = get_client().submit(
+                    image_base64_input=img_base64_str,
+                    box_threshold=0.05,
+                    iou_threshold=0.1,
+                    use_paddleocr=True,
+                    imgsz=640,
+                    api_name="/process"
+                )
+                result = _wait_for_job(job, cancel, resilience.stage_timeout(cancel, "omni", OMNI_TIMEOUT_S))
+            omni_breaker.record_success()
             return result
             
-        except (TimeoutException, ReadTimeout, WriteTimeout) as e:
-            print(f"[OMNI ERROR] Timeout on attempt {attempt + 1}: {e}")
-            if attempt < max_retries - 1:
-                wait_time = (2 ** attempt) + 1  # Exponential backoff: 3s, 5s, 9s
-                print(f"[OMNI RETRY] Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                print("[OMNI ERROR] All retry attempts failed due to timeout")
-                raise RuntimeError(f"Omni API timeout after {max_retries} attempts: {str(e)}")
-                
-        except ConnectError as e:
-            print(f"[OMNI ERROR] Connection error on attempt {attempt + 1}: {e}")
-            if attempt < max_retries - 1:
-                wait_time = (2 ** attempt) + 1
-                print(f"[OMNI RETRY] Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                print("[OMNI ERROR] All retry attempts failed due to connection error")
-                raise RuntimeError(f"Omni API connection error after {max_retries} attempts: {str(e)}")
-                
+        except RequestCancelled:
+            # Says nothing about the server's health
+            raise
         except Exception as e:
-            print(f"[OMNI ERROR] Unexpected error on attempt {attempt + 1}: {e}")
-            if attempt < max_retries - 1:
-                wait_time = (2 ** attempt) + 1
-                print(f"[OMNI RETRY] Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
+            if isinstance(e, (TimeoutException, ReadTimeout, WriteTimeout, TimeoutError)):
+                kind = "timeout"
+            elif isinstance(e, ConnectError):
+                kind = "connection error"
             else:
-                print("[OMNI ERROR] All retry attempts failed due to unexpected error")
-                raise RuntimeError(f"Omni API unexpected error after {max_retries} attempts: {str(e)}")
+                kind = "unexpected error"
+            error = e
+            omni_breaker.record_failure()
+        finally:
+            if trial:
+                # No-op after record_success/record_failure; frees a cancelled trial
+                omni_breaker.release_trial()
+
+        print(f"[OMNI ERROR] {kind.capitalize()} on attempt {attempt + 1}: {error}")
+        if attempt == max_retries - 1:
+            print(f"[OMNI ERROR] All retry attempts failed due to {kind}")
+            raise RuntimeError(f"Omni API {kind} after {max_retries} attempts: {str(error)}")
+        # No point retrying once the breaker has given up on the server
+        omni_breaker.check()
+        resilience.retry_sleep(attempt, cancel, "Omni")
 
 # print(omni_api('image.png'))
@@ -0,0 +1,128 @@
+import time
+import threading
+from typing import Any, Callable, List, Optional
+from cancellation import CancelToken
+from frame import Frame, Rect
+from screen_cache import ScreenFingerprint
+
+# How often a waiting request (and the shared call) looks at the waiters' cancel tokens
+_WAIT_POLL_S = 0.05
+
+
+class _SharedCancel(CancelToken):
+    """
+    The shared call's token: cancelled once every request waiting for the call has been
+    cancelled, and given the first request's deadline and whole budget, so the Omni
+    stage keeps its share of the original budget rather than of what was left.
+    """
+
+    def __init__(self, waiting: List[Optional[CancelToken]], first: Optional[CancelToken]):
+        super().__init__()
+        self._waiting = waiting
+        if first is not None and first.remaining() is not None:
+            self.start_deadline(first.remaining(), budget_s=first.budget_s)
+
+    def _abandon_if_unwanted(self):
+        waiting = list(self._waiting)
+        if waiting and all(token is not None and token.cancelled for token in waiting):
+            self.cancel("every request waiting for it was cancelled")
+
+    @property
+    def cancelled(self) -> bool:
+        self._abandon_if_unwanted()
+        return super().cancelled
+
+    def check(self):
+        self._abandon_if_unwanted()
+        super().check()
+
+    def sleep(self, seconds: float):
+        # Wake up regularly: a waiter being cancelled does not set this token's event
+        end = time.monotonic() + seconds
+        while True:
+            self.check()
+            left = end - time.monotonic()
+            if left <= 0:
+                return
+            self._event.wait(min(left, _WAIT_POLL_S))
+
+
+class _SharedCall:
+    def __init__(self, fingerprint: ScreenFingerprint, region: Rect, first: Optional[CancelToken]):
+        self.fingerprint = fingerprint
+        self.region = region
+        self.waiting: List[Optional[CancelToken]] = []
+        self.cancel = _SharedCancel(self.waiting, first)
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class OmniBatcher:
+    """
+    Combines concurrent Omni requests for the same screen region, from any session,
+    into one call. The Omni /process endpoint parses one image per call, so requests
+    are batched by content: a request whose fingerprint matches a call already in
+    flight waits for that call instead of making its own.
+
+    The shared call runs on the thread of the request that started it (a pipeline
+    executor worker) with its own cancel token, so it survives any one request being
+    cancelled; it is only cancelled once every request waiting for it has gone.
+    """
+
+    def __init__(self, call: Callable[[Frame, CancelToken], Any]):
+        self.call = call  # called as call(frame, cancel)
+        self._in_flight: List[_SharedCall] = []
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.merged = 0
+
+    def parse(self, frame: Frame, fingerprint: ScreenFingerprint, cancel: Optional[CancelToken] = None):
+        """Returns the Omni result for frame, raising what the call raised."""
+        with self._lock:
+            shared = next((c for c in self._in_flight
+                           if c.region == frame.region and c.fingerprint.matches(fingerprint)), None)
+            owner = shared is None
+            if owner:
+                shared = _SharedCall(fingerprint, frame.region, cancel)
+                self._in_flight.append(shared)
+                self.calls += 1
+            else:
+                self.merged += 1
+                print(f"[OMNI BATCH] Joined an Omni call in flight for the same screen ({self.stats()})")
+            shared.waiting.append(cancel)
+
+        try:
+            if owner:
+                self._run(shared, frame)
+            else:
+                while not shared.done.wait(_WAIT_POLL_S):
+                    if cancel is not None:
+                        cancel.check()
+        finally:
+            with self._lock:
+                shared.waiting.remove(cancel)
+                abandoned = not shared.waiting and not shared.done.is_set()
+                if abandoned and shared in self._in_flight:
+                    self._in_flight.remove(shared)
+            if abandoned:
+                shared.cancel.cancel("every request waiting for it was cancelled")
+
+        if shared.error is not None:
+            raise shared.error
+        return shared.result
+
+    def _run(self, shared: _SharedCall, frame: Frame):
+        try:
+            shared.result = self.call(frame, shared.cancel)
+        except BaseException as e:
+            shared.error = e
+        finally:
+            with self._lock:
+                if shared in self._in_flight:
+                    self._in_flight.remove(shared)
+            shared.done.set()
+
+    def stats(self) -> str:
+        requests = self.calls + self.merged
+        return f"calls={self.calls} merged={self.merged} requests_per_call={requests / self.calls if self.calls else 0:.2f}"
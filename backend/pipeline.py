@@ -0,0 +1,399 @@
+"""
+The screenshot-to-highlight pipeline: Omni parsing, planning and element selection.
+
+Importing this module loads the heavy dependencies (google-genai, gradio_client,
+Pillow, numpy); main.py imports it in the background so the IPC loop starts at once.
+"""
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from element_selector import llm2_action_selector
+from element_table import parse_element_table
+from atomic_generator import generate_next_atomic_task
+from omni_api_hf_spaces import omni_api, omni_breaker
+from frame import Frame, FULL_SCREEN
+import tracing
+import session_recorder
+from screen_cache import ScreenCache, ScreenFingerprint
+from incremental_parse import IncrementalParser
+from cancellation import CancelToken, RequestCancelled, DeadlineExceeded
+from resilience import CircuitOpen, REQUEST_DEADLINE_S
+from speculation import SpeculativePrefetcher
+from history import tag_history
+import roi
+from plan_cache import PLAN_MODE, PlanCache, PlannerStats, plan_steps, expectation_met
+from ipc_protocol import MAX_CONCURRENT_REQUESTS
+from worker_pools import stage_pools, Overloaded, busy_result, SERVER_MAX_REQUESTS
+from omni_batch import OmniBatcher
+from result_cache import RESULT_CACHE, ResultCache
+
+# Worker threads for pipeline stages that can overlap with the planner call, one per
+# request the IPC loop or the server runs at once; stage_pools bounds the calls themselves
+_pipeline_executor = ThreadPoolExecutor(max_workers=max(MAX_CONCURRENT_REQUESTS, SERVER_MAX_REQUESTS),
+                                        thread_name_prefix="pipeline")
+
+# Omni parse results for recently seen screens
+omni_cache = ScreenCache()
+
+# Opt-in: only send the regions that changed since the previous step to the Omni server
+INCREMENTAL_OMNI_PARSE = os.getenv("OMNI_INCREMENTAL_PARSE", "0") == "1"
+incremental_parser = IncrementalParser(lambda b64, cancel=None: omni_api(b64, cancel=cancel))
+
+def _pooled_omni_api(frame, cancel):
+    with stage_pools["omni"].slot(cancel):
+        return omni_api(frame.base64_for_stage("omni"), cancel=cancel)
+
+# Requests from any session for a screen that is already being parsed share that call
+omni_batcher = OmniBatcher(_pooled_omni_api)
+
+# Upcoming steps from the planner (plan mode) and planner calls per completed task
+plans = PlanCache()
+planner_stats = PlannerStats()
+
+# Steps of workflows run before, kept on disk across runs (see result_cache)
+result_cache = ResultCache() if RESULT_CACHE else None
+
+# Opt-in: while the user performs a step, pre-run the next one assuming it succeeds.
+# One speculation at a time, so it never takes a worker from a real request.
+SPECULATIVE_PREFETCH = os.getenv("SPECULATIVE_PREFETCH", "0") == "1"
+prefetcher = SpeculativePrefetcher(ThreadPoolExecutor(max_workers=1, thread_name_prefix="speculation"))
+
+def _timed_omni_api(frame, fingerprint, cancel=None, session_id=None):
+    """
+    Run omni_api on frame (the whole screen or its region of interest), or serve it from
+    the screen cache, and return (result, elapsed_ms). fingerprint is of the whole screen,
+    so cached results are only reused for the same region.
+    """
+    omni_start = time.time()
+    with tracing.span("omni"):
+        result = None
+        cached = omni_cache.get(fingerprint)
+        if cached is not None and cached[0] == frame.region:
+            result = cached[1]
+            print(f"[OMNI CACHE] Hit, skipping Omni API call ({omni_cache.stats()})")
+        else:
+            print(f"[OMNI CACHE] Miss ({omni_cache.stats()})")
+            # Incremental parsing tracks changes over the whole screen
+            if INCREMENTAL_OMNI_PARSE and frame.region == FULL_SCREEN:
+                with stage_pools["omni"].slot(cancel):
+                    result = incremental_parser.parse(frame, fingerprint, cancel=cancel, session_id=session_id)
+            else:
+                result = omni_batcher.parse(frame, fingerprint, cancel)
+            if result is not None:
+                omni_cache.put(fingerprint, (frame.region, result))
+    omni_ms = (time.time() - omni_start) * 1000
+    session_recorder.record_omni(result, omni_ms)
+    return result, omni_ms
+
+def process_screenshot_request(screenshot_path, prompt, history=None, on_partial=None, cancel=None, session_id=None,
+                               frame=None, on_elements=None, window_rect=None):
+    """
+    Process a screenshot with the given prompt and return results.
+    on_partial, if given, is called with the planner's task as soon as it is known,
+    while element selection is still running.
+    cancel, if given, stops the pending Omni/Gemini work when the request is cancelled
+    or superseded; the result then has status "cancelled".
+    The request gets REQUEST_DEADLINE_S seconds end to end; past that it stops with
+    status "timeout". While the Omni server is down it fails fast with "unavailable".
+    session_id, if given, enables speculative prefetching of the session's next step.
+    frame, if given, is the already captured screen (see screen_capture) and
+    screenshot_path is not read.
+    on_elements, if given, is called with the Omni element string and the frame its
+    bboxes are normalized to once an element has been selected (see click_verifier).
+    window_rect, if given, is the client's foreground window (normalized to the screen);
+    Omni and the selector then see only that window (see roi.ROI_MODE).
+    """
+    if history is None:
+        history = []
+    if cancel is None:
+        cancel = CancelToken()
+    cancel.start_deadline(REQUEST_DEADLINE_S)
+    
+    print(f"[BACKEND] History: {history}")
+    
+    with session_recorder.step(screenshot_path, prompt, history, frame) as recording:
+        result = _process_screenshot(screenshot_path, frame, prompt, history, on_partial, cancel, session_id,
+                                     on_elements, window_rect)
+        if recording is not None:
+            recording.result = {key: result.get(key) for key in ("status", "task", "icon", "bbox")}
+    return result
+
+def _process_screenshot(screenshot_path, frame, prompt, history, on_partial, cancel, session_id, on_elements=None,
+                        window_rect=None):
+    try:
+        # Decode once at full resolution; every stage gets its own scaled view of this
+        # frame (see frame.STAGE_RESOLUTIONS) and bboxes map back to it
+        with tracing.span("resize"):
+            if frame is None:
+                frame = Frame.from_path(screenshot_path)
+            fingerprint = ScreenFingerprint.from_image(frame.stage_view("omni").image)
+        # Omni and the selector only see the foreground window (see roi.ROI_MODE)
+        with tracing.span("roi"):
+            roi_frame = roi.crop_to_roi(frame, fingerprint, session_id, window_rect)
+
+        if result_cache is not None:
+            result_cache.check_outcome(session_id, history)
+
+        speculate = SPECULATIVE_PREFETCH and session_id is not None
+        result = None
+        if speculate:
+            with tracing.span("speculation.take"):
+                result = prefetcher.take(session_id, prompt, history, fingerprint, cancel)
+        if result is None:
+            result = _run_pipeline(frame, roi_frame, fingerprint, prompt, history, on_partial, cancel, session_id,
+                                   on_elements)
+
+        if result["status"] == "completed":
+            plans.discard(session_id, "task completed")
+            result["planner_calls"] = planner_stats.task_completed(session_id)
+        elif result["status"] == "success":
+            planner_stats.record_step(session_id)
+
+        if speculate and result["status"] == "success":
+            _start_speculation(session_id, prompt, history, result["task"], frame, roi_frame, fingerprint)
+        return result
+        
+    except DeadlineExceeded as e:
+        print(f"[BACKEND] Processing stopped, request {e}")
+        return {
+            "status": "timeout",
+            "message": f"This step did not finish in time (the request {e}). Please try again.",
+            "highlighting_boxes": []
+        }
+    except CircuitOpen as e:
+        print(f"[BACKEND] Failing fast: {e}")
+        return {
+            "status": "unavailable",
+            "service": e.service,
+            "message": f"The {e.service} is not responding. Check that it is running; retrying in {e.retry_in_s:.0f}s.",
+            "highlighting_boxes": []
+        }
+    except Overloaded as e:
+        print(f"[BACKEND] Turned away: {e}")
+        return busy_result(e)
+    except RequestCancelled as e:
+        print(f"[BACKEND] Processing cancelled ({e})")
+        return {
+            "status": "cancelled",
+            "message": f"Request {e}",
+            "highlighting_boxes": []
+        }
+    except Exception as e:
+        error_msg = f"Error processing screenshot: {str(e)}"
+        print(error_msg, file=sys.stderr)
+        traceback.print_exc(file=sys.stderr)
+        return {
+            "status": "error",
+            "message": error_msg,
+            "highlighting_boxes": []
+        }
+
+def _plan_next_step(prompt, frame, history, on_partial, cancel, session_id):
+    """Asks the planner for the next step (and in plan mode caches the ones after it); None when done."""
+    with stage_pools["planner"].slot(cancel):
+        planner_stats.record_call(session_id)
+        task = generate_next_atomic_task(prompt, frame, history, on_partial=on_partial, cancel=cancel, plan=PLAN_MODE)
+    if task is None or not PLAN_MODE:
+        return task
+    steps = plan_steps(task)
+    plans.store(session_id, prompt, history, steps)
+    return steps[0]
+
+def _overloaded(future):
+    return future.done() and not future.cancelled() and isinstance(future.exception(), Overloaded)
+
+def _run_pipeline(frame, roi_frame, fingerprint, prompt, history, on_partial, cancel, session_id=None,
+                  on_elements=None, speculative=False):
+    """
+    Planner on the whole frame, Omni and element selection on roi_frame (the frame or a
+    crop of it). A step from the result cache replaces both Gemini calls, and in plan
+    mode a cached step replaces the planner call, unless the Omni elements show the
+    screen is not in the state the cache or the plan expected.
+    A speculative run neither reads nor writes the result cache: its history assumes a
+    success the user has not confirmed, and its entry would take the place of the real
+    step's as the one check_outcome drops if the step is tagged a failure.
+    Raises on failure or cancellation.
+    """
+    # Omni parsing does not depend on the planner, so start it first and
+    # let it run while the planner is waiting on Gemini
+    parallel_start = time.time()
+    cancel.check()
+    cached_omni = omni_cache.peek(fingerprint)
+    if cached_omni is None or cached_omni[0] != roi_frame.region:
+        # Fail fast only when Omni is actually going to be called
+        omni_breaker.check()
+    omni_future = _pipeline_executor.submit(tracing.propagate(_timed_omni_api), roi_frame, fingerprint, cancel, session_id)
+    # A full Omni pool turns the request away at once; stop the planner instead of waiting for it
+    omni_future.add_done_callback(lambda f: _overloaded(f) and cancel.cancel("the Omni pool is full"))
+    
+    # Generate atomic task
+    task_gen_start = time.time()
+    cached = None
+    if result_cache is not None and not speculative:
+        with tracing.span("result_cache.lookup"):
+            cached = result_cache.lookup(prompt, history, fingerprint, session_id)
+        if cached is None:
+            print(f"[RESULT CACHE] Miss ({result_cache.stats.summary()})")
+    planned = plans.next_step(session_id, prompt, history) if PLAN_MODE and cached is None else None
+    try:
+        if cached is not None:
+            task = cached.task
+            print(f"[RESULT CACHE] Hit for step {task.get('step')}: {task.get('action')} ({result_cache.stats.summary()})")
+            if on_partial:
+                on_partial({"step": task.get("step"), "action": task.get("action")})
+        elif planned is not None:
+            task = planned
+            print(f"[PLAN] Serving cached step {task['step']}: {task['action']}")
+            if on_partial:
+                on_partial({"step": task["step"], "action": task["action"]})
+        else:
+            task = _plan_next_step(prompt, frame, history, on_partial, cancel, session_id)
+    except Exception:
+        omni_future.cancel()
+        cancel.cancel("planner failed")
+        if _overloaded(omni_future):
+            raise omni_future.exception()
+        raise
+    task_gen_end = time.time()
+    planner_ms = (task_gen_end - task_gen_start) * 1000
+    
+    if task is None:
+        # Nothing left to select, so the Omni result is not needed
+        if omni_future.cancel():
+            print("[BACKEND] Task completed, Omni API call cancelled before it started")
+        else:
+            cancel.cancel("task completed")
+            print("[BACKEND] Task completed, Omni API call still running, cancelling it and discarding the result")
+        return {
+            "status": "completed",
+            "message": "Task completed",
+            "highlighting_boxes": []
+        }
+    
+    omni_result, omni_ms = omni_future.result()
+    parallel_end = time.time()
+    parallel_ms = (parallel_end - parallel_start) * 1000
+    print(f"[BACKEND] Planner + Omni ran concurrently in: {parallel_ms:.2f}ms "
+          f"(planner {planner_ms:.2f}ms, omni {omni_ms:.2f}ms, "
+          f"saved {max(planner_ms + omni_ms - parallel_ms, 0):.2f}ms vs sequential)")
+    
+    # Check if Omni API call was successful
+    if omni_result is None:
+        error_msg = "Omni API failed completely"
+        return {
+            "status": "error",
+            "message": f"Omni API error: {error_msg}",
+            "highlighting_boxes": []
+        }
+    # print('omni_result------\n',omni_result)
+    # Extract screenshot_b64 and element_string from result
+    if isinstance(omni_result, tuple) and len(omni_result) == 2:
+        annotated_b64, element_string = omni_result
+        selector_frame = Frame.from_base64(annotated_b64, region=roi_frame.region, source_size=roi_frame.source_size)
+    else:
+        # Handle case where result might be in different format
+        element_string = omni_result
+        selector_frame = roi_frame
+
+    selection = None
+    if cached is not None:
+        with tracing.span("result_cache.validate"):
+            selection = result_cache.validate(cached, element_string, roi_frame)
+        if selection is None:
+            result_cache.discard(cached, f"icon {cached.icon} ({cached.content!r}) is not on screen")
+            task = _plan_next_step(prompt, frame, history, on_partial, cancel, session_id)
+            if task is None:
+                return {
+                    "status": "completed",
+                    "message": "Task completed",
+                    "highlighting_boxes": []
+                }
+
+    if planned is not None and not expectation_met(planned, element_string):
+        plans.discard(session_id, f"none of {planned['expect']} is on screen")
+        task = _plan_next_step(prompt, frame, history, on_partial, cancel, session_id)
+        if task is None:
+            return {
+                "status": "completed",
+                "message": "Task completed",
+                "highlighting_boxes": []
+            }
+    
+    # Select element
+    cancel.check()
+    if selection is not None:
+        icon, bbox = selection
+        reason = cached.reason
+    else:
+        with tracing.span("selector"), stage_pools["selector"].slot(cancel):
+            icon, bbox, reason = llm2_action_selector(selector_frame, element_string, task['action'],
+                                                      cancel=cancel, screen=roi_frame)
+        if result_cache is not None and not speculative:
+            with tracing.span("result_cache.store"):
+                _store_result(prompt, history, fingerprint, task, icon, bbox, reason, element_string, roi_frame,
+                              session_id)
+    
+    if on_elements:
+        on_elements(element_string, roi_frame)
+
+    # Omni's bboxes are normalized to the frame it parsed; map them onto the screen
+    x1, y1, x2, y2 = roi_frame.to_pixels(bbox)
+    bbox = roi_frame.to_screen(bbox)
+
+    # Format bounding box for frontend: normalized to the screen, plus screenshot pixels
+    highlighting_boxes = [{
+        "x": bbox[0],
+        "y": bbox[1], 
+        "width": bbox[2] - bbox[0],
+        "height": bbox[3] - bbox[1],
+        "pixels": {"x": round(x1), "y": round(y1), "width": round(x2 - x1), "height": round(y2 - y1)},
+        "icon": icon,
+        "reason": reason,
+        "action": task['action']
+    }]
+    
+    return {
+        "status": "success",
+        "highlighting_boxes": highlighting_boxes,
+        "task": task,
+        "icon": icon,
+        "bbox": bbox,
+        "reason": reason
+    }
+
+def _store_result(prompt, history, fingerprint, task, icon, bbox, reason, element_string, roi_frame, session_id):
+    """Stores a freshly selected step in the result cache, with its element's content for validating it later."""
+    table = parse_element_table(element_string)
+    row = table.index_of(int(icon))
+    content = table.contents[row] if row is not None else None
+    result_cache.store(prompt, history, fingerprint, task, icon, roi_frame.to_screen(bbox), reason, content, session_id)
+
+def forget_session(session_id):
+    """Drops everything kept for a session: its plan, speculation, task counts and previous screen."""
+    plans.discard(session_id, "session closed")
+    prefetcher.discard(session_id, "session closed")
+    planner_stats.forget(session_id)
+    incremental_parser.forget(session_id)
+    roi.forget(session_id)
+    if result_cache is not None:
+        result_cache.forget(session_id)
+
+def _start_speculation(session_id, prompt, history, task, frame, roi_frame, fingerprint):
+    """
+    Pre-runs the next step on the current frame, assuming this step will be confirmed
+    as a success. The confirmed request picks the result up in prefetcher.take().
+    """
+    assumed_history = tag_history([dict(entry) for entry in history] + [
+        {"step": task.get("step"), "action": task.get("action")}], success=True)
+
+    def run(cancel):
+        cancel.start_deadline(REQUEST_DEADLINE_S)
+        with tracing.trace(f"speculation-{session_id}") as speculation_trace:
+            result = _run_pipeline(frame, roi_frame, fingerprint, prompt, assumed_history, None, cancel, session_id,
+                                   speculative=True)
+        print(f"[TRACE] Speculation for session {session_id}: {speculation_trace.summary()}")
+        return result
+
+    prefetcher.start(session_id, prompt, assumed_history, fingerprint, run)
@@ -0,0 +1,120 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+# Opt-in: ask the planner for the next action plus the ones expected to follow it, and
+# serve those from the cache on success tags instead of calling the planner every step
+PLAN_MODE = os.getenv("PLANNER_PLAN_MODE", "0") == "1"
+
+
+def plan_steps(task: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The planner's task and the well-formed actions in its 'then' list, in order."""
+    steps = [task]
+    for step in task.get("then") or []:
+        if not (isinstance(step, dict) and isinstance(step.get("action"), str)):
+            break
+        steps.append(step)
+    return [{"step": s.get("step"), "action": s["action"], "expect": _expect(s)} for s in steps]
+
+
+def _expect(step: Dict[str, Any]) -> List[str]:
+    expect = step.get("expect")
+    if not isinstance(expect, list):
+        return []
+    return [text.strip() for text in expect if isinstance(text, str) and text.strip()]
+
+
+def expectation_met(step: Dict[str, Any], element_string: str) -> bool:
+    """
+    True if any of the step's expected texts appears in the Omni element list (a step
+    without expectations cannot be checked and counts as met).
+    """
+    if not step["expect"]:
+        return True
+    elements = element_string.lower()
+    return any(text.lower() in elements for text in step["expect"])
+
+
+class _Plan:
+    def __init__(self, prompt: str, history: List[Dict], steps: List[Dict[str, Any]]):
+        self.prompt = prompt
+        self.base = len(history)
+        self.steps = steps
+
+
+class PlanCache:
+    """
+    The latest plan of each session. A planned step is served when every earlier step of
+    the plan has been done, in order, and the last one was tagged a success; a failure
+    tag (or any other history) discards the plan.
+    """
+
+    def __init__(self):
+        self._plans: Dict[Optional[str], _Plan] = {}
+        self._lock = threading.Lock()
+
+    def store(self, session_id: Optional[str], prompt: str, history: List[Dict], steps: List[Dict[str, Any]]):
+        with self._lock:
+            self._plans[session_id] = _Plan(prompt, history, steps)
+        if len(steps) > 1:
+            print(f"[PLAN] Cached {len(steps) - 1} upcoming steps for session {session_id}")
+
+    def discard(self, session_id: Optional[str], reason: str):
+        with self._lock:
+            plan = self._plans.pop(session_id, None)
+        if plan is not None:
+            print(f"[PLAN] Discarded the plan for session {session_id}: {reason}")
+
+    def next_step(self, session_id: Optional[str], prompt: str, history: List[Dict]) -> Optional[Dict[str, Any]]:
+        """The cached step that follows history, or None if the planner has to be asked."""
+        with self._lock:
+            plan = self._plans.get(session_id)
+        if plan is None:
+            return None
+        done = len(history) - plan.base
+        if plan.prompt != prompt or not history or history[-1].get("status") != "success":
+            # Failure tags and new goals are re-planned; speculative runs never tag failures
+            if history and history[-1].get("status") == "failure":
+                self.discard(session_id, "the last step failed")
+            return None
+        if not 1 <= done < len(plan.steps):
+            return None
+        executed = [entry.get("action") for entry in history[plan.base:]]
+        if executed != [step["action"] for step in plan.steps[:done]]:
+            return None
+        return plan.steps[done]
+
+
+class PlannerStats:
+    """Planner calls and steps per task, per session, reported when a task completes."""
+
+    def __init__(self):
+        self._sessions: Dict[Optional[str], List[int]] = {}  # session -> [planner calls, steps]
+        self.tasks = 0
+        self.calls = 0
+        self.steps = 0
+        self._lock = threading.Lock()
+
+    def record_call(self, session_id: Optional[str]):
+        with self._lock:
+            self._sessions.setdefault(session_id, [0, 0])[0] += 1
+
+    def record_step(self, session_id: Optional[str]):
+        with self._lock:
+            self._sessions.setdefault(session_id, [0, 0])[1] += 1
+
+    def forget(self, session_id: Optional[str]):
+        """Drops a session's unfinished task without counting it."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def task_completed(self, session_id: Optional[str]) -> int:
+        """Closes the session's task and returns the planner calls it took."""
+        with self._lock:
+            calls, steps = self._sessions.pop(session_id, [0, 0])
+            self.tasks += 1
+            self.calls += calls
+            self.steps += steps
+        print(f"[PLAN] Task completed in {steps} steps with {calls} planner calls; "
+              f"{self.calls / self.tasks:.2f} planner calls per completed task over {self.tasks} tasks")
+        return calls
@@ -0,0 +1,211 @@
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Optional, Tuple, Type, TypeVar
+import cancellation
+from cancellation import CancelToken, RequestCancelled, DeadlineExceeded
+import tracing
+
+T = TypeVar("T")
+
+# End-to-end time budget for one step, from screenshot to highlight
+REQUEST_DEADLINE_S = float(os.getenv("REQUEST_DEADLINE_S", "60"))
+
+# Largest share of the request budget each stage may take. The planner and Omni
+# run concurrently, so their shares overlap; the selector gets what is left.
+STAGE_BUDGET_SHARES = {
+    "planner": 0.5,
+    "omni": 0.7,
+    "selector": 0.5,
+}
+
+# Jittered exponential backoff between retries: a uniform delay in [0, min(cap, base * 2^attempt)]
+BACKOFF_BASE_S = 0.5
+BACKOFF_CAP_S = 4.0
+# Do not start another attempt with less than this much of the budget left
+MIN_ATTEMPT_S = 2.0
+
+# Opt-in: if a selector call has not answered after this many seconds, send an
+# identical second call and take whichever answers first (0 disables hedging)
+HEDGE_SELECTOR_AFTER_S = float(os.getenv("HEDGE_SELECTOR_AFTER_S", "0"))
+
+_hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+_random = random.Random()
+
+
+def stage_timeout(cancel: Optional[CancelToken], stage: str, default_s: float) -> float:
+    """Timeout for one call of a stage: its default, capped by its share of the budget and by what is left of it."""
+    timeout = default_s
+    if cancel is not None and cancel.remaining() is not None:
+        timeout = min(timeout, STAGE_BUDGET_SHARES.get(stage, 1.0) * cancel.budget_s, cancel.remaining())
+    return max(timeout, 0.001)
+
+
+def backoff_delay(attempt: int, cancel: Optional[CancelToken] = None) -> Optional[float]:
+    """
+    Delay before retry number attempt + 1, or None if the remaining budget does not
+    leave room for the delay plus another attempt.
+    """
+    delay = _random.uniform(0, min(BACKOFF_CAP_S, BACKOFF_BASE_S * (2 ** attempt)))
+    remaining = cancel.remaining() if cancel is not None else None
+    if remaining is not None and remaining - delay < MIN_ATTEMPT_S:
+        return None
+    return delay
+
+
+def retry_sleep(attempt: int, cancel: Optional[CancelToken], label: str):
+    """Sleeps before the next attempt; raises DeadlineExceeded if there is no budget left for one."""
+    delay = backoff_delay(attempt, cancel)
+    if delay is None:
+        print(f"[RESILIENCE] {label}: not enough of the request budget left to retry")
+        raise DeadlineExceeded(f"had no time left to retry {label} within its {cancel.budget_s:.0f}s deadline")
+    print(f"[RESILIENCE] {label}: retrying in {delay:.2f}s")
+    cancellation.sleep(delay, cancel)
+
+
+def call_with_retries(fn: Callable[[], T], cancel: Optional[CancelToken], label: str,
+                      retry_on: Tuple[Type[BaseException], ...], max_attempts: int = 3) -> T:
+    """Calls fn, retrying the given transient errors with jittered backoff inside the request budget."""
+    for attempt in range(max_attempts):
+        cancellation.check(cancel)
+        try:
+            return fn()
+        except RequestCancelled:
+            raise
+        except retry_on as e:
+            print(f"[RESILIENCE] {label}: attempt {attempt + 1} failed: {e}")
+            if attempt == max_attempts - 1:
+                raise
+            retry_sleep(attempt, cancel, label)
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a service whose circuit breaker is open."""
+
+    def __init__(self, service: str, retry_in_s: float):
+        super().__init__(f"{service} is unavailable, not retrying for another {retry_in_s:.0f}s")
+        self.service = service
+        self.retry_in_s = retry_in_s
+
+
+class CircuitBreaker:
+    """
+    Counts consecutive failed calls to a service. After failure_threshold of them the
+    circuit opens and calls fail fast with CircuitOpen for reset_timeout_s; then one
+    trial call is let through (half-open), and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, service: str, failure_threshold: int = 3, reset_timeout_s: float = 30.0):
+        self.service = service
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout_s:
+            return "open"
+        return "half-open"
+
+    def check(self):
+        """Raises CircuitOpen if calls are currently being refused, without taking the half-open trial."""
+        with self._lock:
+            if self._state() == "open" or (self._state() == "half-open" and self._trial_in_flight):
+                raise CircuitOpen(self.service, self._retry_in())
+
+    def allow(self) -> bool:
+        """
+        Call before each attempt; raises CircuitOpen while the circuit is open. Returns
+        True if this attempt is the half-open trial, which must then be ended with
+        record_success(), record_failure() or release_trial().
+        """
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return False
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                print(f"[RESILIENCE] {self.service} circuit half-open, sending a trial call")
+                return True
+            raise CircuitOpen(self.service, self._retry_in())
+
+    def release_trial(self):
+        """Ends a trial call that neither succeeded nor failed (e.g. it was cancelled); the next call is the trial."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def _retry_in(self) -> float:
+        return max(self.reset_timeout_s - (time.monotonic() - self.opened_at), 0.0)
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                print(f"[RESILIENCE] {self.service} circuit closed")
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                print(f"[RESILIENCE] {self.service} circuit opened after {self.failures} consecutive failures")
+            self._trial_in_flight = False
+
+
+def hedged(call: Callable[[Optional[CancelToken]], T], hedge_after_s: float, cancel: Optional[CancelToken],
+           label: str) -> T:
+    """
+    Runs call(token); if it has not finished after hedge_after_s, starts an identical
+    second call and returns the first successful result, cancelling the other call.
+    Each call gets a child of cancel, so cancelling the request stops both.
+    """
+    if hedge_after_s <= 0:
+        return call(cancel)
+    if cancel is None:
+        cancel = CancelToken()
+
+    tokens = [cancel.child()]
+    futures = [_hedge_executor.submit(tracing.propagate(call), tokens[0])]
+    done, _ = wait(futures, timeout=hedge_after_s)
+    if not done:
+        cancellation.check(cancel)
+        print(f"[RESILIENCE] {label}: no answer after {hedge_after_s:.1f}s, sending a hedged call")
+        tokens.append(cancel.child())
+        futures.append(_hedge_executor.submit(tracing.propagate(call), tokens[1]))
+
+    error = None
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result = future.result()
+            except RequestCancelled:
+                continue
+            except Exception as e:
+                error = e
+                continue
+            for token, other in zip(tokens, futures):
+                if other is not future:
+                    token.cancel(f"{label}: hedged call answered first")
+            if len(futures) > 1:
+                print(f"[RESILIENCE] {label}: {'hedged' if future is futures[1] else 'original'} call answered first")
+            return result
+        cancellation.check(cancel)
+    if error is not None:
+        raise error
+    cancel.check()
+    raise RequestCancelled(f"{label}: hedged calls cancelled")
@@ -0,0 +1,308 @@
+"""
+Persistent cache of step results for workflows the user runs again and again.
+
+For a (goal, history, screen) state seen before, the planner's task and the selector's
+element are served from a SQLite database on local disk instead of calling Gemini.
+Entries are keyed by the normalized goal and the actions and statuses of the history;
+the screen fingerprint is compared, within the usual tile tolerance, against the
+entries stored under that key. Omni still parses every screen, and a cached element is
+only used if the current element list still has it in the same place.
+
+Off by default (RESULT_CACHE=1 turns it on), like the other features that can serve a
+stale answer. What it keeps on disk, in RESULT_CACHE_PATH (~/.cache/bubble by default),
+for up to RESULT_CACHE_MAX_AGE_S (14 days) after each entry was stored:
+  - a hash of the goal and history, and each screen's fingerprint (a 256x144 grayscale
+    thumbnail, see screen_cache.DETAIL_CELLS);
+  - the planner's task, including the action text;
+  - the chosen element's bbox, its OCR'd content and the selector's reason.
+Delete the file to clear it.
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import zlib
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from element_index import screen_bboxes
+from element_table import parse_element_table
+from frame import Frame
+from screen_cache import ScreenFingerprint, TILE_TOLERANCE, MAX_CHANGED_TILES, MAX_CHANGED_CELLS
+
+# Off by default; RESULT_CACHE=1 turns it on
+RESULT_CACHE = os.getenv("RESULT_CACHE", "0") == "1"
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH",
+                              os.path.join(os.path.expanduser("~"), ".cache", "bubble", "result_cache.sqlite3"))
+# Entries kept on disk (least recently used go first) and how long one stays usable
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "5000"))
+RESULT_CACHE_MAX_AGE_S = float(os.getenv("RESULT_CACHE_MAX_AGE_S", str(14 * 24 * 3600)))
+
+# Screens stored under one key that a lookup compares, newest first
+MAX_CANDIDATES = 16
+# A cached element is still on screen if an element with its content lies within this
+# distance of its bbox on every side (normalized to the screen)
+ELEMENT_BBOX_TOLERANCE = 0.01
+# Expired and surplus entries are deleted every this many stores
+EVICT_EVERY = 20
+
+_NORMALIZE = re.compile(r"[\W_]+", re.UNICODE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL,
+    tiles BLOB NOT NULL,
+    grid TEXT NOT NULL,
+    detail BLOB,
+    task TEXT NOT NULL,
+    icon INTEGER NOT NULL,
+    bbox TEXT NOT NULL,
+    reason TEXT,
+    content TEXT,
+    stored_at REAL NOT NULL,
+    used_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS results_by_key ON results (key, stored_at);
+CREATE INDEX IF NOT EXISTS results_by_use ON results (used_at);
+"""
+
+
+def normalize_goal(prompt: str) -> str:
+    return _NORMALIZE.sub(" ", (prompt or "").lower()).strip()
+
+
+def history_status(history: List[Dict]) -> List[Tuple[str, Optional[str]]]:
+    """The history as the key sees it: each step's normalized action and its status."""
+    return [(normalize_goal(entry.get('action')), entry.get('status')) for entry in history]
+
+
+def cache_key(prompt: str, history: List[Dict]) -> str:
+    text = json.dumps([normalize_goal(prompt), history_status(history)], separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedResult:
+    """A stored step: the planner's task and the element the selector picked (bbox normalized to the screen)."""
+
+    def __init__(self, entry_id: int, task: Dict[str, Any], icon: int, bbox: List[float], reason: str,
+                 content: Optional[str]):
+        self.entry_id = entry_id
+        self.task = task
+        self.icon = icon
+        self.bbox = bbox
+        self.reason = reason
+        self.content = content
+
+
+class ResultCacheStats:
+    def __init__(self):
+        self.lookups = 0
+        self.hits = 0
+        self.rejected = 0
+        self.stores = 0
+        self.lookup_ms = 0.0
+        self._lock = threading.Lock()
+
+    def record_lookup(self, hit: bool, ms: float):
+        with self._lock:
+            self.lookups += 1
+            self.hits += int(hit)
+            self.lookup_ms += ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Counts, the hit rate (hits whose element was still on screen) and the mean lookup time."""
+        with self._lock:
+            served = self.hits - self.rejected
+            return {"lookups": self.lookups, "hits": self.hits, "rejected": self.rejected, "stores": self.stores,
+                    "hit_rate": round(served / self.lookups * 100, 1) if self.lookups else 0.0,
+                    "lookup_mean_ms": round(self.lookup_ms / self.lookups, 2) if self.lookups else 0.0}
+
+    def summary(self) -> str:
+        stats = self.to_dict()
+        return (f"lookups={stats['lookups']} hits={stats['hits']} rejected={stats['rejected']} "
+                f"stores={stats['stores']} hit_rate={stats['hit_rate']:.1f}% lookup_mean={stats['lookup_mean_ms']:.2f}ms")
+
+
+def _stored_fingerprint(tiles: bytes, grid: str, detail: Optional[bytes]) -> ScreenFingerprint:
+    # Detail cells compress well (most of a screen is flat), so they are stored with zlib
+    return ScreenFingerprint(tiles, tuple(json.loads(grid)), zlib.decompress(detail) if detail is not None else None)
+
+
+class ResultCache:
+    """
+    The on-disk cache, bounded by entry count and age. The database is opened on first
+    use and shared by all threads. Each session's last served or stored entry is
+    remembered, so a step the user then tags as a failure is dropped from the cache.
+    """
+
+    def __init__(self, path: str = RESULT_CACHE_PATH, max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+                 max_age_s: float = RESULT_CACHE_MAX_AGE_S, tolerance: int = TILE_TOLERANCE,
+                 max_changed_tiles: int = MAX_CHANGED_TILES, max_changed_cells: int = MAX_CHANGED_CELLS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_s = max_age_s
+        self.tolerance = tolerance
+        self.max_changed_tiles = max_changed_tiles
+        self.max_changed_cells = max_changed_cells
+        self.stats = ResultCacheStats()
+        self._db: Optional[sqlite3.Connection] = None
+        self._disabled = False
+        self._lock = threading.Lock()
+        self._last_entry: Dict[Optional[str], Tuple[int, str]] = {}
+
+    def _matches(self, fingerprint: ScreenFingerprint, stored: ScreenFingerprint) -> bool:
+        return fingerprint.matches(stored, self.tolerance, self.max_changed_tiles, self.max_changed_cells)
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if self._db is None and not self._disabled:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=NORMAL")
+                db.executescript(_SCHEMA)
+                if "detail" not in [column[1] for column in db.execute("PRAGMA table_info(results)")]:
+                    # Entries from before screens had detail cells would match too loosely
+                    db.execute("DELETE FROM results")
+                    db.execute("ALTER TABLE results ADD COLUMN detail BLOB")
+                self._db = db
+                self._evict()
+                count = db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+                print(f"[RESULT CACHE] Opened {self.path} with {count} entries")
+            except (OSError, sqlite3.Error) as e:
+                self._disabled = True
+                print(f"[RESULT CACHE] Disabled, cannot open {self.path}: {e}")
+        return self._db
+
+    def lookup(self, prompt: str, history: List[Dict], fingerprint: ScreenFingerprint,
+               session_id: Optional[str] = None) -> Optional[CachedResult]:
+        """The stored step for this goal, history and screen, or None."""
+        start = time.perf_counter()
+        found = None
+        with self._lock:
+            db = self._connection()
+            if db is not None:
+                now = time.time()
+                rows = db.execute(
+                    "SELECT id, tiles, grid, detail, task, icon, bbox, reason, content FROM results "
+                    "WHERE key = ? AND stored_at > ? ORDER BY stored_at DESC LIMIT ?",
+                    (cache_key(prompt, history), now - self.max_age_s, MAX_CANDIDATES)).fetchall()
+                for entry_id, tiles, grid, detail, task, icon, bbox, reason, content in rows:
+                    if self._matches(fingerprint, _stored_fingerprint(tiles, grid, detail)):
+                        db.execute("UPDATE results SET used_at = ?, hits = hits + 1 WHERE id = ?", (now, entry_id))
+                        found = CachedResult(entry_id, json.loads(task), icon, json.loads(bbox), reason, content)
+                        self._last_entry[session_id] = (entry_id, normalize_goal(found.task.get('action')))
+                        break
+        self.stats.record_lookup(found is not None, (time.perf_counter() - start) * 1000)
+        return found
+
+    def validate(self, cached: CachedResult, element_string: str, frame: Frame) -> Optional[Tuple[int, List[float]]]:
+        """
+        Finds the cached element in the current Omni element list (bboxes normalized to
+        frame): same content, bbox within ELEMENT_BBOX_TOLERANCE. Returns its (icon, bbox
+        normalized to frame), or None if it is not on screen.
+        """
+        table = parse_element_table(element_string)
+        if not len(table):
+            return None
+        distance = np.abs(screen_bboxes(table, frame) - np.asarray(cached.bbox)).max(axis=1)
+        content = normalize_goal(cached.content)
+        best = None
+        for row in np.flatnonzero(distance <= ELEMENT_BBOX_TOLERANCE).tolist():
+            if normalize_goal(table.contents[row]) != content:
+                continue
+            # Prefer the same icon number, then the closest bbox
+            rank = (int(table.icons[row]) != cached.icon, distance[row])
+            if best is None or rank < best[0]:
+                best = (rank, row)
+        if best is None:
+            return None
+        return int(table.icons[best[1]]), table.bboxes[best[1]].tolist()
+
+    def store(self, prompt: str, history: List[Dict], fingerprint: ScreenFingerprint, task: Dict[str, Any],
+              icon: int, bbox: List[float], reason: str, content: Optional[str], session_id: Optional[str] = None):
+        """Stores a step the pipeline just computed, replacing any entry for the same state."""
+        with self._lock:
+            db = self._connection()
+            if db is None:
+                return
+            key = cache_key(prompt, history)
+            now = time.time()
+            try:
+                rows = db.execute("SELECT id, tiles, grid, detail FROM results WHERE key = ? ORDER BY stored_at DESC LIMIT ?",
+                                  (key, MAX_CANDIDATES)).fetchall()
+                stale = [entry_id for entry_id, tiles, grid, detail in rows
+                         if self._matches(fingerprint, _stored_fingerprint(tiles, grid, detail))]
+                db.execute("BEGIN")
+                db.executemany("DELETE FROM results WHERE id = ?", [(entry_id,) for entry_id in stale])
+                cursor = db.execute(
+                    "INSERT INTO results (key, tiles, grid, detail, task, icon, bbox, reason, content, stored_at, used_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, fingerprint.tiles, json.dumps(list(fingerprint.grid)),
+                     zlib.compress(fingerprint.detail) if fingerprint.detail is not None else None,
+                     json.dumps(task), int(icon),
+                     json.dumps([float(v) for v in bbox]), reason, content, now, now))
+                db.execute("COMMIT")
+            except sqlite3.Error as e:
+                if db.in_transaction:
+                    db.execute("ROLLBACK")
+                print(f"[RESULT CACHE] Could not store step: {e}")
+                return
+            self._last_entry[session_id] = (cursor.lastrowid, normalize_goal(task.get('action')))
+            with self.stats._lock:
+                self.stats.stores += 1
+            if self.stats.stores % EVICT_EVERY == 0:
+                self._evict()
+
+    def _evict(self):
+        """Deletes expired entries, then the least recently used beyond max_entries (lock held)."""
+        db = self._db
+        db.execute("DELETE FROM results WHERE stored_at <= ?", (time.time() - self.max_age_s,))
+        db.execute("DELETE FROM results WHERE id IN (SELECT id FROM results ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                   (self.max_entries,))
+
+    def discard(self, cached: CachedResult, reason: str):
+        with self.stats._lock:
+            self.stats.rejected += 1
+        with self._lock:
+            db = self._connection()
+            if db is not None:
+                db.execute("DELETE FROM results WHERE id = ?", (cached.entry_id,))
+        print(f"[RESULT CACHE] Dropped the entry for step {cached.task.get('step')}: {reason}")
+
+    def check_outcome(self, session_id: Optional[str], history: List[Dict]):
+        """Drops the session's last served or stored step if the history now tags it a failure."""
+        with self._lock:
+            last = self._last_entry.pop(session_id, None)
+            if last is None or not history or history[-1].get('status') != 'failure':
+                return
+            entry_id, action = last
+            if normalize_goal(history[-1].get('action')) != action:
+                return
+            db = self._connection()
+            if db is not None:
+                db.execute("DELETE FROM results WHERE id = ?", (entry_id,))
+        print(f"[RESULT CACHE] Dropped the entry for a step tagged as a failure: {history[-1].get('action')}")
+
+    def forget(self, session_id: Optional[str]):
+        with self._lock:
+            self._last_entry.pop(session_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._last_entry.clear()
+            db = self._connection()
+            if db is not None:
+                db.execute("DELETE FROM results")
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,82 @@
+import os
+import threading
+from typing import Dict, Optional, Tuple
+from frame import Frame, FULL_SCREEN, Rect
+from screen_cache import ScreenFingerprint, TILE_TOLERANCE
+from incremental_parse import dirty_regions
+
+# Region of the screen that Omni parsing and element selection see (the planner always
+# gets the whole screen):
+# - "window": the foreground application window, if the client sent its rect (see
+#   foreground_window; the backend cannot look it up itself, as in server mode the
+#   screen is not its own)
+# - "changed": the foreground window, else the part of the screen that changed since
+#   the session's previous step
+# - "off": the whole screen
+ROI_MODE = os.getenv("ROI_MODE", "window")
+# Only crop when it removes at least this fraction of the screen
+ROI_MIN_SAVING = 0.1
+# Grown by this fraction of the screen on each side, so window borders and shadows stay in
+ROI_PADDING = 0.005
+
+_previous: Dict[Optional[str], ScreenFingerprint] = {}
+_previous_lock = threading.Lock()
+
+
+def changed_rect(previous: Optional[ScreenFingerprint], fingerprint: ScreenFingerprint) -> Optional[Rect]:
+    """Bounding rect of the tiles that changed since previous, or None if nothing (or everything) is known to have."""
+    if previous is None:
+        return None
+    changed = fingerprint.changed_tiles(previous, TILE_TOLERANCE)
+    if not changed:
+        return None
+    regions = dirty_regions(changed, fingerprint.grid)
+    return (min(r[0] for r in regions), min(r[1] for r in regions),
+            max(r[2] for r in regions), max(r[3] for r in regions))
+
+
+def _clip(rect: Rect) -> Rect:
+    return (max(rect[0] - ROI_PADDING, 0.0), max(rect[1] - ROI_PADDING, 0.0),
+            min(rect[2] + ROI_PADDING, 1.0), min(rect[3] + ROI_PADDING, 1.0))
+
+
+def region_of_interest(fingerprint: ScreenFingerprint, session_id: Optional[str] = None,
+                       window_rect: Optional[Rect] = None, mode: str = ROI_MODE) -> Tuple[Rect, str]:
+    """
+    Returns (normalized screen rect, source) for the region to parse: the foreground
+    window (window_rect, as the client reported it), the changed region or the whole
+    screen, per mode. The fingerprint is remembered as the session's previous screen.
+    """
+    with _previous_lock:
+        previous = _previous.get(session_id)
+        _previous[session_id] = fingerprint
+    if mode == "off":
+        return FULL_SCREEN, "screen"
+
+    rect, source = window_rect, "foreground window"
+    if rect is None and mode == "changed":
+        rect, source = changed_rect(previous, fingerprint), "changed region"
+    if rect is None:
+        return FULL_SCREEN, "screen"
+    rect = _clip(rect)
+    if rect[2] <= rect[0] or rect[3] <= rect[1] or (rect[2] - rect[0]) * (rect[3] - rect[1]) > 1 - ROI_MIN_SAVING:
+        return FULL_SCREEN, "screen"
+    return rect, source
+
+
+def forget(session_id: Optional[str]):
+    with _previous_lock:
+        _previous.pop(session_id, None)
+
+
+def crop_to_roi(frame: Frame, fingerprint: ScreenFingerprint, session_id: Optional[str] = None,
+                window_rect: Optional[Rect] = None) -> Frame:
+    """The part of frame that Omni and the selector should see; bboxes on it map back with to_screen()."""
+    rect, source = region_of_interest(fingerprint, session_id, window_rect)
+    if rect == FULL_SCREEN:
+        return frame
+    cropped = frame.crop(frame.from_screen(rect))
+    region = cropped.region
+    print(f"[ROI] Parsing the {source}: {(region[2] - region[0]) * (region[3] - region[1]) * 100:.0f}% "
+          f"of the screen at {cropped.size[0]}x{cropped.size[1]}")
+    return cropped
@@ -0,0 +1,158 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+
+# Fingerprint grid: the screen is reduced to one mean-luminance value per tile
+FINGERPRINT_GRID = (32, 18)
+
+# Each tile is also split into DETAIL_CELLS x DETAIL_CELLS cells. A change too small to
+# move a tile's mean, like a few glyphs in a 60x60-pixel tile, still moves a cell's.
+DETAIL_CELLS = 8
+
+# A tile (or detail cell) counts as changed if its mean luminance moved by more than this (0-255)
+TILE_TOLERANCE = int(os.getenv("FINGERPRINT_TOLERANCE", "4"))
+# Number of changed tiles still treated as the same screen
+MAX_CHANGED_TILES = int(os.getenv("FINGERPRINT_MAX_CHANGED_TILES", "0"))
+# Number of changed detail cells (outside changed tiles) still treated as the same screen.
+# A blinking caret or a ticking clock moves one to three cells, so a live desktop keeps
+# matching; the price is that a change of a glyph or two can too. 0 makes every cell count.
+MAX_CHANGED_CELLS = int(os.getenv("FINGERPRINT_MAX_CHANGED_CELLS", "4"))
+
+OMNI_CACHE_MAX_ENTRIES = 16
+OMNI_CACHE_MAX_AGE_S = 300
+
+
+class ScreenFingerprint:
+    """
+    Tile-hash of a screenshot: the mean luminance of each cell of a fixed grid, plus the
+    same at DETAIL_CELLS times the resolution to catch small changes within a tile.
+    Cheap to compute and compare, and tolerant to tiny pixel differences.
+    A fingerprint without detail (e.g. stored by an older version) compares by tiles only.
+    """
+
+    def __init__(self, tiles: bytes, grid: Tuple[int, int] = FINGERPRINT_GRID, detail: Optional[bytes] = None):
+        self.tiles = tiles
+        self.grid = grid
+        self.detail = detail
+
+    @classmethod
+    def from_image(cls, image: Image.Image, grid: Tuple[int, int] = FINGERPRINT_GRID) -> "ScreenFingerprint":
+        # BOX resampling averages every source pixel in a cell into one output pixel
+        detail = image.convert("L").resize((grid[0] * DETAIL_CELLS, grid[1] * DETAIL_CELLS), Image.BOX)
+        tiles = detail.resize(grid, Image.BOX).tobytes()
+        return cls(tiles, grid, detail.tobytes())
+
+    def _detail_cells(self) -> np.ndarray:
+        cols, rows = self.grid
+        return np.frombuffer(self.detail, dtype=np.uint8).reshape(rows, DETAIL_CELLS, cols, DETAIL_CELLS)
+
+    def _moved_tiles(self, other: "ScreenFingerprint", tolerance: int) -> np.ndarray:
+        return np.abs(np.frombuffer(self.tiles, dtype=np.uint8).astype(np.int16)
+                      - np.frombuffer(other.tiles, dtype=np.uint8)) > tolerance
+
+    def _moved_cells(self, other: "ScreenFingerprint", tolerance: int) -> Optional[np.ndarray]:
+        """Per tile (row-major), the number of its detail cells that moved; None without detail."""
+        if self.detail is None or other.detail is None:
+            return None
+        cells = np.abs(self._detail_cells().astype(np.int16) - other._detail_cells()) > tolerance
+        return cells.sum(axis=(1, 3)).ravel()
+
+    def changed_tiles(self, other: "ScreenFingerprint", tolerance: int = TILE_TOLERANCE) -> List[int]:
+        """
+        Returns the indices (row-major) of tiles that differ, or have a detail cell that
+        differs, by more than tolerance: every region that needs looking at again.
+        """
+        if self.grid != other.grid:
+            return list(range(self.grid[0] * self.grid[1]))
+        moved = self._moved_tiles(other, tolerance)
+        cells = self._moved_cells(other, tolerance)
+        if cells is not None:
+            moved |= cells > 0
+        return np.flatnonzero(moved).tolist()
+
+    def matches(self, other: "ScreenFingerprint", tolerance: int = TILE_TOLERANCE,
+                max_changed_tiles: int = MAX_CHANGED_TILES, max_changed_cells: int = MAX_CHANGED_CELLS) -> bool:
+        """
+        Whether other shows the same screen: at most max_changed_tiles tiles moved, and at
+        most max_changed_cells detail cells moved in the tiles that did not.
+        """
+        if self.grid != other.grid:
+            return False
+        if self.tiles == other.tiles and (self.detail == other.detail or self.detail is None or other.detail is None):
+            return True
+        moved = self._moved_tiles(other, tolerance)
+        if moved.sum() > max_changed_tiles:
+            return False
+        cells = self._moved_cells(other, tolerance)
+        return cells is None or cells[~moved].sum() <= max_changed_cells
+
+
+class ScreenCache:
+    """
+    Small LRU cache keyed by screen fingerprint, bounded by entry count and age.
+    A lookup hits when a stored fingerprint matches within the tile tolerance.
+    """
+
+    def __init__(self, max_entries: int = OMNI_CACHE_MAX_ENTRIES, max_age_s: float = OMNI_CACHE_MAX_AGE_S,
+                 tolerance: int = TILE_TOLERANCE, max_changed_tiles: int = MAX_CHANGED_TILES,
+                 max_changed_cells: int = MAX_CHANGED_CELLS):
+        self.max_entries = max_entries
+        self.max_age_s = max_age_s
+        self.tolerance = tolerance
+        self.max_changed_tiles = max_changed_tiles
+        self.max_changed_cells = max_changed_cells
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # tiles -> (fingerprint, value, stored_at)
+        self._lock = threading.Lock()
+
+    def _evict_expired(self, now: float):
+        for key in [k for k, (_, _, stored_at) in self._entries.items() if now - stored_at > self.max_age_s]:
+            del self._entries[key]
+
+    def _matches(self, fingerprint: ScreenFingerprint, stored: ScreenFingerprint) -> bool:
+        return fingerprint.matches(stored, self.tolerance, self.max_changed_tiles, self.max_changed_cells)
+
+    def _find(self, fingerprint: ScreenFingerprint):
+        self._evict_expired(time.time())
+        entry = self._entries.get(fingerprint.tiles)
+        # Equal tiles can still differ in detail
+        if entry is not None and self._matches(fingerprint, entry[0]):
+            return entry
+        # Most recent first, since consecutive steps are the likely match
+        for key, candidate in reversed(self._entries.items()):
+            if self._matches(fingerprint, candidate[0]):
+                return candidate
+        return None
+
+    def peek(self, fingerprint: ScreenFingerprint) -> Optional[Any]:
+        """Like get(), but does not count towards the stats or refresh the entry."""
+        with self._lock:
+            entry = self._find(fingerprint)
+            return entry[1] if entry is not None else None
+
+    def get(self, fingerprint: ScreenFingerprint) -> Optional[Any]:
+        with self._lock:
+            entry = self._find(fingerprint)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry[0].tiles)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, fingerprint: ScreenFingerprint, value: Any):
+        with self._lock:
+            self._entries[fingerprint.tiles] = (fingerprint, value, time.time())
+            self._entries.move_to_end(fingerprint.tiles)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> str:
+        lookups = self.hits + self.misses
+        hit_rate = (self.hits / lookups * 100) if lookups else 0.0
+        return f"hits={self.hits} misses={self.misses} hit_rate={hit_rate:.1f}% entries={len(self._entries)}"
@@ -0,0 +1,258 @@
+"""
+In-process screen capture with a shared-memory frame ring.
+
+Frames are grabbed as raw pixels (with mss when installed, else PIL.ImageGrab) and
+written into a ring of slots in a multiprocessing.shared_memory block; the pipeline
+reads them back as Frames. Nothing is PNG encoded or decoded and nothing touches the
+filesystem between the capture and the pipeline. The ring is named, so a capture
+helper in another process can attach to it and write frames the same way.
+"""
+import os
+import time
+import struct
+import threading
+from multiprocessing import shared_memory
+from typing import Callable, Dict, Optional, Tuple
+from PIL import Image
+from frame import Frame
+
+# Frames kept in the ring; a reader holding an old frame number can read it until it is overwritten
+CAPTURE_RING_SLOTS = 3
+
+# Ring header: magic, slot count, slot size in bytes, frames written so far
+_HEADER = struct.Struct("<4sIQQ")
+# Slot header: sequence (odd while being written), width, height, raw mode, captured at (time.time())
+_SLOT_HEADER = struct.Struct("<QII8sd")
+_MAGIC = b"BBFR"
+
+# (width, height, raw mode understood by Image.frombuffer, pixel buffer)
+RawFrame = Tuple[int, int, str, memoryview]
+
+# Rings created by this process; attaching to one of them must leave its tracking alone
+_created = set()
+
+
+class FrameRing:
+    """
+    Fixed-size ring of raw frames in shared memory. One writer at a time; readers copy
+    a slot out and use its sequence number (a seqlock) to detect that the writer
+    overwrote it meanwhile.
+    """
+
+    def __init__(self, slot_bytes: int, slots: int = CAPTURE_RING_SLOTS, name: Optional[str] = None,
+                 create: bool = True):
+        if create:
+            self.slot_bytes = slot_bytes
+            self.slots = slots
+            size = _HEADER.size + slots * (_SLOT_HEADER.size + slot_bytes)
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            _created.add(self._shm.name)
+            _HEADER.pack_into(self._shm.buf, 0, _MAGIC, slots, slot_bytes, 0)
+            for slot in range(slots):
+                _SLOT_HEADER.pack_into(self._shm.buf, self._slot_offset(slot), 0, 0, 0, b"", 0.0)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            if os.name == "posix" and self._shm.name not in _created:
+                # Before Python 3.13 an attaching process also registers the block with its
+                # resource tracker, which would unlink it when this process exits
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(self._shm._name, "shared_memory")
+            magic, self.slots, self.slot_bytes, _ = _HEADER.unpack_from(self._shm.buf, 0)
+            if magic != _MAGIC:
+                raise ValueError(f"shared memory {name} is not a frame ring")
+        self.owner = create
+        self._write_lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def _slot_offset(self, slot: int) -> int:
+        return _HEADER.size + slot * (_SLOT_HEADER.size + self.slot_bytes)
+
+    @property
+    def valid(self) -> bool:
+        """False once the owner has closed the ring."""
+        return _HEADER.unpack_from(self._shm.buf, 0)[0] == _MAGIC
+
+    @property
+    def frames_written(self) -> int:
+        return _HEADER.unpack_from(self._shm.buf, 0)[3]
+
+    def write(self, width: int, height: int, raw_mode: str, pixels) -> int:
+        """Copies one frame into the next slot and returns its frame number."""
+        pixels = memoryview(pixels).cast("B")
+        if pixels.nbytes > self.slot_bytes:
+            raise ValueError(f"{width}x{height} frame of {pixels.nbytes} bytes does not fit {self.slot_bytes}-byte slots")
+        with self._write_lock:
+            number = self.frames_written
+            offset = self._slot_offset(number % self.slots)
+            buf = self._shm.buf
+            sequence = _SLOT_HEADER.unpack_from(buf, offset)[0]
+            _SLOT_HEADER.pack_into(buf, offset, sequence + 1, 0, 0, b"", 0.0)
+            data = offset + _SLOT_HEADER.size
+            buf[data:data + pixels.nbytes] = pixels
+            _SLOT_HEADER.pack_into(buf, offset, sequence + 2, width, height, raw_mode.encode("ascii"), time.time())
+            _HEADER.pack_into(buf, 0, _MAGIC, self.slots, self.slot_bytes, number + 1)
+        return number
+
+    def read(self, number: Optional[int] = None) -> Optional[Tuple[Frame, float]]:
+        """
+        Returns (frame, captured_at) for a frame number (the latest frame if None), or
+        None if there is no such frame or it has been overwritten.
+        """
+        written = self.frames_written
+        if number is None:
+            number = written - 1
+        if number < 0 or number >= written or number < written - self.slots:
+            return None
+        offset = self._slot_offset(number % self.slots)
+        buf = self._shm.buf
+        sequence, width, height, raw_mode, captured_at = _SLOT_HEADER.unpack_from(buf, offset)
+        if sequence % 2:
+            return None
+        data = offset + _SLOT_HEADER.size
+        raw_mode = raw_mode.rstrip(b"\0").decode("ascii")
+        bytes_per_pixel = 3 if raw_mode in ("RGB", "BGR") else 4
+        # An RGB image never shares its buffer, so this is the one copy out of the slot
+        with buf[data:data + width * height * bytes_per_pixel] as pixels:
+            image = Image.frombuffer("RGB", (width, height), pixels, "raw", raw_mode, 0, 1)
+        if _SLOT_HEADER.unpack_from(buf, offset)[0] != sequence or self.frames_written - number > self.slots:
+            return None
+        return Frame(image), captured_at
+
+    def close(self):
+        if self.owner:
+            # Readers in other processes may keep the memory mapped after the unlink (on
+            # Windows it lives on while any process has a handle), so tell them it is dead
+            _HEADER.pack_into(self._shm.buf, 0, b"\0" * 4, self.slots, self.slot_bytes, 0)
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+            _created.discard(self._shm.name)
+
+
+def _mss_grabber() -> Optional[Callable[[], RawFrame]]:
+    try:
+        import mss
+    except ImportError:
+        return None
+    local = threading.local()
+
+    def grab() -> RawFrame:
+        # mss handles are per thread on Windows and X11
+        if not hasattr(local, "sct"):
+            local.sct = mss.mss()
+        shot = local.sct.grab(local.sct.monitors[1])
+        return shot.width, shot.height, "BGRX", memoryview(shot.raw)
+    return grab
+
+
+def _pil_grabber() -> Callable[[], RawFrame]:
+    from PIL import ImageGrab
+
+    def grab() -> RawFrame:
+        image = ImageGrab.grab().convert("RGB")
+        return image.width, image.height, "RGB", memoryview(image.tobytes())
+    return grab
+
+
+def default_grabber() -> Callable[[], RawFrame]:
+    """The fastest available way to grab the primary screen as raw pixels."""
+    return _mss_grabber() or _pil_grabber()
+
+
+class ScreenCapturer:
+    """
+    Grabs the screen into a FrameRing on request and hands frames to the pipeline.
+    The ring is created on the first capture, sized for the screen, and recreated if
+    the screen grows.
+    """
+
+    def __init__(self, grab: Optional[Callable[[], RawFrame]] = None, slots: int = CAPTURE_RING_SLOTS):
+        self._grab = grab
+        self.slots = slots
+        self.ring: Optional[FrameRing] = None
+        self._lock = threading.Lock()
+
+    def capture(self) -> int:
+        """Grabs the screen and returns the frame number to read it back with frame()."""
+        with self._lock:
+            if self._grab is None:
+                self._grab = default_grabber()
+            width, height, raw_mode, pixels = self._grab()
+            if self.ring is None or pixels.nbytes > self.ring.slot_bytes:
+                if self.ring is not None:
+                    self.ring.close()
+                self.ring = FrameRing(pixels.nbytes, self.slots)
+                print(f"[CAPTURE] Frame ring {self.ring.name}: {self.slots} slots of {width}x{height} {raw_mode}")
+            return self.ring.write(width, height, raw_mode, pixels)
+
+    def frame(self, number: Optional[int] = None) -> Optional[Frame]:
+        """The captured frame (the latest if number is None), or None if it is gone."""
+        ring = self.ring
+        if ring is None:
+            return None
+        read = ring.read(number)
+        return read[0] if read is not None else None
+
+    def close(self):
+        with self._lock:
+            if self.ring is not None:
+                self.ring.close()
+                self.ring = None
+
+
+capturer = ScreenCapturer()
+
+# Rings of other processes this one has attached to, by name
+_attached: Dict[str, FrameRing] = {}
+_attached_lock = threading.Lock()
+
+
+def _ring_gone(ring: FrameRing) -> bool:
+    """Whether an attached ring's owner has closed it (or, on POSIX, exited without closing it)."""
+    if not ring.valid:
+        return True
+    if os.name != "posix":
+        return False
+    try:
+        FrameRing(0, name=ring.name, create=False).close()
+        return False
+    except (FileNotFoundError, ValueError):
+        return True
+
+
+def _detach(ring_name: str):
+    """Drops an attached ring (with _attached_lock held), unmapping its memory."""
+    ring = _attached.pop(ring_name, None)
+    if ring is not None:
+        ring.close()
+
+
+def read_shared_frame(ring_name: str, number: int) -> Optional[Frame]:
+    """
+    Reads a frame that another process captured into its ring (e.g. the stdin client of
+    a local server); None if the ring is gone or the frame has been overwritten.
+    A ring whose owner has closed it is detached, and attaching a new ring detaches the
+    ones their owner has since replaced, so dead rings do not stay mapped. A frame that
+    was overwritten leaves its (live) ring attached.
+    """
+    with _attached_lock:
+        ring = _attached.get(ring_name)
+        if ring is not None and not ring.valid:
+            print(f"[CAPTURE] Frame ring {ring_name} is gone, detaching")
+            _detach(ring_name)
+            return None
+        if ring is None:
+            for name in [name for name, attached in _attached.items() if _ring_gone(attached)]:
+                print(f"[CAPTURE] Frame ring {name} is gone, detaching")
+                _detach(name)
+            try:
+                ring = _attached[ring_name] = FrameRing(0, name=ring_name, create=False)
+            except (FileNotFoundError, ValueError) as e:
+                print(f"[CAPTURE] Cannot attach to frame ring {ring_name}: {e}")
+                return None
+        # Read with the lock held, so no other thread detaches the ring mid-read
+        read = ring.read(number)
+    return read[0] if read is not None else None
@@ -0,0 +1,290 @@
+"""
+Multi-session backend server: serves many users' sessions at once over local HTTP.
+
+Each session keeps its own goal, history and previous screen. Requests are admitted
+up to SERVER_MAX_REQUESTS at a time with SERVER_QUEUE_DEPTH more waiting; Omni,
+planner and selector calls are bounded by their own pools (see worker_pools). A
+request that cannot be queued is answered at once with 503 and Retry-After.
+
+Endpoints (JSON bodies):
+    POST   /sessions                      -> {"session_id"}; body may name the id
+    GET    /sessions/<id>                 -> goal, history and highlighted step
+    DELETE /sessions/<id>
+    POST   /sessions/<id>/steps           {"prompt", "screenshot_path" | "frame_ring" + "frame",
+                                           "request_id"?, "key_combination"? | "confirm"? | "history"?,
+                                           "window_rect"?}
+           -> newline-delimited JSON: {"status": "partial", "task"} lines, then the result
+    POST   /requests/<request_id>/cancel
+    GET    /status                        -> startup state, pools, sessions, Omni batching
+
+The stdin loop in main.py becomes a thin client of a running server when
+BACKEND_SERVER_URL is set (see server_client.py).
+
+Usage (from backend/):
+    python server.py [--host 127.0.0.1] [--port 8765]
+"""
+import os
+import re
+import sys
+import json
+import uuid
+import argparse
+import traceback
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from startup import BackendStartup
+from ipc_protocol import ProtocolWriter, RequestRegistry
+from sessions import SessionStore, TooManySessions
+from worker_pools import StagePool, Overloaded, busy_result, SERVER_MAX_REQUESTS, SERVER_QUEUE_DEPTH, pool_stats
+from cancellation import RequestCancelled, DeadlineExceeded
+from resilience import REQUEST_DEADLINE_S
+import tracing
+
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8765"))
+
+_SESSION_PATH = re.compile(r"^/sessions/([\w.-]+)$")
+_STEP_PATH = re.compile(r"^/sessions/([\w.-]+)/steps$")
+_CANCEL_PATH = re.compile(r"^/requests/([\w.-]+)/cancel$")
+
+
+def _window_rect(data: dict):
+    """
+    The client's foreground window as [x1, y1, x2, y2] normalized to its screen, or None.
+    The server never looks at its own desktop: its sessions' screens belong to clients.
+    """
+    rect = data.get("window_rect")
+    if not isinstance(rect, list) or len(rect) != 4 or not all(isinstance(v, (int, float)) for v in rect):
+        return None
+    return tuple(float(v) for v in rect)
+
+
+class BackendServer:
+    """The sessions, in-flight requests and admission pool behind the HTTP handler."""
+
+    def __init__(self):
+        self.startup = BackendStartup()
+        self.registry = RequestRegistry()
+        self.requests = StagePool("request", SERVER_MAX_REQUESTS, SERVER_QUEUE_DEPTH)
+        self.sessions = SessionStore(on_close=self._forget_session)
+
+    def start(self):
+        # Startup messages go to the log; clients ask GET /status
+        self.startup.start(ProtocolWriter(sys.stderr))
+
+    def _forget_session(self, session_id: str):
+        if self.startup.pipeline is not None:
+            self.startup.pipeline.forget_session(session_id)
+
+    def status(self) -> dict:
+        pools = pool_stats()
+        pools["request"] = self.requests.stats()
+        status = {**self.startup.status_message(), "pools": pools, "sessions": len(self.sessions),
+                  "in_flight": self.registry.in_flight()}
+        if self.startup.pipeline is not None:
+            status["omni_batch"] = self.startup.pipeline.omni_batcher.stats()
+            if self.startup.pipeline.result_cache is not None:
+                status["result_cache"] = self.startup.pipeline.result_cache.stats.to_dict()
+        return status
+
+    def run_step(self, session, data: dict, send) -> dict:
+        """
+        Runs one step of the session, sending partial results through send(message)
+        as they come, and returns the final result.
+        """
+        request_id = data.get('request_id') or uuid.uuid4().hex
+        screenshot_path = data.get('screenshot_path')
+        prompt = data.get('prompt', '')
+        history = session.history_for(data)
+
+        cancel = self.registry.start(request_id, session.session_id)
+        # Time spent waiting for admission counts against the request's budget
+        cancel.start_deadline(REQUEST_DEADLINE_S)
+        try:
+            with tracing.trace(request_id) as request_trace:
+                frame = None
+                if data.get('frame_ring'):
+                    from screen_capture import read_shared_frame
+                    frame = read_shared_frame(data['frame_ring'], int(data.get('frame', -1)))
+                if data.get('frame_ring') and frame is None:
+                    result = {
+                        "status": "error",
+                        "message": f"Captured frame {data.get('frame')} is no longer in {data['frame_ring']}",
+                        "highlighting_boxes": []
+                    }
+                elif frame is None and (not screenshot_path or not os.path.exists(screenshot_path)):
+                    result = {
+                        "status": "error",
+                        "message": f"Screenshot file not found: {screenshot_path}",
+                        "highlighting_boxes": []
+                    }
+                else:
+                    with self.requests.slot(cancel):
+                        pipeline = self.startup.wait_for_pipeline()
+                        result = pipeline.process_screenshot_request(
+                            screenshot_path, prompt, history,
+                            on_partial=lambda task: send({"status": "partial", "task": task}),
+                            cancel=cancel, session_id=session.session_id, frame=frame,
+                            window_rect=_window_rect(data))
+        except Overloaded as e:
+            print(f"[SERVER] Turned away request {request_id}: {e}")
+            result = busy_result(e)
+        except DeadlineExceeded as e:
+            result = {"status": "timeout", "message": f"This step did not finish in time (the request {e}). Please try again.",
+                      "highlighting_boxes": []}
+        except RequestCancelled as e:
+            result = {"status": "cancelled", "message": f"Request {e}", "highlighting_boxes": []}
+        finally:
+            self.registry.finish(request_id)
+        print(f"[TRACE] Request {request_id} (session {session.session_id}) {result['status']}: {request_trace.summary()}")
+        session.record_result(result)
+        return {"request_id": request_id, "session_id": session.session_id, **result}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "BubbleBackend/1"
+    backend: BackendServer = None  # set by make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == "/status":
+            self._send_json(200, self.backend.status())
+            return
+        match = _SESSION_PATH.match(self.path)
+        session = self.backend.sessions.get(match.group(1)) if match else None
+        if session is None:
+            self._send_json(404, {"status": "error", "message": f"Not found: {self.path}"})
+            return
+        self._send_json(200, session.summary())
+
+    def do_DELETE(self):
+        match = _SESSION_PATH.match(self.path)
+        if match and self.backend.sessions.close(match.group(1)):
+            self._send_json(200, {"status": "closed", "session_id": match.group(1)})
+        else:
+            self._send_json(404, {"status": "error", "message": f"Not found: {self.path}"})
+
+    def do_POST(self):
+        try:
+            data = self._read_json()
+        except json.JSONDecodeError as e:
+            self._send_json(400, {"status": "error", "message": f"Invalid JSON: {e}"})
+            return
+
+        if self.path == "/sessions":
+            try:
+                session = self.backend.sessions.get_or_create(data.get("session_id"))
+            except TooManySessions as e:
+                self._send_json(503, {"status": "busy", "message": str(e)}, {"Retry-After": "30"})
+                return
+            self._send_json(200, {"session_id": session.session_id})
+            return
+
+        match = _CANCEL_PATH.match(self.path)
+        if match:
+            cancelled = self.backend.registry.cancel(match.group(1))
+            self._send_json(200 if cancelled else 404, {"request_id": match.group(1), "cancelled": cancelled})
+            return
+
+        match = _STEP_PATH.match(self.path)
+        if not match:
+            self._send_json(404, {"status": "error", "message": f"Not found: {self.path}"})
+            return
+        try:
+            session = self.backend.sessions.get_or_create(match.group(1))
+        except TooManySessions as e:
+            self._send_json(503, {"status": "busy", "message": str(e)}, {"Retry-After": "30"})
+            return
+        self._stream_step(session, data)
+
+    def _stream_step(self, session, data: dict):
+        """
+        Answers with newline-delimited JSON, sending the headers with the first message:
+        a request turned away before any partial result gets a plain 503 instead.
+        """
+        streaming = False
+
+        def send(message: dict):
+            nonlocal streaming
+            if not streaming:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                streaming = True
+            self.wfile.write((json.dumps(message) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+        def send_partial(message: dict):
+            try:
+                send({"request_id": data.get("request_id"), "session_id": session.session_id, **message})
+            except (BrokenPipeError, ConnectionResetError):
+                # The client went away; stop working on its request
+                self.backend.registry.cancel(data.get("request_id"))
+
+        if not data.get("request_id"):
+            data["request_id"] = uuid.uuid4().hex
+        try:
+            result = self.backend.run_step(session, data, send_partial)
+        except Exception as e:
+            traceback.print_exc()
+            result = {"request_id": data["request_id"], "session_id": session.session_id,
+                      "status": "error", "message": f"Backend error: {e}", "highlighting_boxes": []}
+        try:
+            if result["status"] == "busy" and not streaming:
+                self._send_json(503, result, {"Retry-After": str(max(int(result["retry_after_s"] + 0.999), 1))})
+            else:
+                send(result)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Connections waiting to be accepted; the default of 5 resets bursts of clients
+    request_queue_size = 128
+
+
+def make_server(host: str = SERVER_HOST, port: int = SERVER_PORT, backend: BackendServer = None) -> ThreadingHTTPServer:
+    backend = backend or BackendServer()
+    handler = type("Handler", (_Handler,), {"backend": backend})
+    server = _Server((host, port), handler)
+    backend.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port)
+    print(f"[SERVER] Listening on http://{args.host}:{server.server_address[1]} "
+          f"({SERVER_MAX_REQUESTS} requests at once, {SERVER_QUEUE_DEPTH} queued)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
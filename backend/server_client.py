@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import uuid
+import threading
+import traceback
+from typing import Callable, Optional
+import httpx
+from foreground_window import foreground_window_rect
+
+# Longest wait for a step's reply; the server enforces the request's own deadline
+SERVER_CLIENT_TIMEOUT_S = 120
+
+
+class ServerClient:
+    """HTTP client for the backend server's session, step, cancel and status endpoints."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self._client = httpx.Client(base_url=self.base_url,
+                                    timeout=httpx.Timeout(SERVER_CLIENT_TIMEOUT_S, connect=5.0))
+
+    def status(self) -> dict:
+        response = self._client.get("/status")
+        response.raise_for_status()
+        return response.json()
+
+    def step(self, session_id: str, data: dict, on_partial: Optional[Callable[[dict], None]] = None) -> dict:
+        """
+        Runs one step on the server and returns its result, calling on_partial with each
+        partial task as it arrives. A request the server turns away comes back as its
+        "busy" result.
+        """
+        with self._client.stream("POST", f"/sessions/{session_id}/steps", json=data) as response:
+            if response.status_code == 503:
+                response.read()
+                return response.json()
+            response.raise_for_status()
+            result = None
+            for line in response.iter_lines():
+                if not line.strip():
+                    continue
+                message = json.loads(line)
+                if message.get("status") == "partial":
+                    if on_partial:
+                        on_partial(message["task"])
+                else:
+                    result = message
+        if result is None:
+            raise RuntimeError("the server closed the connection without a result")
+        return result
+
+    def cancel(self, request_id: str) -> bool:
+        response = self._client.post(f"/requests/{request_id}/cancel")
+        return response.status_code == 200
+
+
+class ServerRelay:
+    """
+    The stdin loop's backend when BACKEND_SERVER_URL is set: requests, cancels and
+    status queries are relayed to the server, which keeps the session state, and its
+    replies are written back in the usual protocol. Requests without a session_id
+    share one session per Electron process.
+    """
+
+    def __init__(self, base_url: str, began: float):
+        self.base_url = base_url
+        self.began = began
+        self.client = ServerClient(base_url)
+        self.default_session = f"stdin-{os.getpid()}"
+        self.status = "starting"
+        self.services = {}
+        self.error = None
+        self.startup_ms = None
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def start(self, writer=None):
+        if writer is not None:
+            self.announce(writer)
+        threading.Thread(target=self._run, name="startup", daemon=True).start()
+
+    def announce(self, writer):
+        """Sends the ready/degraded message to writer once the server answered, or now if it has."""
+        with self._lock:
+            if self._writer is not None:
+                return
+            self._writer = writer
+            done = self.startup_ms is not None
+        if done:
+            writer.send(self.status_message())
+
+    def _run(self):
+        try:
+            server_status = self.client.status()
+            self.services = server_status.get("services", {})
+            self.status = server_status.get("status", "degraded")
+            self.error = server_status.get("message")
+        except Exception as e:
+            self.services = {"server": "unavailable"}
+            self.status = "degraded"
+            self.error = f"Could not reach the backend server at {self.base_url}: {e}"
+        with self._lock:
+            self.startup_ms = round((time.time() - self.began) * 1000, 2)
+            writer = self._writer
+        print(f"[STARTUP] Relaying to {self.base_url}, server {self.status}: {self.services}")
+        if writer is not None:
+            writer.send(self.status_message())
+
+    def status_message(self):
+        message = {"status": self.status, "services": dict(self.services), "startup_ms": self.startup_ms,
+                   "server": self.base_url}
+        if self.error is not None:
+            message["message"] = self.error
+        return message
+
+    def process(self, data, writer):
+        """Relays one process_screenshot request and writes its partial and final replies."""
+        request_id = data.get('request_id')
+        payload = {key: data[key] for key in ("prompt", "screenshot_path", "history", "key_combination") if key in data}
+        payload["request_id"] = request_id or uuid.uuid4().hex
+        try:
+            if data.get('capture'):
+                # Captured here, on the user's screen; a server on the same machine reads
+                # the frame from this process's shared-memory ring
+                from screen_capture import capturer
+                payload["frame"] = capturer.capture()
+                payload["frame_ring"] = capturer.ring.name
+                if request_id is not None:
+                    writer.send({"status": "captured"}, request_id)
+            # The server runs elsewhere or for many users, so only this process can tell
+            # which window is in front on the user's screen
+            window_rect = foreground_window_rect()
+            if window_rect is not None:
+                payload["window_rect"] = list(window_rect)
+            # Version 1 clients get only the final reply, as before
+            on_partial = (lambda task: writer.send({"status": "partial", "task": task}, request_id)) \
+                if request_id is not None else None
+            result = self.client.step(data.get('session_id') or self.default_session, payload, on_partial=on_partial)
+            result = {key: value for key, value in result.items() if key not in ("request_id", "session_id")}
+        except Exception as e:
+            traceback.print_exc()
+            result = {
+                "status": "error",
+                "message": f"Backend server error: {e}",
+                "highlighting_boxes": []
+            }
+        writer.send(result, request_id)
+
+    def cancel(self, request_id) -> bool:
+        try:
+            return self.client.cancel(request_id)
+        except Exception as e:
+            print(f"[IPC] Could not relay the cancel for {request_id}: {e}")
+            return False
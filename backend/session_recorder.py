@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import shutil
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+# Opt-in: record every step (screenshot, prompt, history, Omni output and Gemini
+# responses) into a session bundle that benchmarks/replay_session.py can replay offline
+RECORD_SESSION_DIR = os.getenv("RECORD_SESSION_DIR")
+
+STEP_FILE = "step.json"
+SCREENSHOT_FILE = "screenshot.png"
+ANNOTATED_FILE = "omni_annotated.b64"
+
+
+class StepRecording:
+    """Everything one step of the pipeline received from its external services."""
+
+    def __init__(self, directory: str, screenshot_path: Optional[str], prompt: str, history: List[Dict], frame=None):
+        self.directory = directory
+        self.screenshot_path = screenshot_path
+        self.frame = frame  # captured in process, when there is no screenshot file
+        self.prompt = prompt
+        self.history = [dict(entry) for entry in history]
+        self.gemini: List[Dict] = []
+        self.omni: Optional[Dict] = None
+        self.result: Optional[Dict] = None
+        self._lock = threading.Lock()
+
+    def add_gemini(self, stage: str, text: str, ms: float):
+        with self._lock:
+            self.gemini.append({"stage": stage, "text": text, "ms": round(ms, 2)})
+
+    def set_omni(self, result, ms: float):
+        if isinstance(result, tuple) and len(result) == 2:
+            annotated_b64, element_string = result
+        else:
+            annotated_b64, element_string = None, result
+        self.omni = {"element_string": element_string, "ms": round(ms, 2), "annotated": annotated_b64}
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self.frame is not None:
+            self.frame.image.save(os.path.join(self.directory, SCREENSHOT_FILE))
+        else:
+            shutil.copyfile(self.screenshot_path, os.path.join(self.directory, SCREENSHOT_FILE))
+        omni = None
+        if self.omni is not None:
+            omni = {k: v for k, v in self.omni.items() if k != "annotated"}
+            if self.omni["annotated"] is not None:
+                with open(os.path.join(self.directory, ANNOTATED_FILE), "w", encoding="utf-8") as f:
+                    f.write(self.omni["annotated"])
+                omni["annotated"] = ANNOTATED_FILE
+        with open(os.path.join(self.directory, STEP_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "prompt": self.prompt,
+                "history": self.history,
+                "gemini": self.gemini,
+                "omni": omni,
+                "result": self.result,
+                "recorded_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }, f, indent=2)
+
+
+class SessionRecorder:
+    """Writes each recorded step to <directory>/step-NNNN/."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        existing = [name for name in os.listdir(directory) if name.startswith("step-")] if os.path.isdir(directory) else []
+        self._numbers = itertools.count(len(existing) + 1)
+        self._lock = threading.Lock()
+
+    def new_step(self, screenshot_path: Optional[str], prompt: str, history: List[Dict], frame=None) -> StepRecording:
+        with self._lock:
+            number = next(self._numbers)
+        return StepRecording(os.path.join(self.directory, f"step-{number:04d}"), screenshot_path, prompt, history, frame)
+
+
+recorder = SessionRecorder(RECORD_SESSION_DIR) if RECORD_SESSION_DIR else None
+
+_current_step: contextvars.ContextVar[Optional[StepRecording]] = contextvars.ContextVar("current_step", default=None)
+
+
+@contextmanager
+def step(screenshot_path: Optional[str], prompt: str, history: List[Dict], frame=None):
+    """Records the enclosed pipeline run as one step; yields the StepRecording, or None when not recording."""
+    if recorder is None:
+        yield None
+        return
+    recording = recorder.new_step(screenshot_path, prompt, history, frame)
+    token = _current_step.set(recording)
+    try:
+        yield recording
+    finally:
+        _current_step.reset(token)
+        try:
+            recording.save()
+            print(f"[RECORDER] Saved step to {recording.directory}")
+        except OSError as e:
+            print(f"[RECORDER] Could not save step: {e}")
+
+
+def record_stream(stage: str, stream) -> Iterator:
+    """Passes a Gemini response stream through, recording its text once it ends or is dropped."""
+    recording = _current_step.get()
+    if recording is None:
+        yield from stream
+        return
+    start = time.time()
+    text = []
+    try:
+        for chunk in stream:
+            text.append(chunk.text or "")
+            yield chunk
+    finally:
+        recording.add_gemini(stage, "".join(text), (time.time() - start) * 1000)
+
+
+def record_response(stage: str, response, ms: float):
+    recording = _current_step.get()
+    if recording is not None:
+        recording.add_gemini(stage, response.text or "", ms)
+
+
+def record_omni(result, ms: float):
+    recording = _current_step.get()
+    if recording is not None and result is not None:
+        recording.set_omni(result, ms)
+
+
+def load_session(directory: str) -> List[Dict]:
+    """Loads a recorded session's steps in order, with absolute screenshot paths and the annotated image inlined."""
+    steps = []
+    for name in sorted(os.listdir(directory)):
+        step_dir = os.path.join(directory, name)
+        step_file = os.path.join(step_dir, STEP_FILE)
+        if not name.startswith("step-") or not os.path.isfile(step_file):
+            continue
+        with open(step_file, encoding="utf-8") as f:
+            data = json.load(f)
+        data["name"] = name
+        data["screenshot_path"] = os.path.join(step_dir, SCREENSHOT_FILE)
+        omni = data.get("omni")
+        if omni and omni.get("annotated"):
+            with open(os.path.join(step_dir, omni["annotated"]), encoding="utf-8") as f:
+                omni["annotated"] = f.read()
+        steps.append(data)
+    return steps
@@ -0,0 +1,132 @@
+import os
+import time
+import uuid
+import threading
+from typing import Callable, Dict, List, Optional
+from history import tag_history
+
+# Sessions the server keeps at once, and how long an unused one is kept
+SERVER_MAX_SESSIONS = int(os.getenv("SERVER_MAX_SESSIONS", "256"))
+SESSION_IDLE_TIMEOUT_S = float(os.getenv("SESSION_IDLE_TIMEOUT_S", "1800"))
+
+# Key combinations that confirm the step that was last highlighted
+CONFIRM_KEYS = {"Ctrl+Shift+1": True, "Ctrl+Shift+0": False}
+
+
+class TooManySessions(Exception):
+    """Raised when a new session would exceed SERVER_MAX_SESSIONS."""
+
+
+class Session:
+    """
+    One user's workflow on the server: the goal, the confirmed steps and the step that
+    was last highlighted, waiting for the user to confirm it.
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.prompt: Optional[str] = None
+        self.history: List[Dict] = []
+        self.pending: Optional[Dict] = None  # last highlighted task, not yet confirmed
+        self.last_used = time.monotonic()
+        self.steps = 0
+        self.lock = threading.Lock()
+
+    def history_for(self, data: Dict) -> List[Dict]:
+        """
+        The history to plan this request with. A request that carries its own history
+        (the Electron app does) replaces the session's. Otherwise a confirmation key
+        (or "confirm": "success" | "failure") adds the highlighted step with that
+        status, and a new goal starts the history over.
+        """
+        with self.lock:
+            prompt = data.get('prompt', '')
+            if 'history' in data:
+                self.history = [dict(entry) for entry in data['history'] or []]
+                key_combination = data.get('key_combination')
+                if key_combination in CONFIRM_KEYS:
+                    tag_history(self.history, success=CONFIRM_KEYS[key_combination])
+            elif prompt != self.prompt:
+                self.history = []
+                self.pending = None
+            else:
+                confirm = data.get('confirm')
+                success = CONFIRM_KEYS.get(data.get('key_combination')) if confirm is None else confirm == "success"
+                if success is not None and self.pending is not None:
+                    self.history.append({"step": self.pending.get("step"), "action": self.pending.get("action"),
+                                         "status": "success" if success else "failure"})
+                    self.pending = None
+            self.prompt = prompt
+            self.last_used = time.monotonic()
+            return [dict(entry) for entry in self.history]
+
+    def record_result(self, result: Dict):
+        with self.lock:
+            self.steps += 1
+            self.last_used = time.monotonic()
+            if result.get("status") == "success":
+                self.pending = result.get("task")
+            elif result.get("status") == "completed":
+                self.pending = None
+
+    def summary(self) -> Dict:
+        with self.lock:
+            return {"session_id": self.session_id, "prompt": self.prompt, "history": list(self.history),
+                    "pending": self.pending, "steps": self.steps,
+                    "idle_s": round(time.monotonic() - self.last_used, 1)}
+
+
+class SessionStore:
+    """
+    The server's sessions, bounded in number and dropped after SESSION_IDLE_TIMEOUT_S
+    without a request. on_close is called with the id of every session that goes, so
+    per-session pipeline state goes with it.
+    """
+
+    def __init__(self, on_close: Callable[[str], None], max_sessions: int = SERVER_MAX_SESSIONS,
+                 idle_timeout_s: float = SESSION_IDLE_TIMEOUT_S):
+        self.on_close = on_close
+        self.max_sessions = max_sessions
+        self.idle_timeout_s = idle_timeout_s
+        self._sessions: Dict[str, Session] = {}
+        self._lock = threading.Lock()
+
+    def _expire_idle(self) -> List[str]:
+        now = time.monotonic()
+        expired = [sid for sid, s in self._sessions.items() if now - s.last_used > self.idle_timeout_s]
+        for session_id in expired:
+            del self._sessions[session_id]
+        return expired
+
+    def get_or_create(self, session_id: Optional[str] = None) -> Session:
+        """Returns the session, creating it (with a new id if none is given); raises TooManySessions."""
+        with self._lock:
+            expired = self._expire_idle()
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                if len(self._sessions) >= self.max_sessions:
+                    raise TooManySessions(f"the server already has {len(self._sessions)} sessions")
+                session = Session(session_id or uuid.uuid4().hex)
+                self._sessions[session.session_id] = session
+                print(f"[SESSIONS] Opened session {session.session_id} ({len(self._sessions)} open)")
+        for expired_id in expired:
+            print(f"[SESSIONS] Session {expired_id} expired after {self.idle_timeout_s:.0f}s idle")
+            self.on_close(expired_id)
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def close(self, session_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        print(f"[SESSIONS] Closed session {session_id}")
+        self.on_close(session_id)
+        return True
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
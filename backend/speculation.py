@@ -0,0 +1,143 @@
+import time
+import threading
+from concurrent.futures import Executor, TimeoutError as FuturesTimeoutError
+from typing import Callable, Dict, List, Optional
+from cancellation import CancelToken
+from screen_cache import ScreenFingerprint, TILE_TOLERANCE
+
+# A confirmed screenshot may differ from the one the speculation ran on by this many
+# tiles (a caret, typed text, a hover highlight) and still be served from it
+SPECULATION_MAX_CHANGED_TILES = 12
+
+
+def history_key(history: List[Dict]) -> tuple:
+    return tuple((entry.get('step'), entry.get('action'), entry.get('status')) for entry in history)
+
+
+class SpeculationStats:
+    def __init__(self):
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+        self._lock = threading.Lock()
+
+    def summary(self) -> str:
+        checked = self.hits + self.misses
+        hit_rate = (self.hits / checked * 100) if checked else 0.0
+        return (f"started={self.started} hits={self.hits} misses={self.misses} "
+                f"hit_rate={hit_rate:.1f}% saved={self.saved_ms:.0f}ms")
+
+
+class _Speculation:
+    def __init__(self, prompt: str, history: List[Dict], fingerprint: ScreenFingerprint, cancel: CancelToken):
+        self.prompt = prompt
+        self.history_key = history_key(history)
+        self.fingerprint = fingerprint
+        self.cancel = cancel
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.future = None
+
+
+class SpeculativePrefetcher:
+    """
+    After a step's result is sent, runs the pipeline for the following step in the
+    background, assuming the current step will be confirmed as a success.
+    When the confirmed request arrives with the same goal and history and a screen that
+    still matches, the precomputed result is served instead of running the pipeline again.
+    Anything else cancels the speculative work.
+    """
+
+    def __init__(self, executor: Executor, max_changed_tiles: int = SPECULATION_MAX_CHANGED_TILES):
+        self.executor = executor
+        self.max_changed_tiles = max_changed_tiles
+        self.stats = SpeculationStats()
+        self._pending: Dict[str, _Speculation] = {}
+        self._lock = threading.Lock()
+
+    def start(self, session_id: str, prompt: str, assumed_history: List[Dict], fingerprint: ScreenFingerprint,
+              run: Callable[[CancelToken], Optional[dict]]):
+        """Starts run(cancel) speculatively for the session's next request, replacing any older speculation."""
+        speculation = _Speculation(prompt, assumed_history, fingerprint, CancelToken())
+
+        def run_speculation():
+            try:
+                return run(speculation.cancel)
+            finally:
+                speculation.finished_at = time.time()
+
+        with self._lock:
+            previous = self._pending.pop(session_id, None)
+            if previous is not None:
+                previous.cancel.cancel("replaced by a newer speculation")
+            speculation.future = self.executor.submit(run_speculation)
+            self._pending[session_id] = speculation
+            self.stats.started += 1
+        print(f"[SPECULATION] Prefetching next step for session {session_id} ({self.stats.summary()})")
+
+    def discard(self, session_id: str, reason: str):
+        with self._lock:
+            speculation = self._pending.pop(session_id, None)
+        if speculation is not None:
+            speculation.cancel.cancel(reason)
+
+    def _miss(self, speculation: _Speculation, reason: str) -> None:
+        speculation.cancel.cancel(reason)
+        with self.stats._lock:
+            self.stats.misses += 1
+        print(f"[SPECULATION] Miss: {reason} ({self.stats.summary()})")
+        return None
+
+    def take(self, session_id: str, prompt: str, history: List[Dict], fingerprint: ScreenFingerprint,
+             cancel: Optional[CancelToken] = None) -> Optional[dict]:
+        """
+        Returns the speculative result for this request if it still applies, else None
+        (after cancelling the speculation). Waits for the speculation if it is still running.
+        """
+        with self._lock:
+            speculation = self._pending.pop(session_id, None)
+        if speculation is None:
+            return None
+
+        if prompt != speculation.prompt or history_key(history) != speculation.history_key:
+            return self._miss(speculation, "history diverged (step failed or was not the predicted one)")
+        changed = fingerprint.changed_tiles(speculation.fingerprint, TILE_TOLERANCE)
+        if len(changed) > self.max_changed_tiles:
+            return self._miss(speculation, f"screen changed ({len(changed)} tiles)")
+
+        wait_start = time.time()
+        while True:
+            try:
+                result = speculation.future.result(timeout=0.1)
+                break
+            except FuturesTimeoutError:
+                if cancel is not None and cancel.cancelled:
+                    speculation.cancel.cancel("request cancelled")
+                    cancel.check()
+            except Exception as e:
+                return self._miss(speculation, f"speculative run failed: {e}")
+        waited_ms = (time.time() - wait_start) * 1000
+
+        if result is None or result.get("status") not in ("success", "completed"):
+            return self._miss(speculation, f"speculative run ended with {result and result.get('status')}")
+        if result.get("bbox") and self._target_changed(result["bbox"], changed, fingerprint.grid):
+            return self._miss(speculation, "the selected element's area changed")
+
+        speculative_ms = ((speculation.finished_at or time.time()) - speculation.started_at) * 1000
+        with self.stats._lock:
+            self.stats.hits += 1
+            self.stats.saved_ms += max(speculative_ms - waited_ms, 0)
+        print(f"[SPECULATION] Hit: served prefetched step (pipeline took {speculative_ms:.2f}ms, "
+              f"waited {waited_ms:.2f}ms; {self.stats.summary()})")
+        return result
+
+    @staticmethod
+    def _target_changed(bbox, changed_tiles, grid) -> bool:
+        cols, rows = grid
+        x1, y1, x2, y2 = bbox
+        for index in changed_tiles:
+            col, row = index % cols, index // cols
+            if col / cols < x2 and x1 < (col + 1) / cols and row / rows < y2 and y1 < (row + 1) / rows:
+                return True
+        return False
@@ -0,0 +1,98 @@
+"""
+Backend startup: loads the pipeline off the caller's thread and warms up its connections.
+Shared by the stdin loop (main.py) and the multi-session server (server.py).
+"""
+import time
+
+# Measured from here: the readiness message reports how long startup took. main.py
+# imports this module before anything else.
+_startup_begin = time.time()
+
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BackendStartup:
+    """
+    Loads the pipeline module (and with it google-genai, gradio_client, Pillow and numpy)
+    off the IPC thread, then warms up the Gemini and Omni connections in parallel.
+    Requests that arrive before the pipeline is loaded wait for it. When warm-up is
+    done, an untagged {"status": "ready" | "degraded", ...} message is sent to the
+    writer passed to start() or announce(), if any.
+    """
+
+    def __init__(self):
+        self.status = "starting"
+        self.services = {}
+        self.error = None
+        self.startup_ms = None
+        self.pipeline = None
+        self._loaded = threading.Event()
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def start(self, writer=None):
+        if writer is not None:
+            self.announce(writer)
+        threading.Thread(target=self._run, name="startup", daemon=True).start()
+
+    def announce(self, writer):
+        """Sends the ready/degraded message to writer once startup is done, or now if it is."""
+        with self._lock:
+            if self._writer is not None:
+                return
+            self._writer = writer
+            done = self.startup_ms is not None
+        if done:
+            writer.send(self.status_message())
+
+    def _run(self):
+        import_start = time.time()
+        try:
+            import pipeline
+            self.pipeline = pipeline
+            print(f"[STARTUP] Pipeline loaded in {(time.time() - import_start) * 1000:.2f}ms")
+        except Exception as e:
+            traceback.print_exc()
+            self.error = f"Backend failed to load the pipeline: {e}"
+        finally:
+            self._loaded.set()
+
+        if self.pipeline is not None:
+            import gemini_client
+            import omni_api_hf_spaces
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix="warmup") as warmup:
+                gemini_ok = warmup.submit(gemini_client.warm_up)
+                omni_ok = warmup.submit(omni_api_hf_spaces.warm_up)
+                self.services = {
+                    "gemini": "ok" if gemini_ok.result() else "unavailable",
+                    "omni": "ok" if omni_ok.result() else "unavailable",
+                }
+        else:
+            self.services = {"pipeline": "unavailable"}
+
+        with self._lock:
+            self.status = "ready" if all(state == "ok" for state in self.services.values()) else "degraded"
+            self.startup_ms = round((time.time() - _startup_begin) * 1000, 2)
+            writer = self._writer
+        print(f"[STARTUP] Backend {self.status} after {self.startup_ms:.2f}ms: {self.services}")
+        if writer is not None:
+            writer.send(self.status_message())
+
+    def status_message(self):
+        message = {"status": self.status, "services": dict(self.services), "startup_ms": self.startup_ms}
+        if self.error is not None:
+            message["message"] = self.error
+        elif self.status == "degraded":
+            unavailable = [name for name, state in self.services.items() if state != "ok"]
+            message["message"] = f"Could not connect to {', '.join(unavailable)} at startup; each step retries the connection."
+        return message
+
+    def wait_for_pipeline(self):
+        """Returns the pipeline module once loaded; raises RuntimeError if it failed to load."""
+        self._loaded.wait()
+        if self.pipeline is None:
+            raise RuntimeError(self.error)
+        return self.pipeline
+
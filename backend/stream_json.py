@@ -0,0 +1,98 @@
+import json
+from typing import Any, Dict, Optional
+
+
+class IncrementalJSONObject:
+    """
+    Incremental parser for a single JSON object arriving in chunks.
+    Top-level fields become available in `fields` as soon as their value is complete,
+    before the rest of the object has arrived. Text before the opening brace is ignored.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.fields: Dict[str, Any] = {}
+        self.complete = False
+        self._pos = 0
+        self._start = None      # index of the opening brace
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key: Optional[str] = None
+        self._token_start = None  # start of the current top-level key or value
+        self._expect_key = True
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        """Consumes a chunk and returns the top-level fields completed by it."""
+        self.text += chunk
+        completed = {}
+        text = self.text
+        while self._pos < len(text) and not self.complete:
+            ch = text[self._pos]
+            if self._start is None:
+                if ch == "{":
+                    self._start = self._pos
+                    self._depth = 1
+                self._pos += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._close_token(self._pos + 1, completed)
+                self._pos += 1
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    self._token_start = self._pos
+            elif ch in "{[":
+                if self._depth == 1:
+                    self._token_start = self._pos
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1:
+                    self._close_token(self._pos + 1, completed)
+                elif self._depth == 0:
+                    self._close_token(self._pos, completed)
+                    self.complete = True
+            elif ch in ",:" and self._depth == 1:
+                self._close_token(self._pos, completed)
+                self._expect_key = ch == ","
+            elif self._depth == 1 and not ch.isspace() and self._token_start is None:
+                # Start of a bare literal: number, true, false or null
+                self._token_start = self._pos
+            self._pos += 1
+        return completed
+
+    def _close_token(self, end: int, completed: Dict[str, Any]):
+        if self._token_start is None:
+            return
+        raw = self.text[self._token_start:end].strip()
+        self._token_start = None
+        if not raw:
+            return
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return
+        if self._expect_key and self._key is None:
+            self._key = value
+            return
+        if self._key is not None:
+            self.fields[self._key] = value
+            completed[self._key] = value
+            self._key = None
+
+    def result(self) -> Optional[Dict[str, Any]]:
+        """Returns the whole object once it is complete, else None."""
+        if not self.complete:
+            return None
+        return json.loads(self.text[self._start:self._pos])
@@ -0,0 +1,81 @@
+"""
+parse_element_table against awkward and malformed Omni element lines.
+
+Usage (from backend/):
+    python -m pytest tests
+"""
+import random
+import pytest
+from element_table import parse_element_table
+
+CONTENTS = ["Save", "Don't save", 'Say "hi"', "C:\\Users\\me", "Ünïcödé ✓", "", None, "File, Edit, View"]
+
+MALFORMED_LINES = [
+    "icon 900: {'type': 'text', 'bbox': [0.1, 0.2, 0.3], 'interactivity': True, 'content': 'short bbox'}",
+    "icon 901: {'type': 'text', 'bbox': [0.1, 0.2, 0.3, 0.4], 'content': 'unterminated}",
+    "icon 902: {'type': 'text' 'bbox': }",
+    "icon 903: __import__('os').system('echo unsafe')",
+    "icon 904: {'type': 'text', 'content': 'no bbox'}",
+    "icon 905: {1, 2, 3}",
+    "icon : {'type': 'text', 'bbox': [0, 0, 1, 1]}",
+    "icon 906: {'type': 'text', 'bbox': ['a', 0, 1, 1], 'interactivity': False, 'content': 'x'}",
+    "some log line the server printed",
+    "",
+]
+
+
+def element_lines(count, seed=1):
+    """Well-formed lines as Omni prints them, with the elements they describe."""
+    rng = random.Random(seed)
+    lines = []
+    for i in range(count):
+        element = {
+            'type': rng.choice(['text', 'icon']),
+            'bbox': [round(rng.random(), 6) for _ in range(4)],
+            'interactivity': rng.random() < 0.5,
+            'content': rng.choice(CONTENTS),
+            'source': rng.choice(['box_ocr_content_ocr', 'box_yolo_content_yolo']),
+        }
+        lines.append((f"icon {i}: {element}", element))
+    return lines
+
+
+def test_well_formed_lines_round_trip():
+    good = element_lines(len(CONTENTS) * 3)
+    table = parse_element_table("\n".join(line for line, _ in good))
+    assert len(table) == len(good)
+    for row, (_, expected) in enumerate(good):
+        element = table.row(row)
+        assert element['icon'] == row
+        for key in ('type', 'bbox', 'interactivity', 'content', 'source'):
+            assert element[key] == expected[key], (key, element, expected)
+
+
+@pytest.mark.parametrize("line", MALFORMED_LINES)
+def test_malformed_line_is_skipped(line):
+    assert len(parse_element_table(line)) == 0
+
+
+def test_malformed_lines_do_not_disturb_their_neighbours():
+    good = element_lines(len(CONTENTS) * 3)
+    lines = [line for line, _ in good]
+    lines[3:3] = MALFORMED_LINES
+    table = parse_element_table("\n".join(lines))
+    assert len(table) == len(good)
+    assert [table.row(row)['content'] for row in range(len(table))] == [element['content'] for _, element in good]
+    assert [table.row(row)['icon'] for row in range(len(table))] == list(range(len(good)))
+    assert table.bboxes.shape == (len(good), 4)
+
+
+def test_reordered_keys_and_extra_keys():
+    # Non-standard key order and extra keys still parse through the literal_eval path
+    table = parse_element_table(
+        "icon 907: {'content': 'Reordered', 'bbox': [0, 0, 0.5, 0.5], 'type': 'icon', 'interactivity': True, 'score': 0.9}")
+    assert len(table) == 1
+    element = table.row(0)
+    assert element['content'] == 'Reordered' and element['score'] == 0.9 and element['icon'] == 907
+    assert element['bbox'] == [0, 0, 0.5, 0.5]
+
+
+def test_empty_string():
+    assert len(parse_element_table("")) == 0
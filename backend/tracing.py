@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+# Optional Chrome trace file (load it in chrome://tracing or ui.perfetto.dev)
+TRACE_FILE = os.getenv("TRACE_FILE")
+# Number of recent samples per stage the latency percentiles are computed over
+HISTOGRAM_WINDOW = 1000
+# Log the per-stage percentiles every this many requests
+SUMMARY_EVERY = 10
+
+_PID = os.getpid()
+
+
+class RollingHistogram:
+    """Latency samples (ms) for one stage over the last `window` spans."""
+
+    def __init__(self, window: int = HISTOGRAM_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, ms: float):
+        self.samples.append(ms)
+        self.count += 1
+
+    def percentile(self, p: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(int(p / 100 * len(ordered)), len(ordered) - 1)]
+
+    def summary(self) -> str:
+        return f"n={self.count} p50={self.percentile(50):.0f}ms p95={self.percentile(95):.0f}ms max={max(self.samples, default=0):.0f}ms"
+
+
+class Trace:
+    """Per-request trace: collects the total time spent in each stage."""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.stage_ms: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, ms: float):
+        with self._lock:
+            self.stage_ms[name] = self.stage_ms.get(name, 0.0) + ms
+
+    def summary(self) -> str:
+        with self._lock:
+            return ", ".join(f"{name}={ms:.0f}ms" for name, ms in self.stage_ms.items())
+
+
+class Tracer:
+    """
+    Records spans into per-stage rolling histograms and, if a trace file is configured,
+    appends them as Chrome trace events. Spans nest through a context variable, so a
+    span's parent is the innermost open span in the same request, even across threads
+    started with propagate().
+    """
+
+    def __init__(self, trace_file: Optional[str] = TRACE_FILE):
+        self.histograms: Dict[str, RollingHistogram] = {}
+        self._lock = threading.Lock()
+        self._file = None
+        self._requests = 0
+        if trace_file:
+            try:
+                self._file = open(trace_file, "w", encoding="utf-8")
+                # JSON array format; the closing bracket is optional for trace viewers
+                self._file.write("[\n")
+            except OSError as e:
+                print(f"[TRACE] Could not open trace file {trace_file}: {e}")
+
+    def record(self, name: str, start_ns: int, end_ns: int, args: Dict):
+        ms = (end_ns - start_ns) / 1e6
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = RollingHistogram()
+            histogram.add(ms)
+            if self._file is not None:
+                self._file.write(json.dumps({
+                    "name": name,
+                    "cat": "pipeline",
+                    "ph": "X",
+                    "ts": start_ns // 1000,
+                    "dur": (end_ns - start_ns) // 1000,
+                    "pid": _PID,
+                    "tid": threading.get_ident(),
+                    "args": args,
+                }) + ",\n")
+                self._file.flush()
+
+    def request_finished(self):
+        """Logs the stage percentiles every SUMMARY_EVERY requests."""
+        with self._lock:
+            self._requests += 1
+            if self._requests % SUMMARY_EVERY:
+                return
+        print(f"[TRACE] Stage latencies over the last {HISTOGRAM_WINDOW} spans:\n{self.summary()}")
+
+    def summary(self) -> str:
+        with self._lock:
+            return "\n".join(f"  {name}: {histogram.summary()}" for name, histogram in sorted(self.histograms.items()))
+
+
+tracer = Tracer()
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+_current_span: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_span", default=None)
+
+
+@contextmanager
+def trace(trace_id: str):
+    """Root of a request's spans; yields the Trace with the request's per-stage totals."""
+    request_trace = Trace(trace_id)
+    token = _current_trace.set(request_trace)
+    try:
+        with span("request"):
+            yield request_trace
+    finally:
+        _current_trace.reset(token)
+        tracer.request_finished()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Times the enclosed block as a span named `name`, nested under the current span."""
+    request_trace = _current_trace.get()
+    parent = _current_span.get()
+    token = _current_span.set(name)
+    start_ns = time.perf_counter_ns()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        end_ns = time.perf_counter_ns()
+        _current_span.reset(token)
+        args = dict(attrs)
+        if parent is not None:
+            args["parent"] = parent
+        if request_trace is not None:
+            args["trace_id"] = request_trace.trace_id
+            request_trace.add(name, (end_ns - start_ns) / 1e6)
+        if error is not None:
+            args["error"] = error
+        tracer.record(name, start_ns, end_ns, args)
+
+
+def propagate(fn: Callable) -> Callable:
+    """Wraps fn to run in the caller's trace context, for work handed to another thread."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def mark(name: str, start_ns: int, **attrs):
+    """Records a span from start_ns (a time.perf_counter_ns() value) to now, e.g. time to first token."""
+    request_trace = _current_trace.get()
+    end_ns = time.perf_counter_ns()
+    args = dict(attrs)
+    if request_trace is not None:
+        args["trace_id"] = request_trace.trace_id
+    tracer.record(name, start_ns, end_ns, args)
@@ -0,0 +1,114 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+import cancellation
+from cancellation import CancelToken
+
+# Requests the server admits at once; more wait in its queue, beyond that they are turned away
+SERVER_MAX_REQUESTS = int(os.getenv("SERVER_MAX_REQUESTS", "16"))
+SERVER_QUEUE_DEPTH = int(os.getenv("SERVER_QUEUE_DEPTH", "32"))
+
+# Calls of each external stage running at once, and calls allowed to wait for one of them
+STAGE_WORKERS = {
+    "omni": int(os.getenv("POOL_OMNI_WORKERS", "4")),
+    "planner": int(os.getenv("POOL_PLANNER_WORKERS", "8")),
+    "selector": int(os.getenv("POOL_SELECTOR_WORKERS", "8")),
+}
+STAGE_QUEUE_DEPTH = int(os.getenv("POOL_QUEUE_DEPTH", "16"))
+
+# How often a waiting call looks at its request's cancel token
+_WAIT_POLL_S = 0.05
+# Weight of the newest call in the mean call duration behind retry_after_s
+_DURATION_SMOOTHING = 0.2
+
+
+class Overloaded(Exception):
+    """Raised instead of waiting when a pool's queue is full."""
+
+    def __init__(self, pool: str, waiting: int, retry_after_s: float):
+        self.pool = pool
+        self.waiting = waiting
+        self.retry_after_s = retry_after_s
+        super().__init__(f"{pool} pool is full ({waiting} waiting), retry in {retry_after_s:.1f}s")
+
+
+def busy_result(e: Overloaded) -> Dict:
+    """The reply to a request turned away by a full pool."""
+    return {
+        "status": "busy",
+        "pool": e.pool,
+        "retry_after_s": e.retry_after_s,
+        "message": f"The assistant is handling too many requests right now; try again in {e.retry_after_s:.0f}s.",
+        "highlighting_boxes": []
+    }
+
+
+class StagePool:
+    """
+    Bounds a stage to `workers` concurrent calls. Callers beyond that wait in line, up
+    to `max_queue` of them; one more raises Overloaded at once, so load shows up as a
+    fast "busy" reply instead of a growing backlog. Waiting callers still honour their
+    request's cancel token and deadline.
+    """
+
+    def __init__(self, name: str, workers: int, max_queue: int):
+        self.name = name
+        self.workers = max(workers, 1)
+        self.max_queue = max(max_queue, 0)
+        self._slots = threading.Semaphore(self.workers)
+        self._lock = threading.Lock()
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.peak_waiting = 0
+        self._mean_call_s = 1.0
+
+    def retry_after_s(self) -> float:
+        """Rough time until a new caller would get a slot: the queue ahead of it drained by all workers."""
+        return round((self.waiting + 1) * self._mean_call_s / self.workers, 1)
+
+    @contextmanager
+    def slot(self, cancel: Optional[CancelToken] = None):
+        with self._lock:
+            if self.running >= self.workers and self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded(self.name, self.waiting, self.retry_after_s())
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+        acquired = False
+        try:
+            while not self._slots.acquire(timeout=_WAIT_POLL_S):
+                cancellation.check(cancel)
+            acquired = True
+        finally:
+            with self._lock:
+                self.waiting -= 1
+                if acquired:
+                    self.running += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self._mean_call_s += _DURATION_SMOOTHING * (elapsed - self._mean_call_s)
+            self._slots.release()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"workers": self.workers, "running": self.running, "waiting": self.waiting,
+                    "max_queue": self.max_queue, "peak_waiting": self.peak_waiting,
+                    "completed": self.completed, "rejected": self.rejected,
+                    "mean_call_ms": round(self._mean_call_s * 1000, 1)}
+
+
+stage_pools = {stage: StagePool(stage, workers, STAGE_QUEUE_DEPTH) for stage, workers in STAGE_WORKERS.items()}
+
+
+def pool_stats() -> Dict[str, Dict]:
+    return {name: pool.stats() for name, pool in stage_pools.items()}
@@ -12,6 +12,16 @@ let win = null;
 let pythonProcess = null;
 let clickthroughEnabled = false;
 
+// Backend IPC protocol: requests are tagged with an id so replies can be matched
+// even when several are in flight; a newer request for the same session supersedes older ones
+const BACKEND_PROTOCOL_VERSION = 2;
+// Let the backend grab the screen in process (no screenshot file) instead of screencapture/nircmd
+const BACKEND_CAPTURE = process.env.BACKEND_CAPTURE === '1';
+const BACKEND_SESSION_ID = 'overlay';
+const pendingRequests = new Map(); // request_id -> { resolve, reject, timeout, onPartial }
+let nextRequestId = 0;
+let backendStatus = null; // last untagged ready/degraded message from the backend
+
 function createWindow() {
   const { screen } = require('electron');
   const primaryDisplay = screen.getPrimaryDisplay();
@@ -140,24 +150,130 @@ function startPythonBackend() {
     stdio: ['pipe', 'pipe', 'pipe']
   });
 
+  // stdout carries one JSON protocol message per line; diagnostics come on stderr
+  let stdoutBuffer = '';
   pythonProcess.stdout.on('data', (data) => {
-    console.log('Python stdout:', data.toString());
+    stdoutBuffer += data.toString();
+    const lines = stdoutBuffer.split('\n');
+    stdoutBuffer = lines.pop();
+    for (const line of lines) {
+      handleBackendLine(line.trim());
+    }
   });
 
   pythonProcess.stderr.on('data', (data) => {
-    console.error('Python stderr:', data.toString());
+    console.log('Python diagnostics:', data.toString());
   });
 
   pythonProcess.on('close', (code) => {
     console.log('Python process exited with code:', code);
+    rejectPendingRequests(new Error(`Python backend exited with code ${code}`));
   });
 
   pythonProcess.on('error', (error) => {
     console.error('Python process error:', error);
+    rejectPendingRequests(new Error('Python process error: ' + error.message));
   });
+
+  // The backend sends its ready/degraded message only to clients that speak version 2
+  pythonProcess.stdin.write(JSON.stringify({ v: 2, action: 'hello' }) + '\n');
+}
+
+function handleBackendLine(line) {
+  if (!line) {
+    return;
+  }
+  if (!(line.startsWith('{') && line.endsWith('}'))) {
+    console.log('Python stdout:', line);
+    return;
+  }
+
+  let message;
+  try {
+    message = JSON.parse(line);
+  } catch (error) {
+    console.error('Failed to parse JSON line:', line);
+    return;
+  }
+
+  // Sent once the backend has loaded and warmed up its clients
+  if (message.request_id === undefined && (message.status === 'ready' || message.status === 'degraded')) {
+    backendStatus = message;
+    console.log(`Python backend ${message.status} after ${message.startup_ms}ms:`, message.services);
+    if (win && !win.isDestroyed()) {
+      win.webContents.send('backend-status', message);
+    }
+    return;
+  }
+
+  // The user clicked the highlighted element of an earlier step (AUTO_VERIFY_CLICKS=1)
+  if (message.status === 'step_verified') {
+    console.log(`Step ${message.step} verified by a click on icon ${message.click && message.click.icon}`);
+    if (win && !win.isDestroyed() && win.isVisible()) {
+      win.webContents.send('mark-step-success');
+    }
+    return;
+  }
+
+  const pending = pendingRequests.get(message.request_id);
+  if (!pending) {
+    console.log('Backend message without a pending request:', message);
+    return;
+  }
+
+  // The backend has grabbed the screen, so the prompt can be shown again
+  if (message.status === 'captured') {
+    pending.captured = true;
+    showPromptAfterScreenshot();
+    return;
+  }
+
+  // Partial results arrive ahead of the final one for the same request
+  if (message.status === 'partial') {
+    if (pending.onPartial) {
+      pending.onPartial(message);
+    }
+    return;
+  }
+
+  clearTimeout(pending.timeout);
+  pendingRequests.delete(message.request_id);
+  if (pending.capture && !pending.captured) {
+    showPromptAfterScreenshot();
+  }
+  pending.resolve(message);
 }
 
-async function processScreenshotWithBackend(screenshotPath, prompt, history) {
+function showPromptAfterScreenshot() {
+  if (win && !win.isDestroyed()) {
+    win.webContents.send('show-prompt-after-screenshot');
+  }
+}
+
+function rejectPendingRequests(error) {
+  for (const [requestId, pending] of pendingRequests) {
+    clearTimeout(pending.timeout);
+    pending.reject(error);
+    pendingRequests.delete(requestId);
+  }
+}
+
+function cancelBackendRequest(requestId) {
+  if (!pythonProcess || pythonProcess.killed) {
+    return;
+  }
+  try {
+    pythonProcess.stdin.write(JSON.stringify({
+      v: BACKEND_PROTOCOL_VERSION,
+      action: 'cancel',
+      request_id: requestId
+    }) + '\n');
+  } catch (error) {
+    console.error('Failed to send cancel to Python backend:', error.message);
+  }
+}
+
+async function processScreenshotWithBackend(screenshotPath, prompt, history, onPartial) {
   return new Promise((resolve, reject) => {
     if (!pythonProcess) {
       reject(new Error('Python backend not running'));
@@ -170,9 +286,27 @@ async function processScreenshotWithBackend(screenshotPath, prompt, history) {
       return;
     }
 
+    const requestId = `req-${Date.now()}-${++nextRequestId}`;
+
+    // Set up timeout; the backend is told to stop working on the request
+    const timeout = setTimeout(() => {
+      console.error('Backend processing timeout');
+      pendingRequests.delete(requestId);
+      cancelBackendRequest(requestId);
+      reject(new Error('Backend processing timeout'));
+    }, 90000); // 90 second timeout
+
+    // Without a screenshot file the backend captures the screen itself
+    const capture = !screenshotPath;
+    pendingRequests.set(requestId, { resolve, reject, timeout, onPartial, capture, captured: false });
+
     // Send data to Python backend
     const data = JSON.stringify({
+      v: BACKEND_PROTOCOL_VERSION,
+      request_id: requestId,
+      session_id: BACKEND_SESSION_ID,
       screenshot_path: screenshotPath,
+      capture: capture,
       prompt: prompt,
       history: history, // Pass history to the backend
       action: 'process_screenshot'
@@ -181,47 +315,10 @@ async function processScreenshotWithBackend(screenshotPath, prompt, history) {
     try {
       pythonProcess.stdin.write(data + '\n');
     } catch (error) {
+      clearTimeout(timeout);
+      pendingRequests.delete(requestId);
       reject(new Error('Failed to send data to Python backend: ' + error.message));
-      return;
     }
-
-    // Set up timeout
-    const timeout = setTimeout(() => {
-      console.error('Backend processing timeout');
-      reject(new Error('Backend processing timeout'));
-    }, 90000); // 90 second timeout
-
-    // Listen for response
-    let responseBuffer = '';
-    const responseHandler = (data) => {
-      responseBuffer += data.toString();
-      
-      // Try to find complete JSON in the buffer
-      const lines = responseBuffer.split('\n');
-      for (let i = lines.length - 1; i >= 0; i--) {
-        const line = lines[i].trim();
-        if (line.startsWith('{') && line.endsWith('}')) {
-          try {
-            const response = JSON.parse(line);
-            clearTimeout(timeout);
-            pythonProcess.stdout.removeListener('data', responseHandler);
-            resolve(response);
-            return;
-          } catch (error) {
-            console.error('Failed to parse JSON line:', line);
-          }
-        }
-      }
-    };
-
-    pythonProcess.stdout.on('data', responseHandler);
-    
-    // Handle Python process errors
-    pythonProcess.on('error', (error) => {
-      clearTimeout(timeout);
-      pythonProcess.stdout.removeListener('data', responseHandler);
-      reject(new Error('Python process error: ' + error.message));
-    });
   });
 }
 
@@ -369,6 +466,11 @@ app.whenReady().then(() => {
       // Wait for prompt to hide
       await new Promise(resolve => setTimeout(resolve, 300));
       
+      // The backend captures when it gets the request, and says when the prompt can come back
+      if (BACKEND_CAPTURE) {
+        return null;
+      }
+      
       // Take screenshot
       if (isMac) {
         execSync(`screencapture -x "${tempPath}"`);
@@ -406,7 +508,16 @@ app.whenReady().then(() => {
       // Send processing status to frontend
       win.webContents.send('processing-status', 'Thinking...');
       
-      const result = await processScreenshotWithBackend(screenshotPath, prompt, history);
+      const result = await processScreenshotWithBackend(screenshotPath, prompt, history, (partial) => {
+        // Show the planned step while element selection is still running
+        win.webContents.send('backend-partial', partial);
+      });
+      
+      // A newer screenshot superseded this one; its own result will be shown instead
+      if (result.status === 'cancelled') {
+        console.log('Backend request superseded or cancelled:', result.message);
+        return result;
+      }
       
       // Send result back to frontend
       win.webContents.send('backend-result', result);
@@ -419,6 +530,9 @@ app.whenReady().then(() => {
     }
   });
 
+  // The readiness message may arrive before the renderer listens for it; it asks once loaded
+  ipcMain.handle('get-backend-status', () => backendStatus);
+
   // IPC handler for clearing highlighting boxes
   ipcMain.handle('clear-highlighting', async () => {
     win.webContents.send('clear-highlighting');
@@ -239,6 +239,11 @@ class BubbleApp {
             this.handleBackendResult(data);
         });
 
+        // Listen for partial backend results (planned step before element selection finishes)
+        ipcRenderer.on('backend-partial', (event, data) => {
+            this.handleBackendPartial(data);
+        });
+
         // Listen for screenshot completion
         ipcRenderer.on('screenshot-complete', (event, data) => {
             this.handleScreenshotComplete(data);
@@ -249,6 +254,16 @@ class BubbleApp {
             this.showStatusMessage(error, 'error');
         });
 
+        // Listen for backend readiness (sent once after startup), and ask for it in case
+        // it was sent before this window was listening
+        const handleBackendStatus = (status) => {
+            if (status && status.status === 'degraded') {
+                this.showStatusMessage(status.message, 'error');
+            }
+        };
+        ipcRenderer.on('backend-status', (event, status) => handleBackendStatus(status));
+        ipcRenderer.invoke('get-backend-status').then(handleBackendStatus);
+
         // Listen for processing status
         ipcRenderer.on('processing-status', (event, status) => {
             this.updateProcessingStatus(status);
@@ -613,6 +628,13 @@ class BubbleApp {
             return;
         }
 
+        // The backend gave up on this step (error, deadline exceeded or Omni server down)
+        if (data.status === 'error' || data.status === 'timeout' || data.status === 'unavailable') {
+            console.log(`Backend could not process the step (${data.status}):`, data.message);
+            this.showStatusMessage(data.message || 'Failed to process request', 'error');
+            return;
+        }
+
         // Check for both possible property names
         const boxes = data.highlighting_boxes || data.highlightingBoxes;
         
@@ -670,6 +692,15 @@ class BubbleApp {
         }
     }
     
+    handleBackendPartial(data) {
+        console.log(`[TIMING] Partial backend result received at: ${new Date().toISOString()}`, data);
+        if (!data.task || !data.task.action) {
+            return;
+        }
+        const stepLabel = data.task.step ? `Step ${data.task.step}: ` : '';
+        this.updateProcessingStatus(`${stepLabel}${data.task.action}`);
+    }
+    
     async animateBorderToBoxes(boxes, stepInfo = null) {
         console.log('Animating border to bounding boxes');
         